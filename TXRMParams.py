@@ -1,215 +1,793 @@
-# -*- coding: utf-8 -*-
-"""
-Created on Mon Feb  9 15:51:08 2026
-
-@author: may130 - Heavily modified from Yakov's code'
-"""
-#This file contain tools for extracting metadata from a TXRM file which is an OLE format file of tomography scan data produced by Xradia Tomography instruments
-
-#The five functions below are helper functions for extracting data from ole streams in various formats
-
-def GetFloatAttr(ole, string: str):
-    if ole.exists(string):    
-        objtype = ole.get_type(string)
-        if objtype is olefile.STGTY_STREAM:
-            stream = ole.openstream(string)
-            data = stream.read()
-            return np.frombuffer(data, dtype=np.float32)
-    else:
-        return np.array([])
-
-def GetIntAttr(ole, string: str):
-    if ole.exists(string):    
-        objtype = ole.get_type(string)
-        if objtype is olefile.STGTY_STREAM:
-            stream = ole.openstream(string)
-            data = stream.read()
-            return np.frombuffer(data, dtype=np.int32)
-    else:
-        return np.array([])
-
-def GetFloatImage(ole, string: str, shape):
-    if ole.exists(string):    
-        objtype = ole.get_type(string)
-        if objtype is olefile.STGTY_STREAM:
-            stream = ole.openstream(string)
-            return np.ndarray(shape, dtype = np.float32, buffer = stream.read(), order = 'C')
-    else:
-        return np.array([])
-
-def GetText(ole, string: str):
-    if ole.exists(string):
-        objtype = ole.get_type(string)
-        if objtype is olefile.STGTY_STREAM:
-            stream = ole.openstream(string)
-            data = stream.read()
-            return (data.split(b"\0", 1)[0])
-    else:
-        return np.array([])
-
-def GetDate(ole, string: str):
-    if ole.exists(string):
-        objtype = ole.get_type(string)
-        if objtype is olefile.STGTY_STREAM:
-            stream = ole.openstream(string)
-            data = stream.read()
-            foo = data.split(b"\0")
-            bar = [i for i in foo if len(i)>2]
-            return ((bar[0]).split(b".")[0],bar[-1].split(b".")[0])
-    else:
-        return np.array([])
-
-def SampleParams(strFile: str, Sampleno: str, Altime: int = 15, Proctime: int = 15):
-    #This function extracts the desired subset of the metadata from a TXRM file using the olefile tools and 
-    #returns them in a formatted form as "output" them along with a summary of the output "feedback" for
-    #sending to console or a GUI
-    
-    if strFile == "":
-        print("Missing filename! Terminating...")
-        return None
-        
-    outstring = ""
-    data = ""
-    feedback = ""
-    
-    from pathlib import Path
-    my_file = Path(strFile)
-
-    if not my_file.is_file():
-        feedback+=("File does not exist! Terminating...")
-        return None,feedback
-
-    if (str(Path(strFile).suffix) != ".txrm"):
-        feedback+=("File not a .txrm file! Terminating...")
-        return None,feedback
-
-
-    if olefile.isOleFile(strFile):
-        with olefile.OleFileIO(strFile, write_mode=True) as ole:
-            #feedback+=("Opening file...")
-            
-            # Extract required parameters
-            Voltage = GetFloatAttr(ole, 'ImageInfo/Voltage')
-            if len(Voltage) == 0:
-                print('Could not find voltage. Terminating...')
-                return None,feedback
-            feedback+=(f'\nVoltage: {Voltage[0]} kV')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Voltage,"+f"{Voltage[0]:.0f}\n")
-
-            Power = GetFloatAttr(ole, 'AcquisitionSettings/SrcPower')
-            if len(Power) == 0:
-                feedback+=('Could not find Power. Terminating...')
-                return None,feedback
-            feedback+=(f'\nPower: {Power[0]} W')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Power,"+f"{Power[0]:.0f}\n")
-
-            Filter = GetText(ole, 'AcquisitionSettings/SourceFilterName')
-            if len(Filter) == 0:
-                feedback+=('Could not find Filter. Terminating...')
-                return None,feedback
-            feedback+=("\nFilter: "+Filter.decode('ascii'))
-            data = Filter.decode('ascii')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Source Filter,"+data+"\n")
-
-            FramesPerImage = GetIntAttr(ole, 'AcquisitionSettings/FramesPerImage')
-            if len(FramesPerImage) == 0:
-                feedback+=('Could not find FramesPerImage. Terminating...')
-                return None,feedback
-            feedback+=(f'\nFrames per Image: {FramesPerImage[0]:.0f}')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Frames per image,"+f"{FramesPerImage[0]:.0f}\n")
-            
-            
-            ExpTime = GetFloatAttr(ole, 'AcquisitionSettings/ExpTime')
-            if len(ExpTime) == 0:
-                feedback+=('Could not find ExpTime. Terminating...')
-                return None,feedback
-            feedback+=(f'\nExp Time: {ExpTime[0]:.1f} mm')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Exposure time,"+f"{ExpTime[0]:.1f}\n")
-            
-            ObjName = GetText(ole, 'ImageInfo/ObjectiveName')
-            if len(ObjName) == 0:
-                feedback+=('Could not find ObjName. Terminating...')
-                return None,feedback
-            feedback+=("\nDetector:"+ObjName.decode('ascii'))
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Objective,"+ObjName.decode('ascii')+"\n")
-
-            Binning = GetIntAttr(ole, 'AcquisitionSettings/Binning')
-            if len(Binning) == 0:
-                feedback+=('Could not find Binning. Terminating...')
-                return None,feedback
-            feedback+=(f'\nBinning: {Binning[0]:.0f}')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Binning,"+f"{Binning[0]:.0f}\n")
-            
-            NumStitch = GetIntAttr(ole, 'AcquisitionSettings/StitchParams/AutoStitchSettings/NumSegments')
-            if len(NumStitch) == 0:
-                feedback+=('\nCould not find NumStitch - stitch = 1.')
-                outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Number of stitches,1\n")
-
-            else:
-                feedback+=(f'\nNumStitch: {NumStitch[0]}')
-                outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Number of stitches,"+f"{NumStitch[0]:.0f}\n")
-            
-            NumImages = GetIntAttr(ole, 'ImageInfo/NoOfImages')
-            if len(NumImages) == 0:
-                feedback+=('Could not find Num Images. Terminating...')
-                return None,feedback
-            feedback+=(f'\nNum Images: {NumImages[0]}')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Projections,"+f"{NumImages[0]:.0f}\n")
-            
-            PixSize = GetFloatAttr(ole, 'ImageInfo/PixelSize')
-            if len(PixSize) == 0:
-                feedback+=('Could not find PixelSize. Terminating...')
-                return None,feedback
-            feedback+=(f'\nPix Size: {PixSize[0]:.2f} um')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Pixel Size,"+f"{PixSize[0]:.2f}\n")
-
-            DateTime = GetDate(ole, 'ImageInfo/Date')
-            if len(DateTime) == 0:
-                feedback+=('Could not find DateTime. Terminating...')
-                return None,feedback
-            feedback+=("\nStart, end time:"+DateTime[0].decode('ascii')+DateTime[1].decode('ascii'))
-            format_string = "%m/%d/%Y %H:%M:%S"
-            t1= datetime.strptime(DateTime[0].decode('ascii'), format_string)
-            t2 = datetime.strptime(DateTime[1].decode('ascii'), format_string)
-            seconds_diff = t2.timestamp() - t1.timestamp()
-            outstring+=("0,"+Sampleno+f",Global,Scanning Parameters,Scan Time,{(seconds_diff/3600):.2f}\n")
-
-            outstring+=("0,"+Sampleno+f",Global,Scanning Parameters,Alignment time,{Altime:.0f}\n")
-
-            BHparam = GetFloatAttr(ole, 'ReconSettings/BeamHardening')
-            if len(BHparam) == 0:
-                feedback+=('Could not find BHparam. Terminating...')
-                return None,feedback
-            feedback+=(f'\nBH param: {BHparam[0]:.2f} um')
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,Beam Hardening,"+f"{BHparam[0]:.2f}\n")
-
-            VLTmode = GetText(ole, 'ReconSettings/BeamHardeningFileName')
-            if len(VLTmode) == 0:
-                feedback+=('\nCould not find VLTmode. Terminating...')
-                return None,feedback
-            temp = VLTmode.decode('ascii')
-            feedback+=("\nVLTmode:"+temp)
-            vltyes = "FALSE"
-            if (temp == "BH Correction for Very Low Transmission"):
-                vltyes="TRUE"
-            outstring+=("0,"+Sampleno+",Global,Scanning Parameters,VLT Correction,"+vltyes+"\n")
-
-            outstring+=("0,"+Sampleno+f",Global,Scanning Parameters,Processing Time,{Proctime:.0f}\n")
-
-            
-        #print(outstring)
-        
-    else:
-        feedback+=("Unsupported file format. Terminating...")
-    return outstring,feedback
-
-def MakeTable(strFile: str, SampleNos, Altime: int = 15, Proctime: int = 15):
-    #This function creates a formatted list of (the same) metadata for multiple samples suitable for importing into our LIMS
-    
-    outtable = ",Sample ID,Phase,Analysis,Component Name,Value\n"
-    params, feedback = SampleParams(strFile,"0000", Altime, Proctime)
-    if params == None:
-        return None, feedback
-    for i in SampleNos:
-        outtable+=params.replace("0000",str(i))        
-    return outtable,feedback
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Feb  9 15:51:08 2026
+
+@author: may130 - Heavily modified from Yakov's code'
+"""
+#This file contain tools for extracting metadata from a TXRM file which is an OLE format file of tomography scan data produced by Xradia Tomography instruments
+
+import struct
+from datetime import datetime
+from time import perf_counter
+from collections import namedtuple
+
+import txrm_ole
+
+#NumPy, olefile and the cache (sqlite3) are imported inside the functions that use them, so extracting the
+#parameters with the header-only reader (see txrm_cli.py) starts without paying for them
+
+#The five functions below are helper functions for extracting data from ole streams in various formats
+
+def GetFloatAttr(ole, string: str):
+    import numpy as np
+    if ole.exists(string):    
+        objtype = ole.get_type(string)
+        if objtype is txrm_ole.STGTY_STREAM:
+            stream = ole.openstream(string)
+            data = stream.read()
+            return np.frombuffer(data, dtype=np.float32)
+    else:
+        return np.array([])
+
+def GetIntAttr(ole, string: str):
+    import numpy as np
+    if ole.exists(string):    
+        objtype = ole.get_type(string)
+        if objtype is txrm_ole.STGTY_STREAM:
+            stream = ole.openstream(string)
+            data = stream.read()
+            return np.frombuffer(data, dtype=np.int32)
+    else:
+        return np.array([])
+
+def GetFloatImage(ole, string: str, shape, dtype = "float32", rows = None):
+    #Reads the stream straight into the returned array rather than through an intermediate bytes object
+    #(see txrm_projections for memory-mapped access to the projection streams). rows (a slice) reads only
+    #those rows of a (height, width) image: a contiguous band is one partial stream read, a stepped slice
+    #one per row, and the header-only reader then reads just the sectors holding them
+    import numpy as np
+    if ole.exists(string):    
+        objtype = ole.get_type(string)
+        if objtype is txrm_ole.STGTY_STREAM:
+            stream = ole.openstream(string)
+            if rows is None:
+                image = np.empty(shape, dtype = dtype, order = 'C')
+                _ReadExactly(stream, image, string)
+                return image
+            selected = range(shape[0])[rows]
+            image = np.empty((len(selected), shape[1]), dtype = dtype, order = 'C')
+            rowbytes = image.strides[0]
+            if not selected:
+                return image
+            if selected.step == 1 or len(selected) < 2:
+                stream.seek(selected.start * rowbytes)
+                _ReadExactly(stream, image, string)
+            elif 0 < (selected.step - 1) * rowbytes < 4096:
+                #Rows closer together than a page: one read of the band, then every step-th row
+                band = np.empty((selected[-1] - selected.start + 1, shape[1]), dtype = dtype)
+                stream.seek(selected.start * rowbytes)
+                _ReadExactly(stream, band, string)
+                image[:] = band[::selected.step]
+            else:
+                for k, row in enumerate(selected):
+                    stream.seek(row * rowbytes)
+                    _ReadExactly(stream, image[k], string)
+            return image
+    else:
+        return np.array([])
+
+def _ReadExactly(stream, buffer, string: str):
+    #readinto that fills the whole buffer: both readers return a short count at the end of a stream, which
+    #would otherwise leave part of an np.empty array uninitialised
+    n = stream.readinto(buffer)
+    if n != buffer.nbytes:
+        raise txrm_ole.OleFormatError(f"{string} is too short: read {n or 0} of {buffer.nbytes} bytes")
+
+def GetText(ole, string: str):
+    import numpy as np
+    if ole.exists(string):
+        objtype = ole.get_type(string)
+        if objtype is txrm_ole.STGTY_STREAM:
+            stream = ole.openstream(string)
+            data = stream.read()
+            end = data.find(b"\0")
+            return data if end < 0 else data[:end]
+    else:
+        return np.array([])
+
+def GetDate(ole, string: str):
+    import numpy as np
+    if ole.exists(string):
+        objtype = ole.get_type(string)
+        if objtype is txrm_ole.STGTY_STREAM:
+            stream = ole.openstream(string)
+            data = stream.read()
+            (s1, e1), (s2, e2) = _DateEdges(data)
+            return (data[s1:e1], data[s2:e2])
+    else:
+        return np.array([])
+
+def OpenOle(strFile: str, ReadOnly: bool = False, Storage=None):
+    #Open a TXRM file for extraction. ReadOnly uses the header-only reader in txrm_ole, which opens the
+    #file read-only and only reads the sectors needed for the streams that are looked up. Storage (a
+    #txrm_storage.Storage) reads the file through a block-cached backend and implies ReadOnly
+    if Storage is not None:
+        fp = Storage.open(strFile)
+        if fp.size < txrm_ole.MINIMAL_SIZE:
+            #the same size test as IsOleFile, which is skipped for Storage to save a round-trip
+            fp.close()
+            raise txrm_ole.NotOleFileError(f"{strFile} is too small to be an OLE compound file")
+        return txrm_ole.LazyOleFile(strFile, fp, close_fp=True)
+    if ReadOnly:
+        return txrm_ole.LazyOleFile(strFile)
+    import olefile
+    return olefile.OleFileIO(strFile, write_mode=True)
+
+#The parameter schema: one ParamField per LIMS row, in output order. path is the OLE stream holding the
+#value (None for values supplied by the caller, i.e. Altime and Proctime), dtype says how the stream is
+#decoded, formatter is a format string or a callable(value, params) and component is the LIMS component
+#name. label is the name used in the feedback (the wording of the original extraction code; name if None).
+#Optional fields that are missing take their default; missing required fields stop the extraction.
+#Sites can add fields with LoadFields or the TXRM_PARAMS_FIELDS environment variable.
+
+#(collections.namedtuple rather than typing.NamedTuple: importing typing alone costs as much as the parse)
+ParamField = namedtuple("ParamField", ["name", "path", "dtype", "unit", "required", "formatter", "component", "default",
+                                       "label"],
+                        defaults=[None, "float32", "", True, "{:.0f}", None, None, None])
+
+def _ParseDate(text):
+    #"MM/DD/YYYY HH:MM:SS" by position, which is far cheaper than strptime; anything else goes to strptime
+    if (len(text) == 19 and text[2] == "/" and text[5] == "/" and text[10] == " " and text[13] == ":"
+            and text[16] == ":" and (text[0:2] + text[3:5] + text[6:10] + text[11:13] + text[14:16] + text[17:19]).isdigit()):
+        try:
+            return datetime(int(text[6:10]), int(text[0:2]), int(text[3:5]), int(text[11:13]), int(text[14:16]),
+                            int(text[17:19]))
+        except ValueError:
+            pass
+    return datetime.strptime(text, "%m/%d/%Y %H:%M:%S")
+
+def _ScanHours(value, params):
+    t1 = _ParseDate(value[0])
+    t2 = _ParseDate(value[1])
+    seconds_diff = t2.timestamp() - t1.timestamp()
+    return f"{(seconds_diff/3600):.2f}"
+
+def _VLTCorrection(value, params):
+    if (value == "BH Correction for Very Low Transmission"):
+        return "TRUE"
+    return "FALSE"
+
+PARAM_FIELDS = [
+    ParamField("Voltage", "ImageInfo/Voltage", "float32", "kV", component="Voltage"),
+    ParamField("SrcPower", "AcquisitionSettings/SrcPower", "float32", "W", component="Power", label="Power"),
+    ParamField("SourceFilter", "AcquisitionSettings/SourceFilterName", "text", formatter="{}", component="Source Filter",
+               label="Filter"),
+    ParamField("FramesPerImage", "AcquisitionSettings/FramesPerImage", "int32", component="Frames per image",
+               label="Frames per Image"),
+    ParamField("ExpTime", "AcquisitionSettings/ExpTime", "float32", "s", formatter="{:.1f}", component="Exposure time",
+               label="Exp Time"),
+    ParamField("Objective", "ImageInfo/ObjectiveName", "text", formatter="{}", component="Objective", label="Detector"),
+    ParamField("Binning", "AcquisitionSettings/Binning", "int32", component="Binning"),
+    ParamField("NumSegments", "AcquisitionSettings/StitchParams/AutoStitchSettings/NumSegments", "int32",
+               required=False, component="Number of stitches", default=1, label="NumStitch"),
+    ParamField("NoOfImages", "ImageInfo/NoOfImages", "int32", component="Projections", label="Num Images"),
+    ParamField("PixelSize", "ImageInfo/PixelSize", "float32", "um", formatter="{:.2f}", component="Pixel Size",
+               label="Pix Size"),
+    ParamField("Date", "ImageInfo/Date", "date", formatter=_ScanHours, component="Scan Time", label="Start, end time"),
+    ParamField("Altime", None, "arg", component="Alignment time"),
+    ParamField("BeamHardening", "ReconSettings/BeamHardening", "float32", formatter="{:.2f}", component="Beam Hardening",
+               label="BH param"),
+    ParamField("BeamHardeningFileName", "ReconSettings/BeamHardeningFileName", "text", formatter=_VLTCorrection,
+               component="VLT Correction", label="VLTmode"),
+    ParamField("Proctime", None, "arg", component="Processing Time"),
+]
+
+def LoadFields(strFile: str):
+    #Reads extra fields from a JSON file holding a list of objects with the ParamField keys, e.g.
+    #{"name": "XrayMagnification", "path": "ImageInfo/XrayMagnification", "dtype": "float32",
+    # "required": false, "formatter": "{:.2f}", "component": "Magnification"}
+    import json
+    with open(strFile) as f:
+        return [ParamField(**spec) for spec in json.load(f)]
+
+def DefaultFields():
+    #PARAM_FIELDS followed by any site fields named in the TXRM_PARAMS_FIELDS environment variable
+    import os
+    extra = os.environ.get("TXRM_PARAMS_FIELDS")
+    if not extra:
+        return PARAM_FIELDS
+    return PARAM_FIELDS + LoadFields(extra)
+
+def ReadStreams(ole, paths, Stats=None):
+    #Reads several streams in one pass and returns {path: bytes or None}. The header-only reader
+    #resolves every path first and reads all their sectors in offset order; with olefile each stream
+    #costs a single openstream instead of the exists/get_type/openstream round-trip.
+    #Stats (a txrm_stats.ExtractionStats) times the directory lookups separately from the reads
+    if Stats is not None:
+        start = perf_counter()
+        lookup = ole.find if hasattr(ole, 'find') else ole.exists
+        for path in paths:
+            lookup(path)
+        Stats.add("lookup", perf_counter() - start)
+        start = perf_counter()
+        data = ReadStreams(ole, paths)
+        Stats.add("read", perf_counter() - start)
+        found = [stream for stream in data.values() if stream is not None]
+        Stats.count(len(found), sum(len(stream) for stream in found))
+        return data
+    if hasattr(ole, 'read_streams'):
+        return ole.read_streams(paths)
+    data = {}
+    for path in paths:
+        try:
+            data[path] = ole.openstream(path).read()
+        except OSError:
+            data[path] = None
+    return data
+
+#struct codes for the numeric dtypes, so scalar fields decode to plain Python numbers without NumPy
+_STRUCT_CODES = {"float32": "<f", "float64": "<d", "int8": "<b", "uint8": "<B", "int16": "<h", "uint16": "<H",
+                 "int32": "<i", "uint32": "<I", "int64": "<q", "uint64": "<Q"}
+
+def DecodeStream(data: bytes, dtype: str):
+    #Decodes the first value of a stream, returning None for an empty or missing stream
+    if not data:
+        return None
+    if dtype == "text":
+        #Decoded straight from a view of the stream up to the first NUL
+        end = data.find(b"\0")
+        if end == 0:
+            return None
+        return str(memoryview(data)[:end if end > 0 else len(data)], 'ascii', 'replace')
+    if dtype == "date":
+        edges = _DateEdges(data)
+        if edges is None:
+            return None
+        view = memoryview(data)
+        return tuple(str(view[start:end], 'ascii') for start, end in edges)
+    code = _STRUCT_CODES.get(dtype)
+    if code is not None:
+        if len(data) < struct.calcsize(code):
+            return None
+        return struct.unpack_from(code, data)[0]
+    import numpy as np
+    values = np.frombuffer(data, dtype=dtype, count=len(data)//np.dtype(dtype).itemsize)
+    return values[0] if len(values) else None
+
+def _Float32(value: float):
+    #The float with the fewest digits that is the same float32 as value (0.7 rather than 0.699999988079071,
+    #which is what a float32 stream widened to a Python float holds)
+    for digits in range(1, 10):
+        shown = float(f"{value:.{digits}g}")
+        if struct.unpack("<f", struct.pack("<f", shown))[0] == value:
+            return shown
+    return value
+
+def ShowValue(value, dtype: str = None):
+    #Text of a decoded value for the feedback; float32 values are shown with the fewest digits that
+    #identify them
+    if isinstance(value, tuple):
+        return " to ".join(value)
+    if dtype == "float32" and isinstance(value, float):
+        return repr(_Float32(value))
+    return str(value)
+
+def _DateEdges(data: bytes):
+    #(start, end) offsets of the first and last date records of an ImageInfo/Date stream without the
+    #fractional seconds, or None if there are none. Records are NUL separated; fragments of two bytes or less
+    #are skipped. Only the ends of the stream are scanned, so the cost does not grow with the image count
+    size = len(data)
+    first = None
+    pos = 0
+    while pos < size:
+        end = data.find(b"\0", pos)
+        if end < 0:
+            end = size
+        if end - pos > 2:
+            first = (pos, end)
+            break
+        pos = end + 1
+    if first is None:
+        return None
+    end = size
+    while True:
+        start = data.rfind(b"\0", 0, end) + 1
+        if end - start > 2:
+            last = (start, end)
+            break
+        end = start - 1
+    edges = []
+    for start, end in (first, last):
+        dot = data.find(b".", start, end)
+        edges.append((start, dot if dot >= 0 else end))
+    return edges
+
+def _DateWidth(data: bytes):
+    #Record width of a fixed-width date stream: the offset of the second record, or the length of the
+    #stream if it holds one record. None if the stream does not start with a record
+    if len(data) < 19 or data[2:3] != b"/":
+        return None
+    end = data.find(b"\0")
+    if end < 0:
+        return len(data)
+    while end < len(data) and data[end] == 0:
+        end += 1
+    return end
+
+def DecodeDates(data: bytes):
+    #Decodes an ImageInfo/Date stream ("MM/DD/YYYY HH:MM:SS.ff" records padded with NULs to a fixed width)
+    #into a NumPy datetime64[ms] array with one entry per image. The records are parsed in bulk from a
+    #(records, width) byte view of the stream; streams without that layout, or with a field out of range, are
+    #parsed record by record (which raises ValueError for invalid dates)
+    import numpy as np
+    width = _DateWidth(data)
+    if width is not None and width >= 19:
+        dates = _DecodeFixedDates(np, data, width)
+        if dates is not None:
+            return dates
+    records = [i.decode('ascii') for i in data.split(b"\0") if len(i)>2]
+    iso = [f"{r[6:10]}-{r[0:2]}-{r[3:5]}T{r[11:]}" for r in records]
+    return np.array(iso, dtype='datetime64[ms]')
+
+#Column pairs of month, day, century, year, hour, minute and second in a "MM/DD/YYYY HH:MM:SS" record
+_DATE_DIGITS = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+_DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+def _DecodeFixedDates(np, data: bytes, width: int):
+    #Bulk path of DecodeDates; returns None if any record does not fit the fixed layout
+    if len(data) % width:
+        data = bytes(data) + b"\0" * (width - len(data) % width)
+    records = np.frombuffer(data, dtype=np.uint8).reshape(-1, width)
+    used = records[:, 0] != 0
+    if not used.all():
+        records = records[used]
+    if ((records[:, 2] != ord("/")) | (records[:, 5] != ord("/")) | (records[:, 10] != ord(" "))
+            | (records[:, 13] != ord(":")) | (records[:, 16] != ord(":"))).any():
+        return None
+    digits = records[:, _DATE_DIGITS] - np.uint8(ord("0"))
+    if (digits > 9).any():
+        return None
+    # One contiguous int32 row per field keeps the arithmetic below on dense vectors
+    digits = digits.T.astype(np.int32)
+    month, day, century, year, hour, minute, second = digits[0::2] * 10 + digits[1::2]
+    year += century * 100
+    if ((month < 1) | (month > 12)).any() or (hour > 23).any() or (minute > 59).any() or (second > 59).any():
+        return None
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    if ((day < 1) | (day > np.array(_DAYS_IN_MONTH)[month - 1] + (leap & (month == 2)))).any():
+        return None
+    # Fractional seconds: up to three digits after the '.', then NUL padding
+    millis = 0
+    if width > 19:
+        dot = records[:, 19] == ord(".")
+        tail = records[:, 20:23]
+        isdigit = (tail >= ord("0")) & (tail <= ord("9"))
+        nul = tail == 0
+        if (~dot & (records[:, 19] != 0)).any() or (~dot[:, None] & ~nul).any() or not (isdigit | nul).all() \
+                or (nul[:, :-1] & isdigit[:, 1:]).any() or records[:, 23:].any():
+            return None
+        if isdigit.any():
+            millis = np.zeros(len(records), dtype=np.int32)
+            for k, scale in enumerate((100, 10, 1)[:tail.shape[1]]):
+                millis += np.where(isdigit[:, k], tail[:, k].astype(np.int32) - ord("0"), 0) * scale
+    # Days since 1970-01-01 from the civil date (proleptic Gregorian, as datetime64 uses)
+    y = year - (month <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+    seconds = (hour * 60 + minute) * 60 + second
+    return (days.astype(np.int64) * 86400000 + seconds * 1000 + millis).view('datetime64[ms]')
+
+def ReadParams(ole, Fields=None, Stats=None):
+    #Extracts the fields of the parameter schema from an open TXRM file. Returns a dictionary of the typed
+    #values along with a summary "feedback", or None and the feedback if a required stream is missing
+    if Fields is None:
+        Fields = DefaultFields()
+    values = {}
+    feedback = ""
+    streams = ReadStreams(ole, [field.path for field in Fields if field.path], Stats)
+    for field in Fields:
+        if field.path is None:
+            continue
+        if Stats is None:
+            value = DecodeStream(streams[field.path], field.dtype)
+        else:
+            start = perf_counter()
+            value = DecodeStream(streams[field.path], field.dtype)
+            Stats.add("dates" if field.dtype == "date" else "decode", perf_counter() - start)
+        label = field.label or field.name
+        if value is None:
+            if field.required:
+                feedback+=(f'\nCould not find {label}. Terminating...')
+                return None,feedback
+            feedback+=(f'\nCould not find {label} - using {field.default}.')
+            value = field.default
+        else:
+            feedback+=(f'\n{label}: {ShowValue(value, field.dtype)} {field.unit}'.rstrip())
+        values[field.name] = value
+    return values,feedback
+
+def FormatValue(field: ParamField, value, params):
+    if callable(field.formatter):
+        return field.formatter(value, params)
+    return field.formatter.format(value)
+
+def FormatParams(values, Sampleno: str, Altime: int = 15, Proctime: int = 15, Fields=None):
+    #Formats the values returned by ReadParams as LIMS rows for one sample number
+    return ScanParams("", values, Fields=Fields).ToLIMS([Sampleno], Altime, Proctime)
+
+def MeasureFieldOverhead(strFile: str, Fields=None, Repeat: int = 20, ReadOnly: bool = True):
+    #Measures the cost of each schema field: the best of Repeat runs that open the file, extract and format
+    #just that field, minus the time to open and close the file. Returns {name: seconds}, plus "open" and
+    #"total" (all fields extracted together)
+    if Fields is None:
+        Fields = DefaultFields()
+
+    def timed(fields):
+        best = None
+        for _ in range(Repeat):
+            start = perf_counter()
+            with OpenOle(strFile, ReadOnly) as ole:
+                if fields:
+                    values, feedback = ReadParams(ole, fields)
+                    if values is not None:
+                        FormatParams(values, "0", Fields=fields)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    base = timed([])
+    overhead = {"open": base}
+    for field in Fields:
+        if field.path is not None:
+            overhead[field.name] = timed([field]) - base
+    overhead["total"] = timed(Fields) - base
+    return overhead
+
+#Per-projection streams: one value per image
+PROJECTION_STREAMS = {
+    'Angles': 'ImageInfo/Angles',
+    'ExpTimes': 'ImageInfo/ExpTimes',
+    'XPosition': 'ImageInfo/XPosition',
+    'YPosition': 'ImageInfo/YPosition',
+    'ZPosition': 'ImageInfo/ZPosition',
+}
+
+def ReadProjectionArrays(ole):
+    #Reads the per-projection streams of an open TXRM file as float32 arrays (empty if missing), plus
+    #'Dates' as a datetime64[ms] array and 'NoOfImages'
+    import numpy as np
+    paths = list(PROJECTION_STREAMS.values()) + ['ImageInfo/Date', 'ImageInfo/NoOfImages']
+    streams = ReadStreams(ole, paths)
+    arrays = {name: np.frombuffer(streams[path] or b"", dtype=np.float32) for name, path in PROJECTION_STREAMS.items()}
+    arrays['Dates'] = DecodeDates(streams['ImageInfo/Date'] or b"")
+    count = DecodeStream(streams['ImageInfo/NoOfImages'], 'int32')
+    arrays['NoOfImages'] = len(arrays['Dates']) if count is None else int(count)
+    return arrays
+
+def ScanHealth(arrays):
+    #Vectorized scan-health summary of the arrays from ReadProjectionArrays:
+    # angular coverage and step, dropped (gaps of more than 1.5 median steps) and repeated (steps under a
+    # tenth of the median) frames, exposure mean/spread and drift (least-squares slope over the scan),
+    # per-projection dwell time from consecutive timestamps, stage travel, and the scan time taken as the
+    # first-to-last timestamp span plus one median dwell for the final projection
+    import numpy as np
+    health = {'projections': arrays['NoOfImages']}
+
+    angles = arrays['Angles'].astype(np.float64)
+    if len(angles) > 1:
+        angles = np.rad2deg(np.unwrap(np.deg2rad(angles)))
+        steps = np.diff(angles)
+        median_step = float(np.median(np.abs(steps)))
+        health['angle_start'] = float(angles[0])
+        health['angle_end'] = float(angles[-1])
+        health['angular_range'] = float(angles.max() - angles.min())
+        health['angular_coverage'] = health['angular_range'] + median_step
+        health['angle_step'] = median_step
+        if median_step > 0:
+            ratio = np.abs(steps) / median_step
+            gaps = ratio > 1.5
+            health['dropped_frames'] = int(np.round(ratio[gaps]).sum() - gaps.sum())
+            health['repeated_frames'] = int(np.count_nonzero(ratio < 0.1))
+            health['max_angle_gap'] = float(np.abs(steps).max())
+
+    exptimes = arrays['ExpTimes'].astype(np.float64)
+    if len(exptimes):
+        health['exposure_mean'] = float(exptimes.mean())
+        health['exposure_std'] = float(exptimes.std())
+        if len(exptimes) > 1:
+            x = np.arange(len(exptimes), dtype=np.float64)
+            slope = np.polyfit(x, exptimes, 1)[0]
+            health['exposure_drift'] = float(slope * (len(exptimes) - 1))
+            health['exposure_drift_pct'] = 100.0 * health['exposure_drift'] / health['exposure_mean'] if health['exposure_mean'] else 0.0
+
+    dates = arrays['Dates']
+    if len(dates) > 1:
+        dwell = np.diff(dates).astype('timedelta64[ms]').astype(np.float64) / 1000.0
+        median_dwell = float(np.median(dwell))
+        health['dwell_mean'] = float(dwell.mean())
+        health['dwell_median'] = median_dwell
+        health['dwell_min'] = float(dwell.min())
+        health['dwell_max'] = float(dwell.max())
+        health['dwell_stalls'] = int(np.count_nonzero(dwell > 2 * median_dwell)) if median_dwell > 0 else 0
+        if len(exptimes) == len(dates):
+            health['dwell_overhead_mean'] = float((dwell - exptimes[:-1]).mean())
+        span = (dates[-1] - dates[0]).astype('timedelta64[ms]').astype(np.float64) / 1000.0
+        health['scan_time_s'] = float(span + median_dwell)
+        health['scan_time_h'] = health['scan_time_s'] / 3600
+
+    for axis in ('XPosition', 'YPosition', 'ZPosition'):
+        values = arrays[axis]
+        if len(values):
+            health[axis + '_travel'] = float(values.max() - values.min())
+    return health
+
+def ExtractScanHealth(strFile: str, ReadOnly: bool = True):
+    #Per-projection extraction mode: opens a TXRM file, reads the per-projection streams and returns
+    #(arrays, health) as described in ReadProjectionArrays and ScanHealth
+    with OpenOle(strFile, ReadOnly) as ole:
+        arrays = ReadProjectionArrays(ole)
+    return arrays, ScanHealth(arrays)
+
+def VerifyParams(strFile: str, Hash: str = None):
+    #Verification mode: checks that a TXRM file is complete (header, directory, sector chains and the
+    #ImageData stream lengths) without reading pixel data, optionally hashing the whole file. Returns the
+    #result dict and a feedback summary; see txrm_verify for the checks and the manifest
+    import txrm_verify
+    result = txrm_verify.VerifyFile(strFile, Hash)
+    return result, txrm_verify.Feedback(result)
+
+LIMS_HEADER = ",Sample ID,Phase,Analysis,Component Name,Value\n"
+
+class ScanParams:
+    #The parameters extracted from one TXRM file. values holds the typed values by field name (Python
+    #scalars for the numeric fields, a (first, last) tuple for dates) and Fields the schema
+    #that produced them. The LIMS rows are formatted once and then expanded for any number of sample IDs
+    __slots__ = ("path", "values", "feedback", "Fields")
+
+    def __init__(self, path: str, values: dict, feedback: str = "", Fields=None):
+        self.path = path
+        self.values = values
+        self.feedback = feedback
+        self.Fields = DefaultFields() if Fields is None else Fields
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __repr__(self):
+        return f"ScanParams({self.path!r}, {self.values!r})"
+
+    def Components(self, Altime: int = 15, Proctime: int = 15):
+        #(component name, formatted value) pairs in LIMS order
+        params = dict(self.values, Altime=Altime, Proctime=Proctime)
+        return [(field.component, FormatValue(field, params.get(field.name, field.default), params))
+                for field in self.Fields if field.component is not None]
+
+    def ToLIMS(self, SampleNos, Altime: int = 15, Proctime: int = 15, header: bool = False):
+        #LIMS rows for every sample number. The component/value part of each row is formatted once and
+        #joined to each sample prefix, so the cost is linear in the number of rows
+        suffixes = [",Global,Scanning Parameters," + component + "," + value + "\n"
+                    for component, value in self.Components(Altime, Proctime)]
+        rows = [LIMS_HEADER] if header else []
+        rows.extend("0," + str(sample) + suffix for sample in SampleNos for suffix in suffixes)
+        return "".join(rows)
+
+    def ToDict(self):
+        #Plain Python values (NumPy scalars unwrapped) suitable for JSON. float32 fields are rounded to the
+        #precision they were stored with, so PixelSize exports as 0.3 and not 0.30000001192092896
+        dtypes = {field.name: field.dtype for field in self.Fields}
+        plain = {}
+        for name, value in self.values.items():
+            if hasattr(value, "tolist"):
+                value = value.tolist()
+            elif isinstance(value, tuple):
+                value = list(value)
+            if isinstance(value, float) and dtypes.get(name) == "float32":
+                value = _Float32(value)
+            plain[name] = value
+        return {"file": self.path, "params": plain}
+
+    def ToJSON(self, **kwargs):
+        import json
+        return json.dumps(self.ToDict(), **kwargs)
+
+def WriteScanParams(scans, SampleNos=None, Altime: int = 15, Proctime: int = 15, csvfile=None, jsonfile=None,
+                    parquetfile=None):
+    #Writes the LIMS CSV, a JSON list and/or a Parquet table for an iterable of ScanParams in a single pass.
+    #SampleNos gives the sample numbers for each scan (a list of lists, or one list used for every scan);
+    #each scan gets its own position as sample number if it is None. csvfile and jsonfile may be paths or
+    #open text files; Parquet output needs the optional pyarrow package. Returns the number of scans written
+    def opened(target):
+        if target is None or hasattr(target, "write"):
+            return target, False
+        return open(target, "w", newline=""), True
+
+    if parquetfile is not None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs the pyarrow package (pip install pyarrow)")
+    csv_out, close_csv = opened(csvfile)
+    json_out, close_json = opened(jsonfile)
+    records = []
+    count = 0
+    try:
+        if csv_out is not None:
+            csv_out.write(LIMS_HEADER)
+        if json_out is not None:
+            json_out.write("[")
+        for k, scan in enumerate(scans):
+            if SampleNos is None:
+                samples = [k]
+            elif SampleNos and isinstance(SampleNos[0], (list, tuple, range)):
+                samples = SampleNos[k]
+            else:
+                samples = SampleNos
+            if csv_out is not None:
+                csv_out.write(scan.ToLIMS(samples, Altime, Proctime))
+            if json_out is not None:
+                json_out.write(("," if count else "") + "\n" + scan.ToJSON())
+            if parquetfile is not None:
+                record = scan.ToDict()
+                records.append(dict(record["params"], file=record["file"]))
+            count += 1
+        if json_out is not None:
+            json_out.write("\n]\n")
+    finally:
+        if close_csv:
+            csv_out.close()
+        if close_json:
+            json_out.close()
+    if parquetfile is not None:
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(records), parquetfile)
+    return count
+
+def ExtractParams(strFile: str, ReadOnly: bool = False, Cache=None, Fields=None, Stats=None, Storage=None,
+                  Preview=None):
+    #Extracts the parameters of a TXRM file as a ScanParams. Returns the ScanParams (None on failure) and the
+    #feedback. With ReadOnly the file is opened read-only, only the sectors holding the requested streams
+    #are read and the number of bytes read is added to the feedback.
+    #Cache may be a txrm_cache.ParamCache or the path of a cache database; values for files whose path,
+    #size and mtime are already in the cache are returned without opening the file. Fields replaces the
+    #default parameter schema. Stats (a txrm_stats.ExtractionStats) records per-stage timings and counts.
+    #Storage (a txrm_storage.Storage) reads the file through a pluggable, block-cached backend for slow or
+    #remote storage; it implies ReadOnly and the backend requests are added to the feedback. Preview (e.g. a
+    #txrm_preview.Previewer) is called as Preview(ole, strFile) while the file is open, after the parameters
+    #were read, so previews come from the same pass (it is not called on a cache hit)
+    if Stats is None:
+        return _ExtractParams(strFile, ReadOnly, Cache, Fields, None, Storage, Preview)
+    Stats.begin(strFile)
+    scan = None
+    try:
+        scan, feedback = _ExtractParams(strFile, ReadOnly, Cache, Fields, Stats, Storage, Preview)
+    finally:
+        Stats.end(scan is not None)
+    return scan, feedback
+
+def _ExtractParams(strFile, ReadOnly, Cache, Fields, Stats, Storage, Preview):
+    feedback = ""
+
+    if strFile == "":
+        feedback+=("Missing filename! Terminating...")
+        return None,feedback
+    
+    import os
+
+    if not (os.path.isfile(strFile) if Storage is None else Storage.exists(strFile)):
+        feedback+=("File does not exist! Terminating...")
+        return None,feedback
+
+    if (os.path.splitext(strFile)[1].lower() != ".txrm"):  # the same rule as txrm_batch.FindTXRMFiles
+        feedback+=("File not a .txrm file! Terminating...")
+        return None,feedback
+
+    if Fields is None:
+        Fields = DefaultFields()
+
+    if Cache is not None:
+        import txrm_cache
+        Cache = txrm_cache.OpenCache(Cache)
+        start = perf_counter() if Stats is not None else 0
+        scan = CachedParams(Cache, strFile, Fields)
+        if Stats is not None:
+            Stats.add("cache", perf_counter() - start)
+            Stats.current.cache_hit = scan is not None
+        if scan is not None:
+            return scan, scan.feedback
+
+    start = perf_counter() if Stats is not None else 0
+    if Storage is None and not txrm_ole.IsOleFile(strFile):
+        feedback+=("Unsupported file format. Terminating...")
+        return None,feedback
+
+    try:
+        ole = OpenOle(strFile, ReadOnly, Storage)
+    except txrm_ole.NotOleFileError:
+        feedback+=("Unsupported file format. Terminating...")
+        return None,feedback
+    with ole:
+        #feedback+=("Opening file...")
+        if Stats is not None:
+            Stats.add("open", perf_counter() - start)
+        values, feedback = ReadParams(ole, Fields, Stats)
+        backend = ole.fp.backend if Storage is not None else None
+        if Stats is not None and (ReadOnly or backend is not None):
+            Stats.current.file_bytes_read = ole.bytes_read if backend is None else backend.bytes
+            Stats.current.reads = ole.reads if backend is None else backend.requests
+        if values is None:
+            return None,feedback
+        if Preview is not None:
+            Preview(ole, strFile)
+        if ReadOnly or backend is not None:
+            feedback+=(f'\nBytes read: {ole.bytes_read} in {ole.reads} reads')
+        if backend is not None:
+            feedback+=(f'\nStorage: {backend.bytes} bytes in {backend.requests} requests')
+    if Cache is not None:
+        start = perf_counter() if Stats is not None else 0
+        Cache.put(strFile, values, feedback)
+        if Stats is not None:
+            Stats.add("cache", perf_counter() - start)
+    return ScanParams(strFile, values, feedback, Fields), feedback
+
+def CachedParams(Cache, strFile: str, Fields=None):
+    #The ScanParams of strFile from a parameter cache (a txrm_cache.ParamCache or cache path) if the file is
+    #unchanged and cached with every field of the schema, otherwise None
+    import txrm_cache
+    if Fields is None:
+        Fields = DefaultFields()
+    cached = txrm_cache.OpenCache(Cache).get(strFile)
+    if cached is None:
+        return None
+    values, feedback = cached
+    if not all(field.path is None or field.name in values for field in Fields):
+        return None
+    if isinstance(values.get('Date'), list):
+        values['Date'] = tuple(values['Date'])
+    return ScanParams(strFile, values, feedback, Fields)
+
+def SampleParams(strFile: str, Sampleno: str, Altime: int = 15, Proctime: int = 15, ReadOnly: bool = False,
+                 Cache=None, Fields=None, Stats=None, Storage=None, Preview=None):
+    #This function extracts the desired subset of the metadata from a TXRM file using the olefile tools and 
+    #returns them in a formatted form as "output" them along with a summary of the output "feedback" for
+    #sending to console or a GUI. See ExtractParams for ReadOnly, Cache, Fields, Stats, Storage and Preview
+    
+    if strFile == "":
+        print("Missing filename! Terminating...")
+        return None
+
+    return _ExtractTable(strFile, [Sampleno], Altime, Proctime, False, ReadOnly, Cache, Fields, Stats, Storage, Preview)
+
+def _ExtractTable(strFile, SampleNos, Altime, Proctime, header, ReadOnly, Cache, Fields, Stats, Storage, Preview):
+    #ExtractParams followed by FormatScan. With Stats both are recorded as one file, so the "format" stage
+    #is part of the file's wall time
+    if Stats is None:
+        scan, feedback = _ExtractParams(strFile, ReadOnly, Cache, Fields, None, Storage, Preview)
+        if scan is None:
+            return None, feedback
+        return scan.ToLIMS(SampleNos, Altime, Proctime, header=header), feedback
+    Stats.begin(strFile)
+    table = None
+    try:
+        scan, feedback = _ExtractParams(strFile, ReadOnly, Cache, Fields, Stats, Storage, Preview)
+        if scan is not None:
+            table = FormatScan(scan, SampleNos, Altime, Proctime, header, Stats)
+    finally:
+        Stats.end(table is not None)
+    return table, feedback
+
+def FormatScan(scan, SampleNos, Altime: int = 15, Proctime: int = 15, header: bool = False, Stats=None):
+    #ScanParams.ToLIMS, timed as the "format" stage when Stats is given
+    if Stats is None:
+        return scan.ToLIMS(SampleNos, Altime, Proctime, header=header)
+    start = perf_counter()
+    table = scan.ToLIMS(SampleNos, Altime, Proctime, header=header)
+    Stats.add("format", perf_counter() - start)
+    return table
+
+def MakeTable(strFile: str, SampleNos, Altime: int = 15, Proctime: int = 15, ReadOnly: bool = False, Cache=None,
+              Fields=None, Stats=None, Storage=None, Preview=None):
+    #This function creates a formatted list of (the same) metadata for multiple samples suitable for importing into our LIMS
+    
+    return _ExtractTable(strFile, SampleNos, Altime, Proctime, True, ReadOnly, Cache, Fields, Stats, Storage, Preview)
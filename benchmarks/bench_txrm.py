@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM benchmark harness
+
+Generates synthetic .txrm fixtures with synth_txrm and measures the
+extraction paths: per-file latency (olefile and header-only reader), bytes
+read, batch throughput in files/sec, date decoding, projection reads,
+previews, verification, LIMS export, command line start-up, round-trips
+over slow storage and peak RSS. Every scenario runs in a fresh interpreter
+so its peak RSS is its own.
+
+Usage:
+    python benchmarks/bench_txrm.py                      # run and compare with baseline.json
+    python benchmarks/bench_txrm.py --save               # run and overwrite baseline.json
+    python benchmarks/bench_txrm.py --only latency_readonly batch
+
+A run fails (exit code 1) when a timing is more than --tolerance times its
+baseline, or when bytes read or peak RSS grow by more than that factor.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+BASELINE = os.path.join(HERE, "baseline.json")
+
+# Fixture name -> synth_txrm.ScanStreams arguments
+FIXTURES = {
+    "small": dict(images=180, width=64, height=64),
+    "medium": dict(images=1000, width=256, height=256),
+    "fragmented": dict(images=200, width=128, height=128),
+}
+BATCH_FILES = 48
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def MakeFixtures(directory):
+    import synth_txrm
+    paths = {}
+    for name, kwargs in FIXTURES.items():
+        path = os.path.join(directory, name + ".txrm")
+        if not os.path.exists(path):
+            synth_txrm.MakeTXRM(path, fragment=(name == "fragmented"), **kwargs)
+        paths[name] = path
+    batch = os.path.join(directory, "batch")
+    os.makedirs(batch, exist_ok=True)
+    for i in range(BATCH_FILES):
+        path = os.path.join(batch, f"scan{i:03d}.txrm")
+        if not os.path.exists(path):
+            synth_txrm.MakeTXRM(path, images=90, width=32, height=32, seed=i)
+    paths["batch"] = batch
+    return paths
+
+
+# ----- scenarios (each runs in its own interpreter) -----
+
+def scenario_latency_olefile(paths):
+    import TXRMParams as tp
+    result = {}
+    for name in ("small", "medium"):
+        latency = _timed(lambda: tp.SampleParams(paths[name], "1"), 5)
+        result[name] = {"latency_ms": round(latency * 1e3, 3)}
+    return result
+
+
+def scenario_latency_readonly(paths):
+    import TXRMParams as tp
+    result = {}
+    for name in ("small", "medium", "fragmented"):
+        latency = _timed(lambda: tp.SampleParams(paths[name], "1", ReadOnly=True), 20)
+        with tp.OpenOle(paths[name], ReadOnly=True) as ole:
+            tp.ReadParams(ole)
+            nbytes = ole.bytes_read
+        result[name] = {"latency_ms": round(latency * 1e3, 3), "bytes_read": nbytes,
+                        "file_bytes": os.path.getsize(paths[name])}
+    return result
+
+
+def scenario_batch(paths):
+    import io
+    import txrm_batch
+    files = list(txrm_batch.FindTXRMFiles(paths["batch"]))
+    result = {}
+    for workers in sorted({1, min(4, os.cpu_count() or 1)}):
+        for readonly in (False, True):
+            start = time.perf_counter()
+            txrm_batch.BatchTable(files, io.StringIO(), Workers=workers, ReadOnly=readonly)
+            elapsed = time.perf_counter() - start
+            key = f"workers{workers}_{'readonly' if readonly else 'olefile'}"
+            result[key] = {"files_per_s": round(len(files) / elapsed, 1)}
+    return result
+
+
+def scenario_dates(paths):
+    import TXRMParams as tp
+    import synth_txrm
+    data = synth_txrm.ScanStreams(images=10000, width=1, height=1)["ImageInfo/Date"]
+    return {"decode_10k": {"decode_ms": round(_timed(lambda: tp.DecodeDates(data), 10) * 1e3, 3)},
+            "first_last_10k": {"decode_ms": round(_timed(lambda: tp.DecodeStream(data, "date"), 10) * 1e3, 3)}}
+
+
+def scenario_projections(paths):
+    import txrm_projections
+    result = {}
+    with txrm_projections.ProjectionReader(paths["medium"]) as reader:
+        read = _timed(lambda: reader.read_stack(), 3)
+        result["medium_stack"] = {"read_ms": round(read * 1e3, 3), "bytes": reader.count * reader.image_bytes}
+        views = _timed(lambda: [float(v[0, 0]) for v in reader.views()], 3)
+        result["medium_views"] = {"read_ms": round(views * 1e3, 3)}
+    return result
+
+
+def scenario_previews(paths):
+    #Preview (thumbnails and centre-row sinogram) of one open file, and batch extraction with previews
+    import txrm_batch
+    import txrm_ole
+    import txrm_preview
+    result = {}
+    for name in ("medium", "fragmented"):
+        def preview():
+            with txrm_ole.LazyOleFile(paths[name]) as ole:
+                txrm_preview.MakePreview(ole)
+                return ole.bytes_read
+        latency = _timed(preview, 5)
+        result[name] = {"preview_ms": round(latency * 1e3, 3), "bytes_read": preview(),
+                        "file_bytes": os.path.getsize(paths[name])}
+    files = list(txrm_batch.FindTXRMFiles(paths["batch"]))
+    with tempfile.TemporaryDirectory() as tmp:
+        # Each run writes fresh previews: the folder is emptied before it
+        def batch():
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
+            with open(os.devnull, "w") as out:
+                txrm_batch.BatchTable(files, out, Workers=1, ReadOnly=True, Previews=tmp)
+            assert len(os.listdir(tmp)) == len(files)
+        elapsed = _timed(batch, 3)
+    result["batch"] = {"files_per_s": round(len(files) / elapsed, 1)}
+    return result
+
+
+def scenario_verify(paths):
+    #Structure verification of one file (no pixel reads), and a batch run into a manifest followed by a
+    #no-op re-verification of the unchanged files
+    import txrm_batch
+    import txrm_verify
+    result = {}
+    for name in ("medium", "fragmented"):
+        latency = _timed(lambda: txrm_verify.VerifyFile(paths[name]), 5)
+        check = txrm_verify.VerifyFile(paths[name])
+        assert check["status"] == txrm_verify.STATUS_OK, check["problems"]
+        result[name] = {"verify_ms": round(latency * 1e3, 3), "bytes_read": check["bytes_read"],
+                        "file_bytes": os.path.getsize(paths[name])}
+    files = list(txrm_batch.FindTXRMFiles(paths["batch"]))
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = txrm_verify.Manifest(os.path.join(tmp, "manifest.sqlite"))
+        first = _timed(lambda: txrm_verify.VerifyFiles(files, manifest, Workers=1), 1)
+        again = _timed(lambda: txrm_verify.VerifyFiles(files, manifest, Workers=1), 3)
+        manifest.close()
+    result["batch"] = {"files_per_s": round(len(files) / first, 1), "noop_ms": round(again * 1e3, 3)}
+    return result
+
+
+def scenario_index(paths):
+    #Cold build and no-op update of an index over the batch fixtures, then a query over those rows tiled to 100k
+    import numpy as np
+    import txrm_index
+    with tempfile.TemporaryDirectory() as tmp:
+        index = txrm_index.ArchiveIndex(os.path.join(tmp, "batch.idx"))
+        build = _timed(lambda: index.Update(paths["batch"], Workers=1), 1)  # first run extracts every file
+        update = _timed(lambda: index.Update(paths["batch"], Workers=1), 3)
+        columns = {name: np.resize(np.asarray(index.column(name)), 100000) for name in index.columns}
+        big = txrm_index.ArchiveIndex(os.path.join(tmp, "big.idx"))
+        big.WriteColumns(columns)
+        query = _timed(lambda: big.Query("Voltage==80", "SourceFilter==LE3", "PixelSize<1", "Date>=2026-01-01"), 10)
+    return {"build_batch": {"build_ms": round(build * 1e3, 3)}, "noop_update": {"update_ms": round(update * 1e3, 3)},
+            "query_100k": {"query_ms": round(query * 1e3, 3)}}
+
+
+def scenario_storage(paths):
+    #Extraction over a 5 ms-per-request LatencyBackend: 512-byte uncached reads (one request per sector,
+    #roughly a plain file on a share) against the default txrm_storage block cache
+    import TXRMParams as tp
+    import txrm_storage
+    unbuffered = txrm_storage.Storage(block_size=512, cache_blocks=1, readahead=0, latency=0.005)
+    cached = txrm_storage.Storage(latency=0.005)
+    result = {}
+    for name in ("small", "medium", "fragmented"):
+        case = {}
+        for label, storage in (("unbuffered", unbuffered), ("cached", cached)):
+            latency = _timed(lambda: tp.ExtractParams(paths[name], Storage=storage), 3)
+            with tp.OpenOle(paths[name], Storage=storage) as ole:
+                tp.ReadParams(ole)
+                requests = ole.fp.backend.requests
+            case[f"{label}_ms"] = round(latency * 1e3, 3)
+            case[f"{label}_requests"] = requests
+        result[name] = case
+    return result
+
+
+def scenario_export(paths):
+    #A million-row txrm_export run (one scan booked against enough sample IDs) to CSV and to .xlsx; the
+    #scenario's peak RSS shows that memory does not grow with the rows
+    import txrm_export
+    rows = 1000000
+    components = len(txrm_export.TEMPLATES["lims"].Components(txrm_export.tp.DefaultFields()))
+    spec = f"100000-{100000 + -(-rows // components) - 1}"
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ("csv", "xlsx"):
+            target = os.path.join(tmp, "export." + fmt)
+            start = time.perf_counter()
+            written, samples, failed = txrm_export.ExportLIMS([(paths["medium"], spec)], target)
+            elapsed = time.perf_counter() - start
+            assert not failed and written >= rows, (written, failed)
+            result[fmt] = {"export_ms": round(elapsed * 1e3, 1), "rows_per_s": round(written / elapsed),
+                           "file_bytes": os.path.getsize(target)}
+    return result
+
+
+def scenario_startup(paths):
+    #Wall time of whole processes: a bare interpreter, and txrm_cli.py extracting one file per call
+    cli = os.path.join(ROOT, "txrm_cli.py")
+    commands = {
+        "interpreter": [sys.executable, "-c", "pass"],
+        "cli_readonly": [sys.executable, cli, paths["small"]],
+        "cli_olefile": [sys.executable, cli, "--olefile", paths["small"]],
+    }
+    return {name: {"wall_ms": round(_timed(lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL), 7) * 1e3, 1)}
+            for name, command in commands.items()}
+
+
+SCENARIOS = {name[len("scenario_"):]: func for name, func in globals().items() if name.startswith("scenario_")}
+
+
+def RunScenario(name, fixtures):
+    #Runs one scenario in a child interpreter and returns its metrics with the child's peak RSS
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--fixtures", fixtures]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def Compare(results, baseline, tolerance):
+    #Lists regressions: timings (lower is better, except the _per_s rates), bytes read and peak RSS beyond tolerance
+    problems = []
+    for scenario, cases in baseline.get("results", {}).items():
+        for case, metrics in cases.items():
+            if not isinstance(metrics, dict):
+                # Scenario level values such as peak_rss_mb
+                metrics, case = {case: metrics}, None
+            current = results.get(scenario, {})
+            current = current if case is None else current.get(case, {})
+            for key, old in metrics.items():
+                new = current.get(key)
+                if new is None or not old or key == "file_bytes":
+                    continue
+                worse = old / new if key.endswith("_per_s") else new / old
+                if worse > tolerance:
+                    where = scenario if case is None else f"{scenario}/{case}"
+                    problems.append(f"{where}/{key}: {old} -> {new} ({worse:.2f}x worse)")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TXRM extraction on synthetic fixtures")
+    parser.add_argument("--fixtures", default=os.path.join(tempfile.gettempdir(), "txrm_bench_fixtures"),
+                        help="directory for the generated fixtures (reused between runs)")
+    parser.add_argument("--only", nargs="*", choices=sorted(SCENARIOS), help="scenarios to run")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = SCENARIOS[args.child](MakeFixtures(args.fixtures))
+        result["peak_rss_mb"] = _peak_rss_mb()
+        print(json.dumps(result))
+        return 0
+
+    os.makedirs(args.fixtures, exist_ok=True)
+    MakeFixtures(args.fixtures)
+    results = {}
+    for name in args.only or sorted(SCENARIOS):
+        results[name] = RunScenario(name, args.fixtures)
+        print(f"{name}: {json.dumps(results[name])}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                   "cpus": os.cpu_count()}, "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.only:
+        baseline["results"] = {k: v for k, v in baseline["results"].items() if k in args.only}
+    problems = Compare(results, baseline, args.tolerance)
+    for problem in problems:
+        print("REGRESSION " + problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic TXRM generator
+
+Writes OLE compound files with the stream layout of an Xradia Versa .txrm
+scan (ImageInfo/, AcquisitionSettings/, ReconSettings/ and
+ImageData*/Image* projection streams) so the extraction code can be tested
+and benchmarked without real acquisition data.
+
+Usage:
+    python benchmarks/synth_txrm.py OUT.txrm [--images N] [--width W]
+        [--height H] [--dtype uint16|float32] [--fragment]
+"""
+
+import argparse
+import struct
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SECTOR = 512
+MINI_SECTOR = 64
+MINI_CUTOFF = 4096
+ENTRIES_PER_FAT = SECTOR // 4
+
+FREESECT = 0xFFFFFFFF
+ENDOFCHAIN = 0xFFFFFFFE
+FATSECT = 0xFFFFFFFD
+DIFSECT = 0xFFFFFFFC
+NOSTREAM = 0xFFFFFFFF
+
+STGTY_STORAGE = 1
+STGTY_STREAM = 2
+STGTY_ROOT = 5
+
+DATE_WIDTH = 24
+
+
+def _sectors(size, unit):
+    return (size + unit - 1) // unit
+
+
+def _name_key(name):
+    # Compound file directory order: shorter names first, then upper-case compare
+    return (len(name), name.upper())
+
+
+class _Entry:
+    def __init__(self, name, kind, data=None, size=0):
+        self.name = name
+        self.kind = kind
+        self.data = data
+        self.size = size
+        self.children = {}
+        self.sid = 0
+        self.left = self.right = self.child = NOSTREAM
+        self.start = ENDOFCHAIN
+
+
+def _bst(entries):
+    # Balanced binary tree over the sorted siblings; returns the root sid
+    if not entries:
+        return NOSTREAM
+    mid = len(entries) // 2
+    node = entries[mid]
+    node.left = _bst(entries[:mid])
+    node.right = _bst(entries[mid + 1:])
+    return node.sid
+
+
+def WriteOle(strFile: str, streams, fragment: bool = False):
+    #Write a version 3 compound file. streams maps "Storage/Stream" paths to
+    #either bytes or a (size, producer) pair where producer() returns the bytes.
+    #With fragment=True large streams are interleaved sector by sector so that
+    #their chains are not contiguous.
+    root = _Entry("Root Entry", STGTY_ROOT)
+    for path, value in streams.items():
+        parts = path.split("/")
+        node = root
+        for part in parts[:-1]:
+            node = node.children.setdefault(part, _Entry(part, STGTY_STORAGE))
+        if isinstance(value, (bytes, bytearray)):
+            leaf = _Entry(parts[-1], STGTY_STREAM, bytes(value), len(value))
+        else:
+            leaf = _Entry(parts[-1], STGTY_STREAM, value[1], value[0])
+        node.children[parts[-1]] = leaf
+
+    ordered = []
+
+    def walk(node):
+        node.sid = len(ordered)
+        ordered.append(node)
+        for child in node.children.values():
+            walk(child)
+
+    walk(root)
+    for node in ordered:
+        kids = sorted(node.children.values(), key=lambda e: _name_key(e.name))
+        node.child = _bst(kids)
+
+    small = [e for e in ordered if e.kind == STGTY_STREAM and e.size < MINI_CUTOFF]
+    large = [e for e in ordered if e.kind == STGTY_STREAM and e.size >= MINI_CUTOFF]
+
+    # Mini stream layout
+    minifat = []
+    mini = bytearray()
+    for e in small:
+        if e.size == 0:
+            continue
+        n = _sectors(e.size, MINI_SECTOR)
+        e.start = len(minifat)
+        minifat.extend(range(e.start + 1, e.start + n))
+        minifat.append(ENDOFCHAIN)
+        data = e.data if isinstance(e.data, bytes) else e.data()
+        mini += data + b"\0" * (n * MINI_SECTOR - len(data))
+
+    fat = []
+    chains = {}
+
+    def alloc(key, n):
+        first = len(fat)
+        fat.extend(range(first + 1, first + n))
+        fat.append(ENDOFCHAIN)
+        chains[key] = list(range(first, first + n))
+        return first
+
+    # Large stream layout
+    if fragment and large:
+        remaining = {id(e): _sectors(e.size, SECTOR) for e in large}
+        owned = {id(e): [] for e in large}
+        while any(remaining.values()):
+            for e in large:
+                if remaining[id(e)]:
+                    owned[id(e)].append(len(fat))
+                    fat.append(None)
+                    remaining[id(e)] -= 1
+        for e in large:
+            sids = owned[id(e)]
+            for a, b in zip(sids, sids[1:]):
+                fat[a] = b
+            fat[sids[-1]] = ENDOFCHAIN
+            e.start = sids[0]
+            chains[id(e)] = sids
+    else:
+        for e in large:
+            e.start = alloc(id(e), _sectors(e.size, SECTOR))
+
+    if mini:
+        root.start = alloc("mini", _sectors(len(mini), SECTOR))
+        root.size = len(mini)
+    minifat_bytes = b"".join(struct.pack("<I", v) for v in minifat)
+    minifat_start = alloc("minifat", _sectors(len(minifat_bytes), SECTOR)) if minifat else ENDOFCHAIN
+    dir_sectors = _sectors(len(ordered) * 128, SECTOR)
+    dir_start = alloc("dir", dir_sectors)
+
+    # FAT and DIFAT sectors have to describe themselves as well
+    nfat = 1
+    while True:
+        ndifat = _sectors(max(0, nfat - 109), ENTRIES_PER_FAT - 1)
+        if len(fat) + nfat + ndifat <= nfat * ENTRIES_PER_FAT:
+            break
+        nfat += 1
+    fat_sids = list(range(len(fat), len(fat) + nfat))
+    fat.extend([FATSECT] * nfat)
+    difat_sids = list(range(len(fat), len(fat) + ndifat))
+    fat.extend([DIFSECT] * ndifat)
+    fat.extend([FREESECT] * (nfat * ENTRIES_PER_FAT - len(fat)))
+
+    header = bytearray(SECTOR)
+    header[0:8] = b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1"
+    struct.pack_into("<HHHHH", header, 24, 0x3E, 3, 0xFFFE, 9, 6)
+    struct.pack_into("<IIIIIIIII", header, 40, 0, nfat, dir_start, 0, MINI_CUTOFF,
+                     minifat_start, _sectors(len(minifat_bytes), SECTOR),
+                     difat_sids[0] if difat_sids else ENDOFCHAIN, ndifat)
+    difat = fat_sids[:109] + [FREESECT] * max(0, 109 - nfat)
+    struct.pack_into("<109I", header, 76, *difat)
+
+    def dir_entry(e):
+        raw = bytearray(128)
+        name = e.name.encode("utf-16-le")
+        raw[0:len(name)] = name
+        struct.pack_into("<HBBIII", raw, 64, len(name) + 2, e.kind, 1, e.left, e.right, e.child)
+        struct.pack_into("<IQ", raw, 116, e.start, e.size)
+        return bytes(raw)
+
+    empty = bytearray(128)
+    struct.pack_into("<III", empty, 68, NOSTREAM, NOSTREAM, NOSTREAM)
+
+    with open(strFile, "wb") as f:
+        f.write(header)
+        sector_writes = {}
+        for e in large:
+            sector_writes[id(e)] = e
+        # Write sectors in order; contiguous streams are streamed straight out
+        if fragment and large:
+            blobs = {id(e): (e.data if isinstance(e.data, bytes) else e.data()) for e in large}
+            order = []
+            for e in large:
+                for i, sid in enumerate(chains[id(e)]):
+                    order.append((sid, id(e), i))
+            order.sort()
+            for sid, key, i in order:
+                chunk = blobs[key][i * SECTOR:(i + 1) * SECTOR]
+                f.write(chunk + b"\0" * (SECTOR - len(chunk)))
+        else:
+            for e in large:
+                data = e.data if isinstance(e.data, bytes) else e.data()
+                f.write(data)
+                f.write(b"\0" * (len(chains[id(e)]) * SECTOR - len(data)))
+        if mini:
+            f.write(mini + b"\0" * (len(chains["mini"]) * SECTOR - len(mini)))
+        if minifat:
+            f.write(minifat_bytes + b"\xff" * (len(chains["minifat"]) * SECTOR - len(minifat_bytes)))
+        entries = b"".join(dir_entry(e) for e in ordered)
+        entries += bytes(empty) * (dir_sectors * SECTOR // 128 - len(ordered))
+        f.write(entries)
+        f.write(struct.pack("<%dI" % len(fat), *fat))
+        for k, sid in enumerate(difat_sids):
+            chunk = fat_sids[109 + k * 127:109 + (k + 1) * 127]
+            nxt = difat_sids[k + 1] if k + 1 < len(difat_sids) else ENDOFCHAIN
+            chunk = chunk + [FREESECT] * (127 - len(chunk)) + [nxt]
+            f.write(struct.pack("<128I", *chunk))
+
+
+def _text(value: str, width: int = 256):
+    raw = value.encode("ascii")
+    return raw + b"\0" * (width - len(raw))
+
+
+def ScanStreams(images: int = 10, width: int = 64, height: int = 64, dtype: str = "uint16",
+                voltage: float = 80.0, power: float = 7.0, filt: str = "LE3",
+                exptime: float = 2.0, pixel: float = 0.75, stitches=None, seed: int = 0,
+                start: datetime = datetime(2026, 3, 2, 10, 15, 30)):
+    #Build the stream dictionary for a synthetic scan
+    rng = np.random.default_rng(seed)
+    f4 = lambda v: np.asarray(v, dtype=np.float32).tobytes()
+    i4 = lambda v: np.asarray(v, dtype=np.int32).tobytes()
+    angles = np.linspace(-180.0, 180.0, images, endpoint=False, dtype=np.float32)
+    exps = (exptime + rng.normal(0, 0.01, images)).astype(np.float32)
+    dates = b""
+    t = start
+    for k in range(images):
+        dates += t.strftime("%m/%d/%Y %H:%M:%S.").encode() + b"%02d" % (k % 100)
+        dates += b"\0" * (DATE_WIDTH - 22)
+        t += timedelta(seconds=float(exptime) + 1.0)
+    streams = {
+        "ImageInfo/Voltage": f4([voltage] * images),
+        "ImageInfo/NoOfImages": i4([images]),
+        "ImageInfo/ImageWidth": i4([width]),
+        "ImageInfo/ImageHeight": i4([height]),
+        "ImageInfo/DataType": i4([5 if dtype == "uint16" else 10]),
+        "ImageInfo/PixelSize": f4([pixel]),
+        "ImageInfo/XrayMagnification": f4([4.0]),
+        "ImageInfo/ObjectiveName": _text("4X"),
+        "ImageInfo/Angles": f4(angles),
+        "ImageInfo/ExpTimes": exps.tobytes(),
+        "ImageInfo/XPosition": f4(np.zeros(images)),
+        "ImageInfo/YPosition": f4(np.zeros(images)),
+        "ImageInfo/ZPosition": f4(np.zeros(images)),
+        "ImageInfo/Date": dates,
+        "AcquisitionSettings/SrcPower": f4([power]),
+        "AcquisitionSettings/SourceFilterName": _text(filt),
+        "AcquisitionSettings/FramesPerImage": i4([1]),
+        "AcquisitionSettings/ExpTime": f4([exptime]),
+        "AcquisitionSettings/Binning": i4([1]),
+        "ReconSettings/BeamHardening": f4([0.05]),
+        "ReconSettings/BeamHardeningFileName": _text("BH Correction for Very Low Transmission"),
+    }
+    if stitches is not None:
+        streams["AcquisitionSettings/StitchParams/AutoStitchSettings/NumSegments"] = i4([stitches])
+    nbytes = width * height * np.dtype(dtype).itemsize
+    for k in range(images):
+        def producer(k=k):
+            img = np.full((height, width), k, dtype=dtype)
+            img[:, : min(width, 4)] = np.arange(height, dtype=dtype)[:, None]
+            return img.tobytes()
+        streams[f"ImageData{k // 100 + 1}/Image{k + 1}"] = (nbytes, producer)
+    return streams
+
+
+def MakeTXRM(strFile: str, fragment: bool = False, **kwargs):
+    WriteOle(strFile, ScanStreams(**kwargs), fragment=fragment)
+    return strFile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Xradia .txrm file")
+    parser.add_argument("output")
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--height", type=int, default=64)
+    parser.add_argument("--dtype", choices=["uint16", "float32"], default="uint16")
+    parser.add_argument("--fragment", action="store_true")
+    args = parser.parse_args(argv)
+    MakeTXRM(args.output, fragment=args.fragment, images=args.images, width=args.width,
+             height=args.height, dtype=args.dtype)
+    print(args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+#Shared fixtures: small synthetic .txrm files written with benchmarks/synth_txrm.py
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import synth_txrm
+
+
+@pytest.fixture
+def make_txrm(tmp_path):
+    #make_txrm(name, **ScanStreams arguments) writes a small scan under tmp_path and returns its path
+    def make(name="scan.txrm", fragment=False, **kwargs):
+        kwargs.setdefault("images", 4)
+        kwargs.setdefault("width", 16)
+        kwargs.setdefault("height", 8)
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return synth_txrm.MakeTXRM(str(path), fragment=fragment, **kwargs)
+    return make
+
+
+def bump_mtime(path, seconds: int = 10):
+    #Moves the mtime forward so a rewrite is seen even on file systems with coarse timestamps
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + seconds * 1_000_000_000))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#txrm_batch: file discovery, per-file status and the merged CSV
+
+import csv
+
+import txrm_batch
+
+
+def _extractions(path):
+    #(sample, file, status) per file in a merged CSV
+    with open(path, newline="") as f:
+        return sorted({(row["Sample ID"], row["File"], row["Status"]) for row in csv.DictReader(f)})
+
+
+def test_suffix_rule_matches_extraction(make_txrm, tmp_path):
+    lower = make_txrm("a/scan.txrm")
+    upper = make_txrm("b/SCAN.TXRM")
+    (tmp_path / "a" / "notes.txt").write_text("x")
+    assert list(txrm_batch.FindTXRMFiles([str(tmp_path)])) == [lower, upper]
+    assert txrm_batch.ExtractFile((upper, 7, 15, 15, True, None))[3] == txrm_batch.STATUS_OK
+
+
+def test_merged_table(make_txrm, tmp_path):
+    good = make_txrm("scan_a.txrm")
+    bad = tmp_path / "scan_b.txrm"
+    bad.write_bytes(b"not an OLE file")
+    output = tmp_path / "merged.csv"
+    assert txrm_batch.main([str(tmp_path), "-o", str(output), "--start", "100", "-j", "1"]) == 1
+    rows = _extractions(output)
+    assert rows == [("100", good, "OK"), ("101", str(bad), "FAILED: Unsupported file format.")]
+
+
+def test_readers_agree(make_txrm, tmp_path):
+    make_txrm("scan.txrm")
+    outputs = []
+    for flags in ([], ["--olefile"]):
+        output = tmp_path / f"merged{len(flags)}.csv"
+        assert txrm_batch.main([str(tmp_path), "-o", str(output), "-j", "1"] + flags) == 0
+        with open(output) as f:
+            outputs.append(f.read())
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#txrm_cache: hits, invalidation of changed files and other extractor versions, eviction
+
+import os
+import sqlite3
+
+import pytest
+
+import TXRMParams as tp
+import txrm_cache
+from conftest import bump_mtime
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with txrm_cache.ParamCache(str(tmp_path / "cache.sqlite")) as opened:
+        yield opened
+
+
+def test_hit_skips_extraction(make_txrm, cache):
+    path = make_txrm()
+    first, _ = tp.ExtractParams(path, True, cache)
+    assert cache.stats()["entries"] == 1
+    assert tp.CachedParams(cache, path) is not None
+    second, _ = tp.ExtractParams(path, True, cache)
+    assert second.values == first.values
+    assert cache.hits == 2
+
+
+def test_changed_file_is_extracted_again(make_txrm, cache):
+    path = make_txrm(voltage=80.0)
+    scan, _ = tp.ExtractParams(path, True, cache)
+    assert scan["Voltage"] == pytest.approx(80.0)
+    make_txrm(voltage=120.0)
+    bump_mtime(path)
+    assert cache.get(path) is None
+    assert cache.stats()["entries"] == 0
+    scan, _ = tp.ExtractParams(path, True, cache)
+    assert scan["Voltage"] == pytest.approx(120.0)
+
+
+def test_other_extractor_version_is_a_miss(make_txrm, tmp_path):
+    path = make_txrm()
+    db = str(tmp_path / "versions.sqlite")
+    with txrm_cache.ParamCache(db, version="0:old") as old:
+        old.put(path, {"Voltage": 1.0})
+        assert old.get(path) is not None
+    with txrm_cache.ParamCache(db) as current:
+        assert current.get(path) is None
+        scan, _ = tp.ExtractParams(path, True, current)
+        assert scan["Voltage"] == pytest.approx(80.0)
+        assert current.get(path)[0]["Voltage"] == pytest.approx(80.0)
+    with txrm_cache.ParamCache(db, version="0:old") as old:
+        assert old.prune() == 1
+
+
+def test_schema_change_changes_version(monkeypatch):
+    before = txrm_cache.SchemaVersion()
+    monkeypatch.setattr(tp, "PARAM_FIELDS", tp.PARAM_FIELDS + [tp.ParamField("Extra", "ImageInfo/Extra")])
+    assert txrm_cache.SchemaVersion() != before
+
+
+def test_old_database_is_replaced(make_txrm, tmp_path):
+    db = str(tmp_path / "old.sqlite")
+    with sqlite3.connect(db) as conn:
+        conn.execute("CREATE TABLE params (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                     "payload TEXT NOT NULL, feedback TEXT NOT NULL, nbytes INTEGER NOT NULL, atime REAL NOT NULL)")
+        conn.execute("INSERT INTO params VALUES ('x', 1, 1, '{}', '', 10, 0)")
+    conn.close()
+    with txrm_cache.ParamCache(db) as cache:
+        assert cache.stats()["entries"] == 0
+        path = make_txrm()
+        assert tp.ExtractParams(path, True, cache)[0] is not None
+
+
+def test_invalidate_prefix(make_txrm, cache):
+    inside = [make_txrm(f"a/scan_{k}.txrm") for k in range(3)]
+    outside = make_txrm("b/scan.txrm")
+    for path in inside + [outside]:
+        tp.ExtractParams(path, True, cache)
+    assert cache.invalidate(prefix=os.path.dirname(inside[0])) == 3
+    assert cache.get(outside) is not None
+
+
+def test_eviction_keeps_recently_used(tmp_path):
+    paths = []
+    for k in range(40):
+        path = tmp_path / f"f{k}"
+        path.write_text("x")
+        paths.append(str(path))
+    with txrm_cache.ParamCache(str(tmp_path / "small.sqlite"), max_bytes=2000) as cache:
+        cache.put(paths[0], {"k": 0})
+        for path in paths[1:]:
+            assert cache.get(paths[0]) is not None
+            cache.put(path, {"k": 1})
+        stats = cache.stats()
+        assert 0 < stats["bytes"] <= 2000
+        assert stats["entries"] < len(paths)
+        assert cache.get(paths[0]) is not None
+        assert cache.get(paths[1]) is None
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#txrm_cli: sample numbering, per-file failures and the numpy-free start
+
+import csv
+import os
+import subprocess
+import sys
+
+import txrm_cli
+from conftest import ROOT
+
+
+def _samples(path):
+    #{sample ID: voltage} of a CLI CSV
+    with open(path, newline="") as f:
+        return {row["Sample ID"]: row["Value"] for row in csv.DictReader(f) if row["Component Name"] == "Voltage"}
+
+
+def test_one_sample_per_file(make_txrm, tmp_path):
+    paths = [make_txrm("a.txrm", voltage=80.0), make_txrm("b.txrm", voltage=120.0)]
+    output = tmp_path / "out.csv"
+    assert txrm_cli.main(paths + ["--start", "1000", "-o", str(output)]) == 0
+    assert _samples(output) == {"1000": "80", "1001": "120"}
+    assert output.read_text().count("Sample ID") == 1
+
+
+def test_bad_files_do_not_abort_the_run(make_txrm, tmp_path, capsys):
+    truncated = make_txrm("b.txrm", images=4, width=64, height=64)
+    with open(truncated, "r+b") as f:
+        f.truncate(2048)
+    missing = str(tmp_path / "missing.txrm")
+    paths = [make_txrm("a.txrm", voltage=80.0), truncated, missing, make_txrm("c.txrm", voltage=120.0)]
+    output = tmp_path / "out.csv"
+    for reader in ([], ["--olefile"]):
+        assert txrm_cli.main(paths + ["--start", "1", "-o", str(output)] + reader) == 1
+        assert _samples(output) == {"1": "80", "4": "120"}
+        err = capsys.readouterr().err.splitlines()
+        assert [line.split(":")[0] for line in err] == [truncated, missing]
+        assert err[1].endswith("File does not exist! Terminating...")
+
+
+def test_cli_does_not_load_numpy(make_txrm):
+    script = ("import sys, txrm_cli; txrm_cli.main(sys.argv[1:]); "
+              "sys.exit(3 if 'numpy' in sys.modules else 0)")
+    result = subprocess.run([sys.executable, "-c", script, make_txrm(), "-o", os.devnull], cwd=ROOT)
+    assert result.returncode == 0
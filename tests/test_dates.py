@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#ImageInfo/Date decoding: the bulk DecodeDates path against the per-record parse
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import TXRMParams as tp
+
+
+def _per_record(data: bytes):
+    #The record-by-record parse DecodeDates falls back to
+    records = [i.decode("ascii") for i in data.split(b"\0") if len(i) > 2]
+    return np.array([f"{r[6:10]}-{r[0:2]}-{r[3:5]}T{r[11:]}" for r in records], dtype="datetime64[ms]")
+
+
+def _stream(records, width: int = 24):
+    return b"".join(record.encode("ascii").ljust(width, b"\0") for record in records)
+
+
+def _bulk(data: bytes):
+    #DecodeDates, checking that it took the bulk path
+    width = tp._DateWidth(data)
+    assert tp._DecodeFixedDates(np, data, width) is not None
+    return tp.DecodeDates(data)
+
+
+@pytest.mark.parametrize("width", [20, 22, 23, 24, 32])
+def test_bulk_matches_per_record(width):
+    rng = np.random.default_rng(width)
+    start = datetime(1999, 12, 31, 23, 0, 0)
+    records = []
+    for k in range(200):
+        t = start + timedelta(seconds=int(rng.integers(0, 400 * 86400)))
+        record = t.strftime("%m/%d/%Y %H:%M:%S")
+        digits = min(3, width - 21)
+        if digits > 0:
+            record += "." + str(int(rng.integers(0, 10 ** digits))).zfill(digits)[:int(rng.integers(1, digits + 1))]
+        records.append(record)
+    data = _stream(records, width)
+    np.testing.assert_array_equal(_bulk(data), _per_record(data))
+
+
+def test_synthetic_stream(make_txrm):
+    with tp.OpenOle(make_txrm(images=12)) as ole:
+        data = tp.ReadStreams(ole, ["ImageInfo/Date"])["ImageInfo/Date"]
+    dates = _bulk(data)
+    np.testing.assert_array_equal(dates, _per_record(data))
+    assert len(dates) == 12 and str(dates[1]) == "2026-03-02T10:15:33.010"
+
+
+def test_edge_cases():
+    records = ["02/29/2024 00:00:00.5", "12/31/1999 23:59:59.999", "01/01/2000 00:00:00", "02/29/2000 12:00:00.05"]
+    data = _stream(records) + b"\0" * 24  # an unused trailing record
+    np.testing.assert_array_equal(_bulk(data), _per_record(data))
+    # A stream that ends without the padding of its last record
+    data = _stream(records)[:-3]
+    np.testing.assert_array_equal(_bulk(data), _per_record(data))
+    assert len(tp.DecodeDates(b"")) == 0
+
+
+@pytest.mark.parametrize("record", ["13/01/2024 10:00:00", "02/30/2024 10:00:00", "02/29/2023 10:00:00",
+                                    "01/01/2024 24:00:00"])
+def test_invalid_dates_raise(record):
+    data = _stream(["01/01/2024 10:00:00", record])
+    assert tp._DecodeFixedDates(np, data, 24) is None
+    with pytest.raises(ValueError):
+        tp.DecodeDates(data)
+
+
+def test_irregular_layout_falls_back():
+    # Records of different widths: the second does not start at the first record's width
+    data = b"03/02/2026 10:15:30\0\0" + b"03/02/2026 10:15:33.123\0"
+    assert tp._DecodeFixedDates(np, data, tp._DateWidth(data)) is None
+    np.testing.assert_array_equal(tp.DecodeDates(data), _per_record(data))
+    assert str(tp.DecodeDates(data)[1]) == "2026-03-02T10:15:33.123"
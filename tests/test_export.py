@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#txrm_export: sample range specs, bookings, templates and the CSV and .xlsx writers
+
+import csv
+import io
+import os
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+
+import TXRMParams as tp
+import txrm_export
+
+SHEET = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+@pytest.mark.parametrize("spec, samples", [
+    ("1000-1003", ["1000", "1001", "1002", "1003"]),
+    ("AB0098-AB0102:2", ["AB0098", "AB0100", "AB0102"]),
+    ("0098-102", ["0098", "0099", "0100", "0101", "0102"]),
+    ("S-010-012", ["S-010", "S-011", "S-012"]),
+    ("1000-1001, 1200,,X7", ["1000", "1001", "1200", "X7"]),
+    ("2024-001", ["2024-001"]),
+    ("'2024-2026'", ["2024-2026"]),
+    ("7-7", ["7"]),
+    (range(3, 5), ["3", "4"]),
+])
+def test_parse_samples(spec, samples):
+    assert list(txrm_export.ParseSamples(spec)) == samples
+
+
+def test_zero_step_is_rejected():
+    with pytest.raises(ValueError):
+        list(txrm_export.ParseSamples("1-5:0"))
+
+
+def test_read_bookings(tmp_path):
+    bookings = tmp_path / "bookings.csv"
+    bookings.write_text("Scan,Notes,Sample ID\nscan_a.txrm,x,1000-1002\n\n/abs/scan_b.txrm,,S1\n", encoding="utf-8-sig")
+    assert list(txrm_export.ReadBookings(str(bookings))) == [
+        (str(tmp_path / "scan_a.txrm"), "1000-1002"), ("/abs/scan_b.txrm", "S1")]
+    bookings.write_text("1000,scan_a.txrm\n1001\n")
+    with pytest.raises(ValueError):
+        list(txrm_export.ReadBookings(str(bookings)))
+
+
+def test_lims_csv_matches_make_table(make_txrm, tmp_path):
+    path = make_txrm()
+    output = tmp_path / "lims.csv"
+    components = len(tp.ExtractParams(path, ReadOnly=True)[0].Components())
+    assert txrm_export.ExportLIMS({path: "1000-1002"}, str(output)) == (3 * components, 3, [])
+    table, _ = tp.MakeTable(path, [1000, 1001, 1002], ReadOnly=True)
+    with open(output, newline="") as f:
+        assert f.read() == table
+    assert not os.path.exists(str(output) + ".tmp")
+
+
+def test_each_scan_is_extracted_once(make_txrm, monkeypatch):
+    path = make_txrm()
+    extract = tp.ExtractParams
+    calls = []
+    monkeypatch.setattr(tp, "ExtractParams", lambda *args, **kwargs: calls.append(args[0]) or extract(*args, **kwargs))
+    out = io.StringIO()
+    txrm_export.ExportLIMS([(path, "1-2"), (path, "5")], out)
+    assert calls == [path]
+    samples = [row["Sample ID"] for row in csv.DictReader(io.StringIO(out.getvalue()))]
+    assert sorted(set(samples)) == ["1", "2", "5"] and samples == sorted(samples)
+
+
+def test_wide_template_with_failures(make_txrm, tmp_path):
+    good = make_txrm("good.txrm", voltage=120.0)
+    bad = tmp_path / "bad.txrm"
+    bad.write_bytes(b"not an OLE file")
+    out = io.StringIO()
+    rows, samples, failed = txrm_export.ExportLIMS([(good, "A1-A2"), (str(bad), "B1")], out, "wide")
+    assert (rows, samples) == (3, 3) and failed == [(str(bad), "FAILED: Unsupported file format.")]
+    table = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [(row["Sample ID"], row["Voltage"], row["Status"]) for row in table] == [
+        ("A1", "120", "OK"), ("A2", "120", "OK"), ("B1", "", "FAILED: Unsupported file format.")]
+
+
+def test_site_template(make_txrm, tmp_path):
+    template = tmp_path / "site.json"
+    template.write_text('{"layout": "wide", "columns": [["Sample", "{sample}"], ["Scan", "{scan}"], "*"], '
+                        '"fields": ["Voltage", "PixelSize"], "rename": {"Pixel Size": "Voxel (um)"}}')
+    out = io.StringIO()
+    txrm_export.ExportLIMS({make_txrm("rock.txrm", pixel=0.3): "S1"}, out, str(template))
+    assert out.getvalue() == "Sample,Scan,Voltage,Voxel (um)\nS1,rock,80,0.30\n"
+    bad = tmp_path / "bad.json"
+    bad.write_text('{"columns": [["Sample", "{sample}"], ["X", "{nope}"]]}')
+    with pytest.raises(ValueError):
+        txrm_export.ExportLIMS({make_txrm(): "S1"}, io.StringIO(), str(bad))
+
+
+def _sheets(path):
+    #The cell texts of every worksheet of an .xlsx file, read with the standard library
+    with zipfile.ZipFile(path) as workbook:
+        names = sorted(name for name in workbook.namelist() if name.startswith("xl/worksheets/"))
+        sheets = []
+        for name in names:
+            root = ElementTree.fromstring(workbook.read(name))
+            sheets.append([[cell.findtext(f"{SHEET}is/{SHEET}t") for cell in row] for row in root.iter(f"{SHEET}row")])
+        return sheets
+
+
+def test_xlsx_writer_splits_sheets(tmp_path):
+    path = tmp_path / "rows.xlsx"
+    writer = txrm_export.XLSXWriter(str(path), Batch=2, MaxRows=3)
+    writer.Header(["Sample", "Value"])
+    rows = [writer.Prepare([txrm_export.SAMPLE, "a<b"]), writer.Prepare([txrm_export.SAMPLE, " 0012 "])]
+    writer.Write(rows, "S&1")
+    writer.Write(rows, "S2")
+    writer.Close()
+    header = ["Sample", "Value"]
+    assert _sheets(path) == [[header, ["S&1", "a<b"], ["S&1", " 0012 "]], [header, ["S2", "a<b"], ["S2", " 0012 "]]]
+
+
+def test_xlsx_export(make_txrm, tmp_path):
+    path = make_txrm()
+    output = tmp_path / "lims.xlsx"
+    txrm_export.ExportLIMS({path: "1000-1001"}, str(output))
+    [sheet] = _sheets(output)
+    table, _ = tp.MakeTable(path, [1000, 1001], ReadOnly=True)
+    assert sheet == list(csv.reader(io.StringIO(table)))
+
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.load_workbook(str(output), read_only=True)
+    assert workbook.sheetnames == ["LIMS"]
+    values = [[cell or "" for cell in row] for row in workbook["LIMS"].iter_rows(values_only=True)]
+    assert values == sheet
+
+
+def test_failed_export_leaves_no_file(make_txrm, tmp_path):
+    output = tmp_path / "lims.xlsx"
+
+    def bookings():
+        yield make_txrm(), "1"
+        raise RuntimeError("bookings file went away")
+    with pytest.raises(RuntimeError):
+        txrm_export.ExportLIMS(bookings(), str(output))
+    assert not output.exists() and not (tmp_path / "lims.xlsx.tmp").exists()
+
+
+def test_cli(make_txrm, tmp_path, capsys):
+    path = make_txrm()
+    output = tmp_path / "lims.csv"
+    assert txrm_export.main(["--map", f"{path}=1-2", "-o", str(output), "--excel"]) == 0
+    assert output.read_text(encoding="utf-8").startswith("\ufeff,Sample ID,")
+    assert capsys.readouterr().err.endswith(" rows for 2 samples, 0 scans failed\n")
+    with pytest.raises(SystemExit):
+        txrm_export.main(["--map", "1-2"])
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#txrm_gui_app.BatchQueue: worker limit, failures, retry and cancel, without a window
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+QtCore = pytest.importorskip("PySide6.QtCore")
+
+import txrm_batch
+import txrm_gui_app
+
+
+@pytest.fixture
+def queue():
+    #A BatchQueue on a thread pool (the jobs see monkeypatched functions) that records its signals
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    batch = txrm_gui_app.BatchQueue(workers=2)
+    batch.pool = ThreadPoolExecutor(max_workers=2)
+    batch.events = []
+    batch.started.connect(lambda row: batch.events.append(("started", row)))
+    batch.finished.connect(lambda row, status, feedback: batch.events.append(("finished", row, status)))
+    batch.idle.connect(lambda: batch.events.append(("idle",)))
+    batch.app = app
+    yield batch
+    batch.shutdown()
+
+
+def _wait(queue, condition, timeout: float = 5.0):
+    #Runs the event loop until condition() holds, so the queued result signals are delivered
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, queue.events
+        queue.app.processEvents()
+        time.sleep(0.001)
+
+
+def _job(path, tmp_path, row):
+    return (path, str(tmp_path / f"out{row}.csv"), [row], 15, 15, True)
+
+
+def test_failed_file_and_retry(queue, make_txrm, tmp_path):
+    good = make_txrm("good.txrm")
+    bad = tmp_path / "bad.txrm"
+    bad.write_bytes(b"not an OLE file")
+    queue.add(0, _job(good, tmp_path, 0))
+    queue.add(1, _job(str(bad), tmp_path, 1))
+    _wait(queue, lambda: ("idle",) in queue.events)
+    finished = {event[1]: event[2] for event in queue.events if event[0] == "finished"}
+    assert finished == {0: txrm_batch.STATUS_OK, 1: "FAILED: Unsupported file format."}
+    assert (tmp_path / "out0.csv").exists() and not queue.busy()
+    # Retry the failed row once the file is complete
+    make_txrm("bad.txrm")
+    queue.events.clear()
+    queue.add(1, _job(str(bad), tmp_path, 1))
+    _wait(queue, lambda: ("idle",) in queue.events)
+    assert queue.events == [("started", 1), ("finished", 1, txrm_batch.STATUS_OK), ("idle",)]
+
+
+def test_job_exception_is_reported(queue, monkeypatch, tmp_path):
+    def crash(job):
+        raise RuntimeError("worker died")
+    monkeypatch.setattr(txrm_batch, "WriteTable", crash)
+    queue.add(0, _job("x.txrm", tmp_path, 0))
+    _wait(queue, lambda: ("idle",) in queue.events)
+    assert ("finished", 0, "ERROR: RuntimeError: worker died") in queue.events
+
+
+def test_worker_limit_and_cancel(queue, monkeypatch, tmp_path):
+    release = threading.Event()
+    active, peak = [], []
+
+    def blocked(job):
+        active.append(job)
+        peak.append(len(active))
+        release.wait(5)
+        active.remove(job)
+        return job[0], job[1], txrm_batch.STATUS_OK, ""
+    monkeypatch.setattr(txrm_batch, "WriteTable", blocked)
+    for row in range(5):
+        queue.add(row, _job(f"{row}.txrm", tmp_path, row))
+    assert sorted(queue.running) == [0, 1] and [row for row, _ in queue.waiting] == [2, 3, 4]
+    assert queue.cancel() == [2, 3, 4]
+    assert not queue.waiting and queue.busy()
+    release.set()
+    _wait(queue, lambda: ("idle",) in queue.events)
+    finished = sorted(event[1:] for event in queue.events if event[0] == "finished")
+    assert finished == [(0, txrm_batch.STATUS_OK), (1, txrm_batch.STATUS_OK)]
+    assert [event for event in queue.events if event[0] == "started"] == [("started", 0), ("started", 1)]
+    assert max(peak) <= 2 and not queue.busy()
+
+
+def test_cancel_when_idle(queue):
+    assert queue.cancel() == []
+    queue.app.processEvents()
+    assert queue.events == [("idle",)]
+
+
+def test_set_workers_replaces_an_idle_pool(queue):
+    pool = queue.pool
+    queue.set_workers(3)
+    assert queue.workers == 3 and queue.pool is None
+    queue.set_workers(0)
+    assert queue.workers == 1
+    pool.shutdown()
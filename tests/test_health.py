@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#Scan health: TXRMParams.ReadProjectionArrays, ScanHealth and ExtractScanHealth
+
+import numpy as np
+import pytest
+
+import TXRMParams as tp
+
+
+def _arrays(angles, seconds, exptimes=None):
+    #ReadProjectionArrays-style arrays for the given angles (degrees) and timestamps (seconds from the start)
+    count = len(angles)
+    start = np.datetime64("2026-03-02T10:15:30.000", "ms")
+    return {"Angles": np.asarray(angles, dtype=np.float32),
+            "ExpTimes": np.asarray([2.0] * count if exptimes is None else exptimes, dtype=np.float32),
+            "XPosition": np.zeros(count, np.float32), "YPosition": np.linspace(0, 5, count, dtype=np.float32),
+            "ZPosition": np.zeros(0, np.float32),
+            "Dates": start + (np.asarray(seconds) * 1000).astype("timedelta64[ms]"), "NoOfImages": count}
+
+
+def test_regular_scan(make_txrm):
+    arrays, health = tp.ExtractScanHealth(make_txrm(images=6, width=8, height=8))
+    assert len(arrays["Angles"]) == len(arrays["Dates"]) == health["projections"] == 6
+    assert health["angle_step"] == pytest.approx(60.0) and health["angular_coverage"] == pytest.approx(360.0)
+    assert health["dropped_frames"] == 0 and health["repeated_frames"] == 0
+    assert health["dwell_median"] == pytest.approx(3.01) and health["dwell_stalls"] == 0
+    assert health["scan_time_s"] == pytest.approx(5 * 3.01 + 3.01)
+    assert health["exposure_mean"] == pytest.approx(2.0, abs=0.02)
+
+
+def test_dropped_and_repeated_frames():
+    # 0, 1, 2, [3, 4 dropped], 5, 6, 6 (repeated), 7, 8
+    angles = [0, 1, 2, 5, 6, 6, 7, 8]
+    health = tp.ScanHealth(_arrays(angles, np.arange(len(angles)) * 3.0))
+    assert health["angle_step"] == pytest.approx(1.0)
+    assert health["dropped_frames"] == 2
+    assert health["repeated_frames"] == 1
+    assert health["max_angle_gap"] == pytest.approx(3.0)
+    assert health["angular_range"] == pytest.approx(8.0)
+
+
+def test_wrapped_angles_are_unwrapped():
+    health = tp.ScanHealth(_arrays([170, 175, -180, -175, -170], [0, 1, 2, 3, 4]))
+    assert health["angle_step"] == pytest.approx(5.0)
+    assert health["dropped_frames"] == 0 and health["angular_range"] == pytest.approx(20.0)
+
+
+def test_dwell_and_stalls():
+    seconds = [0, 3, 6, 15, 18, 21]
+    health = tp.ScanHealth(_arrays(range(6), seconds, exptimes=[2.0, 2.0, 2.0, 2.5, 2.5, 2.5]))
+    assert health["dwell_median"] == pytest.approx(3.0)
+    assert (health["dwell_min"], health["dwell_max"]) == (pytest.approx(3.0), pytest.approx(9.0))
+    assert health["dwell_mean"] == pytest.approx(21 / 5)
+    assert health["dwell_stalls"] == 1
+    assert health["dwell_overhead_mean"] == pytest.approx(21 / 5 - (3 * 2.0 + 2 * 2.5) / 5)
+    assert health["scan_time_s"] == pytest.approx(24.0)
+    assert health["exposure_drift"] > 0
+    assert health["YPosition_travel"] == pytest.approx(5.0)
+    assert "ZPosition_travel" not in health
+
+
+def test_single_projection():
+    health = tp.ScanHealth(_arrays([0], [0]))
+    assert health["projections"] == 1 and health["exposure_mean"] == pytest.approx(2.0)
+    assert "angle_step" not in health and "dwell_mean" not in health and "exposure_drift" not in health
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#txrm_index: query operators, failed files and incremental updates
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import txrm_index
+from conftest import bump_mtime
+
+
+@pytest.fixture
+def archive(make_txrm, tmp_path):
+    #Four scans and a file that fails to extract, indexed once
+    make_txrm("archive/a.txrm", voltage=80.0, filt="LE3", pixel=0.5, start=datetime(2026, 6, 1, 9, 0, 0))
+    make_txrm("archive/b.txrm", voltage=80.0, filt="HE1", pixel=1.5, start=datetime(2026, 7, 2, 9, 0, 0))
+    make_txrm("archive/sub/c.txrm", voltage=120.0, filt="LE3", pixel=0.75, start=datetime(2026, 8, 3, 9, 0, 0))
+    make_txrm("archive/sub/d.txrm", voltage=140.0, filt="LE4", pixel=3.0, start=datetime(2026, 9, 4, 9, 0, 0))
+    (tmp_path / "archive" / "bad.txrm").write_bytes(b"not an OLE file")
+    index = txrm_index.ArchiveIndex(tmp_path / "archive.idx")
+    counts = index.Update(str(tmp_path / "archive"), Workers=1)
+    assert counts == dict(added=5, updated=0, removed=0, unchanged=0, failed=1)
+    return index
+
+
+def _names(index, *conditions, **kwargs):
+    return sorted(os.path.basename(row["path"]) for row in index.Rows(index.Query(*conditions, **kwargs), ["path"]))
+
+
+def test_query_operators(archive):
+    assert _names(archive, "Voltage==80") == ["a.txrm", "b.txrm"]
+    assert _names(archive, "Voltage = 80") == ["a.txrm", "b.txrm"]
+    assert _names(archive, "Voltage!=80") == ["c.txrm", "d.txrm"]
+    assert _names(archive, "PixelSize<0.75") == ["a.txrm"]
+    assert _names(archive, "PixelSize<=0.75") == ["a.txrm", "c.txrm"]
+    assert _names(archive, "PixelSize>1.5") == ["d.txrm"]
+    assert _names(archive, "PixelSize>=1.5") == ["b.txrm", "d.txrm"]
+    assert _names(archive, "SourceFilter~LE") == ["a.txrm", "c.txrm", "d.txrm"]
+    assert _names(archive, "Date>=2026-07-01", "Date<2026-09-01") == ["b.txrm", "c.txrm"]
+    assert _names(archive, ("Voltage", ">", 100), SourceFilter="LE3") == ["c.txrm"]
+    assert _names(archive, "DateHours<1") == ["a.txrm", "b.txrm", "c.txrm", "d.txrm"]
+
+
+def test_failed_files(archive):
+    assert _names(archive) == ["a.txrm", "b.txrm", "c.txrm", "d.txrm"]
+    assert _names(archive, include_failed=True) == ["a.txrm", "b.txrm", "bad.txrm", "c.txrm", "d.txrm"]
+    assert _names(archive, "ok==false", include_failed=True) == ["bad.txrm"]
+    assert _names(archive, "Voltage<1000", include_failed=True) == ["a.txrm", "b.txrm", "c.txrm", "d.txrm"]
+
+
+def test_bad_conditions(archive):
+    with pytest.raises(ValueError):
+        archive.Query("Voltage")
+    with pytest.raises(ValueError):
+        archive.Query("Voltage~80")
+    with pytest.raises(KeyError):
+        archive.Query("Nope==1")
+
+
+def test_rows(archive):
+    [row] = archive.Rows(archive.Query("SourceFilter==HE1"), ["Voltage", "SourceFilter", "Date", "ok"])
+    assert row == {"Voltage": 80.0, "SourceFilter": "HE1", "Date": "2026-07-02T09:00:00.000", "ok": True}
+
+
+def test_incremental_update(archive, make_txrm, tmp_path):
+    reopened = txrm_index.ArchiveIndex(archive.path)
+    assert len(reopened) == 5
+    counts = reopened.Update(str(tmp_path / "archive"), Workers=1)
+    assert counts == dict(added=0, updated=0, removed=0, unchanged=5, failed=0)  # bad.txrm is not retried
+    changed = make_txrm("archive/a.txrm", voltage=100.0)
+    bump_mtime(changed)
+    os.remove(tmp_path / "archive" / "sub" / "d.txrm")
+    make_txrm("archive/e.txrm", voltage=160.0)
+    counts = reopened.Update(str(tmp_path / "archive"), Workers=1)
+    assert counts == dict(added=1, updated=1, removed=1, unchanged=3, failed=0)
+    assert _names(reopened, "Voltage>=100") == ["a.txrm", "c.txrm", "e.txrm"]
+    paths = np.asarray(reopened.column("path"))
+    assert list(paths) == sorted(paths)
+    assert not os.path.exists(archive.path + ".tmp") and not os.path.exists(archive.path + ".old")
+
+
+def test_rows_outside_the_roots_are_kept(archive, tmp_path):
+    counts = archive.Update(str(tmp_path / "archive" / "sub"), Workers=1)
+    assert counts["unchanged"] == 2 and counts["removed"] == 0
+    assert len(archive) == 5
+
+
+def test_cli_query(archive, capsys):
+    assert txrm_index.main(["query", archive.path, "Voltage==80", "--count"]) == 0
+    assert capsys.readouterr().out == "2\n"
+    assert txrm_index.main(["query", archive.path, "SourceFilter==LE4", "--columns", "Voltage,PixelSize"]) == 0
+    assert capsys.readouterr().out == "Voltage,PixelSize\n140.0,3.0\n"
+    assert txrm_index.main(["query", archive.path, "Voltage~80"]) == 2
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#The header-only reader (txrm_ole.LazyOleFile) against olefile on the same files
+
+import pytest
+
+import TXRMParams as tp
+import txrm_ole
+
+olefile = pytest.importorskip("olefile")
+
+
+@pytest.mark.parametrize("fragment", [False, True])
+def test_streams_match_olefile(make_txrm, fragment):
+    path = make_txrm(fragment=fragment, images=3, width=40, height=24)
+    with olefile.OleFileIO(path) as reference, txrm_ole.LazyOleFile(path) as lazy:
+        streams = ["/".join(entry) for entry in reference.listdir()]
+        assert streams
+        for name in streams:
+            assert lazy.exists(name)
+            assert lazy.openstream(name).read() == reference.openstream(name).read(), name
+
+
+@pytest.mark.parametrize("fragment", [False, True])
+def test_extracted_values_match(make_txrm, fragment):
+    path = make_txrm(fragment=fragment, voltage=140.0, stitches=2)
+    lazy, _ = tp.ExtractParams(path, ReadOnly=True)
+    full, _ = tp.ExtractParams(path, ReadOnly=False)
+    assert lazy is not None and full is not None
+    assert lazy.values == full.values
+    assert lazy.ToLIMS([1000]) == full.ToLIMS([1000])
+
+
+def test_truncated_file(make_txrm):
+    path = make_txrm(images=1)
+    with open(path, "r+b") as f:
+        f.truncate(300)
+    scan, feedback = tp.ExtractParams(path, ReadOnly=True)
+    assert scan is None
+    assert "Unsupported file format" in feedback
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#The declarative parameter schema: PARAM_FIELDS, site fields and the feedback
+
+import json
+
+import pytest
+
+import TXRMParams as tp
+import synth_txrm
+
+
+def _write(path, missing=()):
+    #A synthetic scan without the streams in missing
+    streams = synth_txrm.ScanStreams(images=3, width=8, height=8)
+    for name in missing:
+        del streams[name]
+    synth_txrm.WriteOle(str(path), streams)
+    return str(path)
+
+
+def test_feedback_uses_labels(make_txrm):
+    _, feedback = tp.ExtractParams(make_txrm(stitches=2), ReadOnly=True)
+    lines = feedback.splitlines()
+    assert "Power: 7.0 W" in lines
+    assert "Filter: LE3" in lines
+    assert "Num Images: 4" in lines
+    assert "NumStitch: 2" in lines
+    assert any(line.startswith("Start, end time: ") for line in lines)
+    assert not any(line.startswith(("SrcPower", "NoOfImages", "SourceFilter")) for line in lines)
+
+
+def test_missing_required_field(tmp_path):
+    path = _write(tmp_path / "scan.txrm", ["AcquisitionSettings/SrcPower"])
+    scan, feedback = tp.ExtractParams(path, ReadOnly=True)
+    assert scan is None
+    assert feedback.endswith("Could not find Power. Terminating...")
+
+
+def test_missing_optional_field_takes_default(make_txrm):
+    scan, feedback = tp.ExtractParams(make_txrm(), ReadOnly=True)
+    assert scan["NumSegments"] == 1
+    assert "Could not find NumStitch - using 1." in feedback.splitlines()
+    assert ("Number of stitches", "1") in scan.Components()
+
+
+def test_unlabelled_field_uses_its_name():
+    assert tp.ParamField("Extra", "ImageInfo/Extra").label is None
+    field = tp.ParamField("Voltage", "ImageInfo/Voltage", "float32", "kV", component="Voltage")
+    assert field == tp.PARAM_FIELDS[0]
+
+
+@pytest.fixture
+def site_fields(tmp_path):
+    path = tmp_path / "fields.json"
+    path.write_text(json.dumps([
+        {"name": "XrayMagnification", "path": "ImageInfo/XrayMagnification", "dtype": "float32",
+         "required": False, "formatter": "{:.2f}", "component": "Magnification", "label": "Mag"},
+        {"name": "Missing", "path": "ImageInfo/NotThere", "required": False, "default": 0, "component": "Missing"},
+    ]))
+    return str(path)
+
+
+def test_load_fields(site_fields):
+    fields = tp.LoadFields(site_fields)
+    assert [field.name for field in fields] == ["XrayMagnification", "Missing"]
+    assert fields[0].label == "Mag" and fields[0].dtype == "float32"
+    assert fields[1].dtype == "float32" and fields[1].required is False
+
+
+def test_site_fields_from_environment(site_fields, make_txrm, monkeypatch):
+    path = make_txrm()
+    assert tp.DefaultFields() is tp.PARAM_FIELDS
+    monkeypatch.setenv("TXRM_PARAMS_FIELDS", site_fields)
+    fields = tp.DefaultFields()
+    assert fields[:len(tp.PARAM_FIELDS)] == tp.PARAM_FIELDS and len(fields) == len(tp.PARAM_FIELDS) + 2
+    scan, feedback = tp.ExtractParams(path, ReadOnly=True)
+    assert scan["XrayMagnification"] == pytest.approx(4.0)
+    assert "Mag: 4.0" in feedback.splitlines()
+    components = dict(scan.Components())
+    assert components["Magnification"] == "4.00"
+    assert components["Missing"] == "0"
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#QC previews: strided row reads and txrm_preview
+
+import os
+
+import numpy as np
+import pytest
+
+import TXRMParams as tp
+import synth_txrm
+import txrm_batch
+import txrm_ole
+import txrm_preview
+
+
+@pytest.mark.parametrize("readonly", [True, False])
+@pytest.mark.parametrize("rows", [slice(2, 9), slice(1, 12, 3), slice(0, 40, 13), slice(5, 5)])
+def test_row_reads_match_whole_image(make_txrm, readonly, rows):
+    # Steps of 3 rows read one band; rows 13 apart (6 kB) are read one at a time
+    path = make_txrm(images=2, width=128, height=40, dtype="float32")
+    with tp.OpenOle(path, readonly) as ole:
+        image = tp.GetFloatImage(ole, "ImageData1/Image2", (40, 128), "float32")
+        selected = tp.GetFloatImage(ole, "ImageData1/Image2", (40, 128), "float32", rows)
+    np.testing.assert_array_equal(selected, image[rows])
+
+
+@pytest.mark.parametrize("rows", [slice(6, 10), slice(0, 10, 3), slice(0, 10, 9)])
+def test_short_rows_raise(make_txrm, rows):
+    path = make_txrm(images=1, width=16, height=8)
+    with tp.OpenOle(path, True) as ole:
+        with pytest.raises(txrm_ole.OleFormatError):
+            tp.GetFloatImage(ole, "ImageData1/Image1", (10, 16), "uint16", rows)
+
+
+def test_make_preview_reads_only_rows(make_txrm):
+    path = make_txrm(images=40, width=512, height=256)
+    with txrm_ole.LazyOleFile(path) as ole:
+        image = txrm_preview.MakePreview(ole)
+        read = ole.bytes_read
+    # Four 128 x 64 thumbnails with gaps above a sinogram strip of the 256 detector rows shrunk by 4
+    assert image.dtype == np.uint8
+    assert image.shape == (64 + txrm_preview.GAP + 128, 4 * 128 + 3 * txrm_preview.GAP)
+    assert read < os.path.getsize(path) // 4
+    with tp.OpenOle(path, False) as ole:
+        np.testing.assert_array_equal(txrm_preview.MakePreview(ole), image)
+
+
+def test_flat_image(make_txrm, tmp_path):
+    # 600 pixels wide but 2 high: the column step may not exceed the height
+    path = make_txrm(images=3, width=600, height=2)
+    previewer = txrm_preview.Previewer(str(tmp_path / "previews"))
+    assert previewer.Ensure(path) is not None
+    assert previewer.failed == []
+
+
+def _malformed(path):
+    #A scan whose first ImageData entry is a storage, not a stream
+    streams = synth_txrm.ScanStreams(images=2, width=8, height=8)
+    del streams["ImageData1/Image1"]
+    streams["ImageData1/Image1/Inner"] = b"x" * 16
+    synth_txrm.WriteOle(str(path), streams)
+    return str(path)
+
+
+def test_failed_preview_keeps_the_row(tmp_path):
+    path = _malformed(tmp_path / "scan.txrm")
+    previews = str(tmp_path / "previews")
+    previewer = txrm_preview.Previewer(previews)
+    assert previewer.Ensure(path) is None
+    assert previewer.failed[0][0] == path
+    _, _, rows, status = txrm_batch.ExtractFile((path, 5, 15, 15, True, None, previews))
+    assert status == txrm_batch.STATUS_OK
+    assert "Voltage" in rows
+
+
+def test_preview_is_cached(make_txrm, tmp_path):
+    path = make_txrm(images=4, width=32, height=32)
+    previewer = txrm_preview.Previewer(str(tmp_path / "previews"))
+    target = previewer.Ensure(path)
+    assert os.stat(target).st_mtime_ns == os.stat(path).st_mtime_ns
+    assert previewer.Ensure(path) == target
+    assert previewer.written == 1
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#Projection images: TXRMParams.GetFloatImage and txrm_projections
+
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import TXRMParams as tp
+import txrm_ole
+import txrm_projections
+
+
+@pytest.mark.parametrize("readonly", [True, False])
+def test_whole_image(make_txrm, readonly):
+    path = make_txrm(images=2, width=16, height=12)
+    with tp.OpenOle(path, readonly) as ole:
+        image = tp.GetFloatImage(ole, "ImageData1/Image2", (12, 16), "uint16")
+    assert image.shape == (12, 16)
+    assert np.all(image[:, 4:] == 1)
+    np.testing.assert_array_equal(image[:, 0], np.arange(12))
+
+
+@pytest.mark.parametrize("readonly", [True, False])
+def test_short_image_raises(make_txrm, readonly):
+    path = make_txrm(images=1, width=16, height=8)
+    with tp.OpenOle(path, readonly) as ole:
+        with pytest.raises(txrm_ole.OleFormatError):
+            tp.GetFloatImage(ole, "ImageData1/Image1", (9, 16), "uint16")
+
+
+def _expected(count, height, width, dtype):
+    #The synthetic projections: image k is k everywhere except the row index in columns 0..3
+    images = np.empty((count, height, width), dtype=dtype)
+    images[:] = np.arange(count, dtype=dtype)[:, None, None]
+    images[:, :, :4] = np.arange(height, dtype=dtype)[None, :, None]
+    return images
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_contiguous_projections(make_txrm, use_mmap):
+    path = make_txrm(images=3, width=64, height=48)
+    with txrm_projections.ProjectionReader(path, use_mmap=use_mmap) as reader:
+        assert len(reader) == 3 and reader.shape == (48, 64) and reader.dtype == np.uint16
+        assert reader.is_contiguous(1)
+        image = reader[1]
+        assert isinstance(image.base, np.memmap) == use_mmap
+        assert image.flags.writeable != use_mmap
+        np.testing.assert_array_equal(image, _expected(3, 48, 64, np.uint16)[1])
+        np.testing.assert_array_equal(reader[-1], _expected(3, 48, 64, np.uint16)[2])
+
+
+def test_fragmented_projections_are_gathered(make_txrm):
+    path = make_txrm(images=3, width=64, height=48, fragment=True)
+    expected = _expected(3, 48, 64, np.uint16)
+    with txrm_projections.ProjectionReader(path) as reader:
+        assert not reader.is_contiguous(0) and len(reader.runs(0)) > 1
+        image = reader.read(0)
+        assert not isinstance(image.base, np.memmap)
+        np.testing.assert_array_equal(image, expected[0])
+        np.testing.assert_array_equal(reader.read_stack([2, 0]), expected[[2, 0]])
+    np.testing.assert_array_equal(txrm_projections.ReadProjections(path), expected)
+
+
+def test_float32_projections(make_txrm):
+    path = make_txrm(images=2, width=32, height=40, dtype="float32")
+    with txrm_projections.ProjectionReader(path) as reader:
+        assert reader.dtype == np.float32 and reader.image_bytes == 32 * 40 * 4
+        np.testing.assert_array_equal(reader.read_stack(), _expected(2, 40, 32, np.float32))
+
+
+def test_mini_stream_projections(make_txrm):
+    path = make_txrm(images=2, width=16, height=8)
+    with txrm_projections.ProjectionReader(path) as reader:
+        assert not reader.is_contiguous(0)
+        np.testing.assert_array_equal(reader.read_stack(), _expected(2, 8, 16, np.uint16))
+
+
+def test_projection_reader_errors(make_txrm):
+    path = make_txrm(images=2, width=64, height=48)
+    with txrm_projections.ProjectionReader(path) as reader:
+        with pytest.raises(IndexError):
+            reader.read(2)
+        with pytest.raises(ValueError):
+            reader.read(0, out=np.empty((48, 64), dtype=np.float32))
+        out = np.zeros((48, 64), dtype=np.uint16)
+        assert reader.read(1, out=out) is out and out[0, 10] == 1
+
+
+def _prefetch_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "txrm-prefetch"]
+
+
+def test_iter_projections_in_order(make_txrm):
+    path = make_txrm(images=11, width=16, height=8)
+    chunks = list(txrm_projections.IterProjections(path, chunk=3, start=1, stop=10))
+    assert [chunk.start for chunk in chunks] == [1, 4, 7]
+    stack = np.concatenate([chunk.images for chunk in chunks])
+    np.testing.assert_array_equal(stack[:, 0, 5], np.arange(1, 10))
+    angles = np.concatenate([chunk.angles for chunk in chunks])
+    np.testing.assert_allclose(angles, np.linspace(-180.0, 180.0, 11, endpoint=False)[1:10])
+    times = np.concatenate([chunk.timestamps for chunk in chunks])
+    assert len(times) == 9 and np.all(np.diff(times) > np.timedelta64(0, "ms"))
+    assert not _prefetch_threads()
+
+
+def test_iter_projections_cancel(make_txrm):
+    path = make_txrm(images=50, width=64, height=64)
+    projections = txrm_projections.IterProjections(path, chunk=2, prefetch_bytes=1)
+    assert next(projections).start == 0
+    assert _prefetch_threads()
+    projections.close()
+    assert not _prefetch_threads()
+
+
+def test_iter_projections_stays_within_budget(make_txrm, monkeypatch):
+    path = make_txrm(images=40, width=32, height=32)
+    chunk_bytes = 2 * 32 * 32 * 2
+    read = []
+    read_stack = txrm_projections.ProjectionReader.read_stack
+    monkeypatch.setattr(txrm_projections.ProjectionReader, "read_stack",
+                        lambda self, indices=None, out=None: read.append(1) or read_stack(self, indices, out))
+    alive = []
+    for k, chunk in enumerate(txrm_projections.IterProjections(path, chunk=2, prefetch_bytes=5 * chunk_bytes)):
+        time.sleep(0.01)  # let the reader fill the queue
+        alive.append(len(read) - k)  # read so far, less the chunks already consumed and dropped
+        del chunk
+    assert len(alive) == 20
+    assert max(alive) == 5
+
+
+def test_iter_projections_reraises(make_txrm):
+    path = make_txrm(images=4, width=16, height=8)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 200)
+    with pytest.raises(ValueError):
+        list(txrm_projections.IterProjections(path, chunk=1))
+    assert not _prefetch_threads()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#ScanParams: LIMS rows and the CSV/JSON/Parquet exports of WriteScanParams
+
+import csv
+import io
+import json
+
+import pytest
+
+import TXRMParams as tp
+
+
+@pytest.fixture
+def scans(make_txrm):
+    #Two scans that differ in voltage and pixel size
+    paths = [make_txrm("a.txrm", voltage=80.0, pixel=0.3), make_txrm("b.txrm", voltage=120.0, pixel=0.75)]
+    return [tp.ExtractParams(path, ReadOnly=True)[0] for path in paths]
+
+
+def test_lims_rows(scans):
+    table = scans[0].ToLIMS([7, 8], Altime=10, Proctime=20, header=True)
+    rows = list(csv.reader(io.StringIO(table)))
+    assert rows[0] == ["", "Sample ID", "Phase", "Analysis", "Component Name", "Value"]
+    components = scans[0].Components(10, 20)
+    assert [row[1] for row in rows[1:]] == ["7"] * len(components) + ["8"] * len(components)
+    assert [(row[4], row[5]) for row in rows[1:len(components) + 1]] == components
+    assert ("Voltage", "80") in components and ("Pixel Size", "0.30") in components
+    assert ("Alignment time", "10") in components and ("Processing Time", "20") in components
+    assert table == tp.FormatScan(scans[0], [7, 8], 10, 20, header=True)
+
+
+def test_csv_and_json(scans):
+    csvfile, jsonfile = io.StringIO(), io.StringIO()
+    assert tp.WriteScanParams(scans, [[1], [2, 3]], csvfile=csvfile, jsonfile=jsonfile) == 2
+    rows = list(csv.DictReader(io.StringIO(csvfile.getvalue())))
+    voltages = [(row["Sample ID"], row["Value"]) for row in rows if row["Component Name"] == "Voltage"]
+    assert voltages == [("1", "80"), ("2", "120"), ("3", "120")]
+    records = json.loads(jsonfile.getvalue())
+    assert [record["file"] for record in records] == [scan.path for scan in scans]
+    assert records[0]["params"]["PixelSize"] == 0.3  # float32 precision, not 0.30000001192092896
+    assert records[1]["params"]["NoOfImages"] == 4
+    assert len(records[0]["params"]["Date"]) == 2
+
+
+def test_json_keeps_float32_values(scans):
+    params = scans[0].ToDict()["params"]
+    assert scans[0]["PixelSize"] == pytest.approx(0.3) and scans[0]["PixelSize"] != 0.3
+    assert params["PixelSize"] == 0.3 and params["ExpTime"] == 2.0
+
+
+def test_parquet(scans, tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "scans.parquet"
+    assert tp.WriteScanParams(scans, parquetfile=str(path)) == 2
+    table = pyarrow_parquet.read_table(str(path)).to_pylist()
+    assert [row["file"] for row in table] == [scan.path for scan in scans]
+    assert [row["PixelSize"] for row in table] == [0.3, 0.75]
+    assert [row["Voltage"] for row in table] == [80.0, 120.0]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#txrm_segments: which files named as segments are grouped into one acquisition
+
+import os
+
+import txrm_segments
+
+
+def test_stitched_segments_are_grouped(make_txrm):
+    paths = [make_txrm(f"scan_{k:02d}.txrm", stitches=3, voltage=80.0 + k) for k in (1, 2, 3)]
+    segments, companions = txrm_segments.FindSegments(paths[1])
+    assert segments == paths
+    assert companions == []
+    acquisition, _ = txrm_segments.ExtractAcquisition(paths[0], Reconstructions=False)
+    assert len(acquisition.segments) == 3
+    assert acquisition.Totals()["projections"] == 12
+    assert acquisition.Values()["NumSegments"] == 3
+    assert "Voltage" in acquisition.Differences()
+
+
+def test_missing_segment_keeps_recorded_count(make_txrm):
+    paths = [make_txrm(f"scan_{k:02d}.txrm", stitches=3) for k in (1, 2)]
+    acquisition, feedback = txrm_segments.ExtractAcquisition(paths[0], Reconstructions=False)
+    assert len(acquisition.segments) == 2
+    assert acquisition.Values()["NumSegments"] == 3
+    assert "2 of 3" in feedback
+
+
+def test_separate_scans_stay_separate(make_txrm):
+    # rock_1 and rock_2 look like segments by name, but neither records a stitch
+    paths = [make_txrm(f"rock_{k}.txrm") for k in (1, 2)]
+    assert txrm_segments.FindSegments(paths[0]) == ([paths[0]], [])
+    acquisition, _ = txrm_segments.ExtractAcquisition(paths[1], Reconstructions=False)
+    assert [scan.path for scan in acquisition.segments] == [paths[1]]
+
+
+def test_disagreeing_counts_stay_separate(make_txrm):
+    first = make_txrm("core_1.txrm", stitches=2)
+    make_txrm("core_2.txrm", stitches=3)
+    assert txrm_segments.FindSegments(first)[0] == [first]
+
+
+def test_corrupt_segment_is_reported(make_txrm):
+    paths = [make_txrm(f"st_{k:02d}.txrm", stitches=3) for k in (1, 2, 3)]
+    with open(paths[2], "r+b") as f:
+        f.truncate(os.path.getsize(paths[2]) // 2)
+    acquisition, feedback = txrm_segments.ExtractAcquisition(paths[0], Reconstructions=False)
+    assert len(acquisition.segments) == 2
+    assert [path for path, _ in acquisition.failed] == [paths[2]]
+    assert "st_03.txrm" in feedback
+
+
+def test_companion_reconstruction(make_txrm):
+    paths = [make_txrm(f"scan_{k:02d}.txrm", stitches=2) for k in (1, 2)]
+    recon = make_txrm("scan_recon.txm")
+    assert txrm_segments.FindSegments(recon) == (paths, [recon])
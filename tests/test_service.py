@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#txrm_service: status codes of well-formed and malformed requests against a running service
+
+import asyncio
+import json
+
+import pytest
+
+import txrm_service
+
+
+async def _raw(port, data: bytes):
+    #Sends raw bytes and returns (status, response body)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(data)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await reader.readexactly(length))
+    finally:
+        writer.close()
+
+
+def _post(body, length=None, target="/extract"):
+    body = body if isinstance(body, bytes) else json.dumps(body).encode()
+    length = len(body) if length is None else length
+    return (f"POST {target} HTTP/1.1\r\nHost: test\r\nContent-Length: {length}\r\n"
+            f"Connection: close\r\n\r\n").encode() + body
+
+
+@pytest.fixture(scope="module")
+def exchange():
+    #exchange(data) sends raw bytes to one service shared by the module's tests
+    loop = asyncio.new_event_loop()
+    service = txrm_service.ExtractionService(workers=1)
+    loop.run_until_complete(service.start(port=0))
+    yield lambda data: loop.run_until_complete(_raw(service.port, data))
+    loop.run_until_complete(service.close())
+    loop.close()
+
+
+def test_extract(exchange, make_txrm):
+    path = make_txrm()
+    status, response = exchange(_post({"path": path, "samples": [1000, 1001]}))
+    assert status == 200
+    assert response["status"] == "OK"
+    samples = {line.split(",")[1] for line in response["rows"].splitlines()}
+    assert samples == {"1000", "1001"}
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_bad_content_length(exchange, length):
+    status, response = exchange(_post(b"{}", length))
+    assert status == 400
+    assert "Content-Length" in response["error"]
+
+
+def test_long_request_line(exchange):
+    status, response = exchange(b"GET /" + b"x" * 70000 + b" HTTP/1.1\r\n\r\n")
+    assert status == 400
+    assert "too long" in response["error"]
+
+
+def test_long_header_line(exchange):
+    status, _ = exchange(b"GET /health HTTP/1.1\r\nX-Long: " + b"x" * 70000 + b"\r\n\r\n")
+    assert status == 431
+
+
+@pytest.mark.parametrize("count, expected", [(txrm_service.MAX_HEADERS - 1, 200), (txrm_service.MAX_HEADERS + 1, 431)])
+def test_header_count(exchange, count, expected):
+    headers = "".join(f"X-{k}: {k}\r\n" for k in range(count))
+    status, _ = exchange(f"GET /health HTTP/1.1\r\nConnection: close\r\n{headers}\r\n".encode())
+    assert status == expected
+
+
+def test_body_too_large(exchange):
+    status, _ = exchange(_post(b"", txrm_service.MAX_BODY + 1))
+    assert status == 413
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b"[1, 2]",
+    {"samples": [1000]},
+    {"path": "x.txrm", "samples": []},
+    {"path": "x.txrm", "samples": [1000], "altime": "x"},
+    {"path": "x.txrm", "samples": [1000], "proctime": True},
+])
+def test_bad_body(exchange, body):
+    status, response = exchange(_post(body))
+    assert status == 400
+    assert response["status"] == "FAILED"
+
+
+def test_missing_file(exchange, tmp_path):
+    status, response = exchange(_post({"path": str(tmp_path / "absent.txrm"), "samples": [1]}))
+    assert status == 422
+    assert "does not exist" in response["feedback"]
+
+
+def test_unknown_endpoint_and_method(exchange):
+    assert exchange(_post({}, target="/nowhere"))[0] == 404
+    assert exchange(b"GET /extract HTTP/1.1\r\nConnection: close\r\n\r\n")[0] == 405
+    status, health = exchange(b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status == 200 and health["restarts"] == 0
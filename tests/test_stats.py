@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#txrm_stats: per-stage timings, the Prometheus dump and the CLI --stats option
+
+import pytest
+
+import TXRMParams as tp
+import txrm_cli
+import txrm_stats
+
+
+def _metrics(text):
+    #{metric line name: value} of a Prometheus dump, without the HELP/TYPE comments
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if not line.startswith("#")}
+
+
+class _OrderedStats(txrm_stats.ExtractionStats):
+    #Records which stages were added after the current file ended
+    def __init__(self):
+        super().__init__()
+        self.late = []
+        self.ended = False
+
+    def begin(self, path):
+        self.ended = False
+        return super().begin(path)
+
+    def end(self, ok):
+        self.ended = True
+        super().end(ok)
+
+    def add(self, stage, seconds):
+        if self.ended:
+            self.late.append(stage)
+        super().add(stage, seconds)
+
+
+def test_stages_are_recorded(make_txrm):
+    stats = _OrderedStats()
+    path = make_txrm()
+    table, _ = tp.SampleParams(path, "1000", ReadOnly=True, Stats=stats)
+    assert table is not None
+    [record] = stats.files
+    assert record.path == path and record.ok and not record.cache_hit
+    assert record.streams > 0 and record.file_bytes_read > 0 and record.reads > 0
+    assert record.stages["format"] > 0
+    assert stats.late == []  # the "format" stage falls inside the file's wall time
+
+
+def test_failed_file_is_counted(make_txrm, tmp_path):
+    stats = txrm_stats.ExtractionStats()
+    bad = tmp_path / "bad.txrm"
+    bad.write_bytes(b"not an OLE file")
+    tp.MakeTable(make_txrm(), [1, 2], ReadOnly=True, Stats=stats)
+    assert tp.MakeTable(str(bad), [3], ReadOnly=True, Stats=stats)[0] is None
+    summary = stats.Summary()
+    assert summary["files"] == 2 and summary["failed"] == 1
+    assert summary["seconds"] == pytest.approx(sum(f.seconds for f in stats.files))
+
+
+def test_prometheus(make_txrm, tmp_path):
+    stats = txrm_stats.ExtractionStats()
+    path = make_txrm()
+    cache = str(tmp_path / "cache.sqlite")
+    tp.ExtractParams(path, ReadOnly=True, Cache=cache, Stats=stats)
+    tp.ExtractParams(path, ReadOnly=True, Cache=cache, Stats=stats)
+    text = stats.ToPrometheus(prefix="x")
+    assert text.endswith("\n")
+    assert "# TYPE x_stage_seconds_total counter" in text
+    metrics = _metrics(text)
+    assert metrics['x_files_total{result="ok"}'] == 2 and metrics['x_files_total{result="failed"}'] == 0
+    assert metrics["x_cache_hits_total"] == 1
+    assert metrics["x_streams_total"] == stats.files[0].streams
+    assert {name for name in metrics if name.startswith("x_stage_seconds_total")} == \
+        {f'x_stage_seconds_total{{stage="{stage}"}}' for stage in txrm_stats.STAGES}
+    assert metrics["x_extract_seconds_total"] == pytest.approx(stats.Summary()["seconds"], abs=1e-6)
+
+
+def test_cli_stats(make_txrm, tmp_path, monkeypatch):
+    created = []
+    monkeypatch.setattr(txrm_stats, "ExtractionStats", lambda: created.append(_OrderedStats()) or created[-1])
+    paths = [make_txrm("a.txrm"), make_txrm("b.txrm")]
+    prom = tmp_path / "metrics.prom"
+    assert txrm_cli.main(paths + ["-o", str(tmp_path / "out.csv"), "--stats", str(prom)]) == 0
+    metrics = _metrics(prom.read_text())
+    assert metrics['txrm_files_total{result="ok"}'] == 2
+    assert metrics['txrm_stage_seconds_total{stage="format"}'] > 0
+    assert created[0].late == []
+
+
+def test_cli_stats_rejects_segments(make_txrm, tmp_path):
+    with pytest.raises(SystemExit):
+        txrm_cli.main([make_txrm(), "--segments", "--stats", str(tmp_path / "metrics.prom")])
+    assert not (tmp_path / "metrics.prom").exists()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#txrm_storage: block cache reads, backend request counts and extraction through Storage
+
+import io
+import os
+
+import pytest
+
+import TXRMParams as tp
+import txrm_storage
+
+
+class _Backend(txrm_storage.FileObjectBackend):
+    #An in-memory backend that records its requests
+    def __init__(self, data: bytes):
+        super().__init__(io.BytesIO(data))
+        self.calls = []
+
+    def read_at(self, offset, size):
+        self.calls.append((offset, size))
+        return super().read_at(offset, size)
+
+
+@pytest.fixture
+def data():
+    return os.urandom(10 * 1000 + 123)
+
+
+def test_round_trip(data):
+    reader = txrm_storage.BlockReader(_Backend(data), block_size=1000, cache_blocks=3, readahead=1, bypass=2500)
+    for offset, size in [(0, 10), (995, 10), (5000, 2600), (9990, 1000), (3, 2999), (10123, 5), (400, 0)]:
+        reader.seek(offset)
+        assert reader.read(size) == data[offset:offset + size]
+        assert reader.tell() == min(len(data), offset + size)
+    assert len(reader.blocks) <= 3
+    reader.seek(-5, io.SEEK_END)
+    assert reader.read() == data[-5:] and reader.read(1) == b""
+
+
+def test_missing_blocks_are_coalesced(data):
+    backend = _Backend(data)
+    reader = txrm_storage.BlockReader(backend, block_size=1000, cache_blocks=16, readahead=1, bypass=8000)
+    reader.seek(1500)
+    reader.read(1000)  # blocks 1-2, read ahead to block 3
+    assert backend.calls == [(1000, 3000)]
+    reader.seek(3100)
+    reader.read(100)  # block 3, from the read-ahead
+    assert len(backend.calls) == 1 and reader.hits == 1
+    reader.seek(0)
+    reader.read(6000)  # blocks 0 and 4-5 are missing: two runs, read-ahead after the last
+    assert backend.calls[1:] == [(0, 1000), (4000, 3000)]
+    reader.seek(9500)
+    reader.read(1000)  # read-ahead stops at the last block
+    assert backend.calls[-1] == (9000, 1123)
+    assert backend.requests == len(backend.calls) and backend.bytes == sum(size for _, size in backend.calls)
+
+
+def test_large_reads_bypass_the_cache(data):
+    backend = _Backend(data)
+    reader = txrm_storage.BlockReader(backend, block_size=1000, bypass=4000)
+    reader.seek(100)
+    assert reader.read(5000) == data[100:5100]
+    assert backend.calls == [(100, 5000)] and not reader.blocks
+
+
+def test_latency_backend(data, monkeypatch):
+    slept = []
+    monkeypatch.setattr(txrm_storage.time, "sleep", slept.append)
+    inner = _Backend(data)
+    backend = txrm_storage.LatencyBackend(inner, latency=0.02, bandwidth=1e6)
+    assert backend.size == len(data)
+    assert backend.read_at(10, 2000) == data[10:2010]
+    assert slept == [pytest.approx(0.022)]
+    assert backend.requests == 1 and backend.bytes == 2000
+
+
+def test_extract_through_storage(make_txrm):
+    path = make_txrm(images=20, width=64, height=64)
+    local, _ = tp.ExtractParams(path, ReadOnly=True)
+    opened = []
+
+    def backend(name):
+        opened.append(txrm_storage.LocalBackend(name))
+        return opened[-1]
+    storage = txrm_storage.Storage(backend, block_size=16 * 1024, readahead=1)
+    scan, feedback = tp.ExtractParams(path, Storage=storage)
+    assert scan.values == local.values
+    [backend] = opened
+    assert backend.fd is None  # closed with the reader
+    assert backend.requests <= 3  # header and directory, then the parameter streams
+    assert feedback.splitlines()[-1] == f"Storage: {backend.bytes} bytes in {backend.requests} requests"
+
+
+def test_storage_exists(make_txrm, tmp_path):
+    path = make_txrm()
+    assert txrm_storage.Storage().exists(path)
+    assert not txrm_storage.Storage().exists(str(tmp_path / "missing.txrm"))
+
+    class Remote(txrm_storage.LocalBackend):
+        exists = staticmethod(lambda name: name.endswith("remote.txrm"))
+    assert txrm_storage.Storage(Remote).exists("//share/remote.txrm")
+    scan, feedback = tp.ExtractParams(str(tmp_path / "missing.txrm"), Storage=txrm_storage.Storage(Remote))
+    assert scan is None and feedback == "File does not exist! Terminating..."
+
+
+def test_small_file_is_rejected(tmp_path):
+    path = tmp_path / "tiny.txrm"
+    path.write_bytes(b"\0" * 100)
+    scan, feedback = tp.ExtractParams(str(path), Storage=txrm_storage.Storage())
+    assert scan is None and feedback.startswith("Unsupported file format.")
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#txrm_verify: structural checks, fingerprints and the manifest
+
+import os
+import struct
+
+import txrm_ole
+import txrm_verify
+import synth_txrm
+from conftest import bump_mtime
+
+
+def _problems(path):
+    result = txrm_verify.VerifyFile(path)
+    return result["status"], result["problems"], result["projections"]
+
+
+def _entry_offset(path, name):
+    #File offset of the directory entry called name (its UTF-16 name field)
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = data.find((name + "\0").encode("utf-16-le"))
+    assert offset > 0 and offset % 128 == 0
+    return offset
+
+
+def test_intact(make_txrm):
+    path = make_txrm(images=5, width=64, height=32, fragment=True)
+    assert _problems(path) == (txrm_verify.STATUS_OK, [], 5)
+
+
+def test_truncated(make_txrm):
+    path = make_txrm(images=5, width=64, height=64)
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    status, problems, _ = _problems(path)
+    assert status == txrm_verify.STATUS_FAILED
+    assert any(problem.startswith(("header:", "chains:")) for problem in problems)
+
+
+def test_cross_linked(make_txrm):
+    path = make_txrm(images=3, width=64, height=64)
+    first = _entry_offset(path, "Image1")
+    second = _entry_offset(path, "Image2")
+    with open(path, "r+b") as f:
+        f.seek(first + 116)
+        start = f.read(4)
+        f.seek(second + 116)
+        f.write(start)
+    status, problems, _ = _problems(path)
+    assert status == txrm_verify.STATUS_FAILED
+    assert any("shares sector" in problem and "Image" in problem for problem in problems)
+
+
+def test_short_and_missing_images(tmp_path):
+    streams = synth_txrm.ScanStreams(images=4, width=16, height=16, dtype="float32")
+    streams["ImageData1/Image2"] = b"\0" * 100
+    del streams["ImageData1/Image4"]
+    path = str(tmp_path / "scan.txrm")
+    synth_txrm.WriteOle(path, streams)
+    with txrm_ole.LazyOleFile(path) as ole:
+        problems, count = txrm_verify.VerifyStructure(ole)
+    assert count == 4
+    assert "projections: 1 of 4 images missing (4)" in problems
+    assert "projections: 1 of 4 images do not hold 1024 bytes (2: 100)" in problems
+
+
+def test_no_geometry(tmp_path):
+    streams = synth_txrm.ScanStreams(images=2, width=8, height=8)
+    del streams["ImageInfo/ImageWidth"]
+    path = str(tmp_path / "scan.txrm")
+    synth_txrm.WriteOle(path, streams)
+    status, problems, count = _problems(path)
+    assert status == txrm_verify.STATUS_FAILED and count == 0
+    assert problems == ["projections: no ImageInfo/NoOfImages, ImageWidth or ImageHeight"]
+
+
+def test_fingerprint_sees_rewrites_with_the_same_mtime(make_txrm):
+    path = make_txrm(images=2, width=16, height=16)
+    before = txrm_verify.Fingerprint(path)
+    st = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(-4, os.SEEK_END)
+        f.write(struct.pack("<I", 0xDEADBEEF))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert txrm_verify.Fingerprint(path) != before
+
+
+def test_manifest_skips_unchanged(make_txrm, tmp_path):
+    paths = [make_txrm(f"scan_{k}.txrm") for k in range(3)]
+    manifest = txrm_verify.Manifest(str(tmp_path / "manifest.sqlite"))
+    try:
+        assert txrm_verify.VerifyFiles(paths, manifest, Workers=1) == (3, 0, 0)
+        assert txrm_verify.VerifyFiles(paths, manifest, Workers=1) == (0, 3, 0)
+        bump_mtime(paths[1])
+        assert txrm_verify.VerifyFiles(paths, manifest, Workers=1) == (1, 2, 0)
+        assert txrm_verify.VerifyFiles(paths, manifest, "sha256", Workers=1) == (3, 0, 0)
+        assert manifest.get(paths[0])["hash"] == txrm_verify.HashFile(paths[0])
+    finally:
+        manifest.close()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#txrm_watch: new, rewritten and unreadable files in a watched folder
+
+import contextlib
+import csv
+import os
+
+import pytest
+
+import txrm_watch
+from conftest import bump_mtime
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    #A watcher on tmp_path/acq that needs no settle time and relists every directory on each poll
+    os.makedirs(tmp_path / "acq", exist_ok=True)
+    watching = txrm_watch.Watcher([str(tmp_path / "acq")], str(tmp_path / "out"), Workers=1, settle=0.0,
+                                  rescan=1e-9)
+    yield watching
+    watching.close()
+
+
+def _rows(watcher):
+    #(file, status, voltage) per extraction in the rolling CSV, in order
+    with open(watcher.output_path(), newline="") as f:
+        rows = list(csv.DictReader(f))
+    extractions = {}
+    for row in rows:
+        extraction = extractions.setdefault((row["Sample ID"], row["File"]), [row["File"], row["Status"], None])
+        if row["Component Name"] == "Voltage":
+            extraction[2] = row["Value"]
+    return list(extractions.values())
+
+
+def test_new_file_is_extracted_once(watcher, make_txrm):
+    path = make_txrm("acq/scan.txrm", voltage=80.0)
+    assert watcher.run(0, once=True) == 1
+    assert watcher.run(0, once=True) == 1
+    assert _rows(watcher) == [[path, "OK", "80"]]
+
+
+def test_rewritten_in_place(watcher, make_txrm):
+    path = make_txrm("acq/scan.txrm", voltage=80.0)
+    watcher.run(0, once=True)
+    # Same path and directory entry: only the size/mtime comparison with the index can notice it
+    make_txrm("acq/scan.txrm", voltage=120.0)
+    bump_mtime(path)
+    assert watcher.run(0, once=True) == 2
+    assert _rows(watcher) == [[path, "OK", "80"], [path, "OK", "120"]]
+
+
+def test_replaced_by_rename(watcher, make_txrm):
+    path = make_txrm("acq/scan.txrm", voltage=80.0)
+    watcher.run(0, once=True)
+    staged = make_txrm("staging/scan.txrm", voltage=100.0)
+    bump_mtime(staged)
+    os.replace(staged, path)
+    assert watcher.run(0, once=True) == 2
+    assert _rows(watcher)[-1] == [path, "OK", "100"]
+
+
+def test_unreadable_file_waits_for_a_change(watcher, make_txrm, tmp_path):
+    path = tmp_path / "acq" / "partial.txrm"
+    path.write_bytes(b"\0" * 1024)
+    watcher.poll()  # first seen
+    watcher.poll()  # stable, header checked
+    assert str(path) in watcher.unreadable
+    watcher.poll()
+    assert str(path) in watcher.unreadable and not watcher.running
+    make_txrm("acq/partial.txrm")
+    bump_mtime(str(path))
+    watcher.poll()  # changed: pending again
+    watcher.poll()
+    assert str(path) not in watcher.unreadable
+    while watcher.running:
+        watcher.collect(timeout=None)
+    assert _rows(watcher) == [[str(path), "OK", "80"]]
+
+
+@pytest.fixture
+def incremental(tmp_path):
+    #A watcher that relists only directories whose mtime changed (no periodic rescan)
+    os.makedirs(tmp_path / "acq", exist_ok=True)
+    watching = txrm_watch.Watcher([str(tmp_path / "acq")], str(tmp_path / "out"), Workers=1, settle=0.0, rescan=0)
+    yield watching
+    watching.close()
+
+
+def test_file_deleted_while_listing(incremental, make_txrm, monkeypatch):
+    old = make_txrm("acq/old.txrm")
+    incremental.run(0, once=True)
+    new = make_txrm("acq/new.txrm")
+    scandir = os.scandir
+
+    def listing_then_delete(directory):
+        # The listing still names old.txrm, which is gone by the time it is stat'ed
+        entries = list(scandir(directory))
+        if os.path.exists(old):
+            os.remove(old)
+        return contextlib.nullcontext(entries)
+
+    monkeypatch.setattr(os, "scandir", listing_then_delete)
+    incremental.scan(full=True)
+    assert os.path.dirname(new) in incremental.dirs
+    assert list(incremental.pending) == [new]
+
+
+def test_unlistable_folder_is_skipped(incremental, make_txrm, monkeypatch, capsys):
+    locked = make_txrm("acq/locked/scan.txrm")
+    open_ = make_txrm("acq/open/scan.txrm")
+    scandir = os.scandir
+
+    def denied(directory):
+        if directory == os.path.dirname(locked):
+            raise PermissionError(13, "Permission denied", directory)
+        return scandir(directory)
+
+    monkeypatch.setattr(os, "scandir", denied)
+    incremental.scan()
+    incremental.scan(full=True)
+    assert list(incremental.pending) == [open_]
+    assert capsys.readouterr().err.count("cannot list") == 1
+    monkeypatch.setattr(os, "scandir", scandir)
+    incremental.scan(full=True)
+    assert sorted(incremental.pending) == sorted([locked, open_])
+
+
+def test_relisting_skips_indexed_files(incremental, make_txrm, monkeypatch):
+    paths = [make_txrm(f"acq/scan_{k}.txrm") for k in range(3)]
+    incremental.run(0, once=True)
+    checked = []
+    is_current = incremental.index.is_current
+    monkeypatch.setattr(incremental.index, "is_current", lambda path, *a: checked.append(path) or is_current(path, *a))
+    make_txrm("acq/scan_new.txrm")
+    incremental.scan()
+    assert checked == []
+    staged = make_txrm("staging/scan_0.txrm", voltage=100.0)
+    os.replace(staged, paths[0])
+    incremental.scan()
+    assert checked == [paths[0]]
+    assert paths[0] in incremental.pending
+    incremental.scan(full=True)
+    assert sorted(checked[1:]) == paths[1:]  # scan_0 is pending again and not compared
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Batch Extraction
+Walks a directory tree for Xradia .txrm files, extracts their scan metadata
+in a process pool and streams one merged LIMS CSV.
+
+The rows keep the MakeTable layout; two columns are appended so every row
+records which file it came from and whether extraction succeeded.
+
+Files are parsed with the header-only reader in txrm_ole.py unless
+--olefile is given, as in the other command line tools.
+
+Usage:
+    python txrm_batch.py ROOT [ROOT ...] -o merged.csv --start 1000 --workers 8
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import TXRMParams as tp
+
+HEADER = ",Sample ID,Phase,Analysis,Component Name,Value,File,Status\n"
+STATUS_OK = "OK"
+
+
+def FindTXRMFiles(roots, suffix: str = ".txrm"):
+    """Yield .txrm paths under each root (or the root itself if it is a file) in sorted order
+
+    The suffix is matched case-insensitively (scan.TXRM too), as _ExtractParams accepts it."""
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+    for root in roots:
+        root = os.fspath(root)
+        if os.path.isfile(root):
+            if root.lower().endswith(suffix):
+                yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.lower().endswith(suffix):
+                    yield os.path.join(dirpath, name)
+
+
+def _csv_field(value: str):
+    if any(c in value for c in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _status_from_feedback(feedback):
+    # The last line of the feedback names the failure, e.g. "Could not find Power. Terminating..."
+    lines = [line for line in (feedback or "").splitlines() if line.strip()]
+    if not lines:
+        return "FAILED"
+    return "FAILED: " + lines[-1].replace("Terminating...", "").strip()
+
+
+def ExtractFile(job):
+    """Process pool task: returns (path, sample, rows, status) for one file
+
+    An optional seventh job item names a preview folder: the txrm_preview PNG is written in the same pass."""
+    path, sample, altime, proctime, readonly, cache = job[:6]
+    previewer = None
+    if len(job) > 6 and job[6]:
+        import txrm_preview
+        previewer = txrm_preview.Previewer(job[6])
+    try:
+        result = tp.SampleParams(path, str(sample), altime, proctime, readonly, cache, Preview=previewer)
+        if previewer is not None and not previewer.failed and result is not None and result[0]:
+            previewer.Ensure(path)  # cache hits do not open the file
+    except Exception as e:
+        return path, sample, None, f"ERROR: {type(e).__name__}: {e}"
+    if result is None:
+        return path, sample, None, "FAILED: Missing filename"
+    outstring, feedback = result
+    if not outstring:
+        return path, sample, None, _status_from_feedback(feedback)
+    return path, sample, outstring, STATUS_OK
+
+
+def WriteTable(job):
+    """Process pool task for per-file outputs: writes the MakeTable CSV of one file to its own output path
+
+    Returns (path, output, status, feedback)."""
+    path, output, samples, altime, proctime, readonly = job
+    try:
+        table, feedback = tp.MakeTable(path, samples, altime, proctime, readonly)
+        if table is None:
+            return path, output, _status_from_feedback(feedback), feedback
+        with open(output, "w") as f:
+            f.write(table)
+    except Exception as e:
+        return path, output, f"ERROR: {type(e).__name__}: {e}", ""
+    return path, output, STATUS_OK, feedback
+
+
+def FormatRows(path, sample, rows, status):
+    """Append the File and Status columns to the MakeTable rows of one file"""
+    suffix = "," + _csv_field(path) + "," + _csv_field(status) + "\n"
+    if rows is None:
+        return "0," + str(sample) + ",Global,Scanning Parameters,," + suffix
+    return "".join(line + suffix for line in rows.splitlines() if line)
+
+
+def BatchTable(files, out, StartSample: int = 0, Altime: int = 15, Proctime: int = 15,
+               Workers: int = None, Chunksize: int = 4, progress=None, ReadOnly: bool = True,
+               Cache=None, Previews=None):
+    #Extract every file in the process pool and write merged rows to the open
+    #text stream "out" as soon as each result is available (in input order).
+    #Sample IDs are assigned consecutively from StartSample. Returns a
+    #(processed, failed) count. ReadOnly selects the header-only reader (False: olefile); Cache is the path of a
+    #txrm_cache database (True for the default one) that each worker opens for itself. Previews is a folder
+    #for txrm_preview PNGs, written by the workers while each file is open for extraction.
+    files = list(files)
+    jobs = [(path, StartSample + i, Altime, Proctime, ReadOnly, Cache, Previews) for i, path in enumerate(files)]
+    out.write(HEADER)
+    processed = failed = 0
+    if not jobs:
+        return processed, failed
+    workers = Workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        for path, sample, rows, status in pool.map(ExtractFile, jobs, chunksize=Chunksize):
+            out.write(FormatRows(path, sample, rows, status))
+            processed += 1
+            if status != STATUS_OK:
+                failed += 1
+            if progress is not None:
+                progress(processed, len(jobs), path, status)
+    return processed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract LIMS parameters from every .txrm file under a directory tree")
+    parser.add_argument("roots", nargs="+", help="directories or .txrm files to scan")
+    parser.add_argument("-o", "--output", default="-", help="merged CSV file ('-' for stdout)")
+    parser.add_argument("--start", type=int, default=0, help="sample ID of the first file")
+    parser.add_argument("--altime", type=int, default=15, help="alignment time")
+    parser.add_argument("--proctime", type=int, default=15, help="processing time")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=4, help="files handed to a worker at a time")
+    parser.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    parser.add_argument("--read-only", action="store_true", help=argparse.SUPPRESS)  # the default now; kept for old scripts
+    parser.add_argument("--cache", nargs="?", const=True, default=None, metavar="PATH",
+                        help="reuse parameters of unchanged files from a cache database")
+    parser.add_argument("--previews", nargs="?", const=True, default=None, metavar="DIR",
+                        help="also write QC preview PNGs (default folder: <output name>_previews next to the CSV)")
+    args = parser.parse_args(argv)
+    if args.previews is True:
+        if args.output == "-":
+            parser.error("--previews needs a folder when the CSV goes to stdout")
+        import txrm_preview
+        args.previews = txrm_preview.PreviewDir(args.output)
+
+    def report(done, total, path, status):
+        if status != STATUS_OK:
+            print(f"{path}: {status}", file=sys.stderr)
+
+    files = list(FindTXRMFiles(args.roots))
+    if args.output == "-":
+        processed, failed = BatchTable(files, sys.stdout, args.start, args.altime, args.proctime,
+                                       args.workers, args.chunksize, report, not args.olefile, args.cache,
+                                       args.previews)
+    else:
+        with open(args.output, "w", newline="") as out:
+            processed, failed = BatchTable(files, out, args.start, args.altime, args.proctime,
+                                           args.workers, args.chunksize, report, not args.olefile, args.cache,
+                                           args.previews)
+    print(f"Processed {processed} files, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
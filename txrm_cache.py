@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent TXRM parameter cache
+
+Stores the typed values extracted by TXRMParams.ReadParams in an SQLite
+database keyed on file path, size, modification time and extractor version,
+so regenerating
+the CSVs for an unchanged archive is a stat() and a lookup per file rather
+than an OLE parse. The cache is bounded in bytes and evicts the least
+recently used entries; entries for files that changed are discarded on
+lookup and can be dropped explicitly with invalidate() or prune(). Rows written
+by an older extractor (see EXTRACTOR_VERSION) are misses and are replaced.
+
+The default location is $TXRM_PARAMS_CACHE, or
+~/.cache/xradiaparams/params.sqlite.
+
+Usage:
+    python txrm_cache.py [--cache PATH] (--stats | --prune | --invalidate [PATH ...])
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+#Bump when ReadParams changes how it decodes or stores values; the parameter schema is hashed in as well
+EXTRACTOR_VERSION = 1
+
+#Access times of hits are written in batches of this many, and the byte total is recounted every this many puts
+_FLUSH_EVERY = 256
+
+_TABLE_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS params (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    feedback TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    atime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS params_atime ON params (atime);
+"""
+
+
+def DefaultCachePath():
+    path = os.environ.get("TXRM_PARAMS_CACHE")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "xradiaparams", "params.sqlite")
+
+
+def SchemaVersion():
+    #EXTRACTOR_VERSION plus a checksum of the parameter schema, stored with every row
+    import TXRMParams as tp
+    fields = ";".join(f"{field.name}={field.path}:{field.dtype}:{field.label}" for field in tp.PARAM_FIELDS)
+    return f"{EXTRACTOR_VERSION}:{zlib.crc32(fields.encode()):08x}"
+
+
+def _plain(value):
+    # NumPy scalars and arrays from the extraction are stored as plain JSON numbers and lists
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"cannot cache {type(value).__name__} values")
+
+
+def _key(path):
+    return os.path.abspath(os.fspath(path))
+
+
+class ParamCache:
+    """Size-bounded LRU cache of extracted parameters keyed on (path, size, mtime, extractor version)"""
+
+    def __init__(self, path=None, max_bytes: int = DEFAULT_MAX_BYTES, version: str = None):
+        self.path = os.fspath(path) if path is not None else DefaultCachePath()
+        self.max_bytes = max_bytes
+        self.version = SchemaVersion() if version is None else version
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._puts = 0
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Worker processes share the database, so wait for their writes instead of failing
+        self.db = sqlite3.connect(self.path, timeout=30)
+        if self.path != ":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != _TABLE_VERSION:
+            # Databases from before the version column are dropped rather than migrated
+            self.db.executescript(f"DROP TABLE IF EXISTS params; PRAGMA user_version = {_TABLE_VERSION};")
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+        # Running estimate of SUM(nbytes); it only grows between recounts, which evict() does exactly
+        self._total = self._count_bytes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def get(self, path, stat=None):
+        """Return (values, feedback) if path is cached with its current size and mtime by this extractor
+        version, else None"""
+        key = _key(path)
+        try:
+            st = stat or os.stat(key)
+        except OSError:
+            return None
+        row = self.db.execute("SELECT size, mtime_ns, version, payload, feedback FROM params WHERE path = ?",
+                              (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if row[0] != st.st_size or row[1] != st.st_mtime_ns or row[2] != self.version:
+            self.invalidate(key)
+            self.misses += 1
+            return None
+        self._touched[key] = time.time()
+        if len(self._touched) >= _FLUSH_EVERY:
+            self.flush()
+        self.hits += 1
+        return json.loads(row[3]), row[4]
+
+    def flush(self):
+        """Write the access times of recent hits"""
+        if not self._touched:
+            return
+        touched = [(atime, key) for key, atime in self._touched.items()]
+        self._touched.clear()
+        with self.db:
+            self.db.executemany("UPDATE params SET atime = ? WHERE path = ?", touched)
+
+    def put(self, path, values, feedback: str = "", stat=None):
+        """Store the values extracted from path, then evict least recently used entries over max_bytes"""
+        key = _key(path)
+        st = stat or os.stat(key)
+        payload = json.dumps(values, separators=(",", ":"), default=_plain)
+        nbytes = len(key) + len(payload) + len(feedback)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO params VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, st.st_size, st.st_mtime_ns, self.version, payload, feedback, nbytes, time.time()))
+        # Replaced rows and other processes' writes make the running total drift, so it is recounted when it
+        # crosses the limit and every _FLUSH_EVERY puts
+        self._total += nbytes
+        self._puts += 1
+        if self._total > self.max_bytes or self._puts % _FLUSH_EVERY == 0:
+            self.evict()
+
+    def _count_bytes(self):
+        return self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM params").fetchone()[0]
+
+    def evict(self, max_bytes: int = None):
+        """Drop least recently used entries until the cache holds at most max_bytes; returns entries removed"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        self.flush()
+        total = self._total = self._count_bytes()
+        if total <= limit:
+            return 0
+        # Trim a tenth below the limit so a full cache is not recounted on every put
+        target = limit - limit // 10
+        removed = 0
+        doomed = []
+        for path, nbytes in self.db.execute("SELECT path, nbytes FROM params ORDER BY atime"):
+            if total <= target:
+                break
+            doomed.append((path,))
+            total -= nbytes
+            removed += 1
+        with self.db:
+            self.db.executemany("DELETE FROM params WHERE path = ?", doomed)
+        self._total = total
+        return removed
+
+    def invalidate(self, path=None, prefix=None):
+        """Forget one file, every file under a directory prefix, or (no arguments) everything"""
+        with self.db:
+            if path is not None:
+                cur = self.db.execute("DELETE FROM params WHERE path = ?", (_key(path),))
+            elif prefix is not None:
+                root = _key(prefix).rstrip(os.sep) + os.sep
+                cur = self.db.execute("DELETE FROM params WHERE substr(path, 1, ?) = ?", (len(root), root))
+            else:
+                cur = self.db.execute("DELETE FROM params")
+        return cur.rowcount
+
+    def prune(self):
+        """Remove entries for files that no longer exist or have changed, or from another extractor version;
+        returns entries removed"""
+        stale = []
+        for path, size, mtime_ns, version in self.db.execute("SELECT path, size, mtime_ns, version FROM params"):
+            if version != self.version:
+                stale.append((path,))
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append((path,))
+                continue
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                stale.append((path,))
+        with self.db:
+            self.db.executemany("DELETE FROM params WHERE path = ?", stale)
+        self._total = self._count_bytes()
+        return len(stale)
+
+    def stats(self):
+        self.flush()
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM params").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes, "version": self.version,
+                "hits": self.hits, "misses": self.misses}
+
+
+_open_caches = {}
+
+
+def OpenCache(cache, max_bytes: int = None):
+    #Return cache if it is already a ParamCache, otherwise the (per-process) ParamCache for that path.
+    #True selects the default location
+    if isinstance(cache, ParamCache):
+        return cache
+    path = DefaultCachePath() if cache is True or not cache else os.fspath(cache)
+    opened = _open_caches.get(path)
+    if opened is None or opened.db is None:
+        opened = ParamCache(path, DEFAULT_MAX_BYTES if max_bytes is None else max_bytes)
+        _open_caches[path] = opened
+        # Writes the access times of the last hits; worker processes that skip atexit only lose LRU precision
+        atexit.register(opened.close)
+    return opened
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the TXRM parameter cache")
+    parser.add_argument("--cache", default=None, help="cache database (default: $TXRM_PARAMS_CACHE or ~/.cache/xradiaparams/params.sqlite)")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--stats", action="store_true", help="print entry count and size")
+    action.add_argument("--prune", action="store_true", help="drop entries for changed or deleted files")
+    action.add_argument("--invalidate", nargs="*", metavar="PATH",
+                        help="drop the given files or directories (everything if none given)")
+    args = parser.parse_args(argv)
+
+    with ParamCache(args.cache) as cache:
+        if args.stats:
+            for name, value in cache.stats().items():
+                print(f"{name}: {value}")
+        elif args.prune:
+            print(f"Removed {cache.prune()} stale entries")
+        else:
+            removed = 0
+            for path in args.invalidate or [None]:
+                if path is not None and os.path.isdir(path):
+                    removed += cache.invalidate(prefix=path)
+                else:
+                    removed += cache.invalidate(path)
+            print(f"Removed {removed} entries")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
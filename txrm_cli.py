@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Parameters command line
+Fast-start, headless entry point for cron jobs and LIMS hooks that extract
+one or a few files per call. Only the extraction core is imported: NumPy,
+olefile, sqlite3 and PySide6 are loaded only if an option needs them, so
+interpreter start-up no longer costs more than the parse itself.
+
+Each file gets the next sample ID from --start and the rows are written as
+one MakeTable CSV (header once). --timing reports the import, extraction and
+total time on stderr; benchmarks/bench_txrm.py measures the whole process
+start-up as the "startup" scenario.
+
+Usage:
+    python txrm_cli.py scan.txrm --start 1000 [-o scan_Params.csv]
+    python txrm_cli.py a.txrm b.txrm --start 1000 --timing
+    python txrm_cli.py /data/*.txrm --stats metrics.prom
+    python txrm_cli.py //share/scans/*.txrm --block-size 256
+    python txrm_cli.py /data/stitch/*.txrm --segments --start 1000
+    python txrm_cli.py --gui
+"""
+
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract LIMS parameters from TXRM files without starting the GUI")
+    parser.add_argument("files", nargs="*", help=".txrm files")
+    parser.add_argument("--start", type=int, default=0, help="sample ID of the first file (then one per file)")
+    parser.add_argument("--altime", type=int, default=15, help="alignment time")
+    parser.add_argument("--proctime", type=int, default=15, help="processing time")
+    parser.add_argument("-o", "--output", default=None, help="output CSV (default: stdout)")
+    parser.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    parser.add_argument("--cache", nargs="?", const=True, default=None, metavar="PATH",
+                        help="reuse parameters of unchanged files from a cache database")
+    parser.add_argument("--block-size", type=int, default=None, metavar="KIB",
+                        help="read through the txrm_storage block cache with blocks of this size (for network shares)")
+    parser.add_argument("--latency", type=float, default=0, metavar="MS",
+                        help="with --block-size, add this latency to every storage request (testing)")
+    parser.add_argument("--segments", action="store_true",
+                        help="extract the whole stitched/multi-segment acquisition of each file as one sample")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the extraction feedback on stderr")
+    parser.add_argument("--timing", action="store_true", help="report import and extraction time on stderr")
+    parser.add_argument("--stats", default=None, metavar="PATH",
+                        help="write per-stage extraction statistics in Prometheus text format ('-' for stderr)")
+    parser.add_argument("--gui", action="store_true", help="open the desktop app instead")
+    args = parser.parse_args(argv)
+
+    if args.gui:
+        import txrm_gui_app
+        return txrm_gui_app.main()
+    if not args.files:
+        parser.error("no input files (or use --gui)")
+    if args.stats and args.segments:
+        # The segments of an acquisition are extracted on several threads, which ExtractionStats cannot follow
+        parser.error("--stats cannot be combined with --segments")
+
+    imported = time.perf_counter()
+    import TXRMParams as tp
+    ready = time.perf_counter()
+
+    stats = None
+    if args.stats:
+        import txrm_stats
+        stats = txrm_stats.ExtractionStats()
+
+    storage = None
+    if args.block_size:
+        import txrm_storage
+        storage = txrm_storage.Storage(block_size=args.block_size * 1024, latency=args.latency / 1e3)
+
+    files = args.files
+    if args.segments:
+        import txrm_segments
+        acquisitions = {}
+        for path in files:
+            segments, _ = txrm_segments.FindSegments(path, not args.olefile, storage)
+            acquisitions.setdefault(segments[0] if segments else path, path)
+        files = list(acquisitions.values())
+
+    chunks = [tp.LIMS_HEADER]
+    failed = 0
+    for k, path in enumerate(files):
+        try:
+            if args.segments:
+                acquisition, feedback = txrm_segments.ExtractAcquisition(path, not args.olefile, args.cache, Storage=storage)
+                table = None if acquisition is None else acquisition.ToScanParams().ToLIMS(
+                    [args.start + k], args.altime, args.proctime)
+            else:
+                table, feedback = tp.SampleParams(path, args.start + k, args.altime, args.proctime, not args.olefile,
+                                                  args.cache, Stats=stats, Storage=storage)
+        except Exception as e:
+            # A truncated or corrupt file fails on its own; the rows of the other files are still written
+            table, feedback = None, f"ERROR: {type(e).__name__}: {e}"
+        if args.verbose or table is None:
+            print(f"{path}:{feedback}" if feedback.startswith("\n") else f"{path}: {feedback}", file=sys.stderr)
+        if table is None:
+            failed += 1
+            continue
+        chunks.append(table)
+    extracted = time.perf_counter()
+
+    if args.output:
+        with open(args.output, "w", newline="") as out:
+            out.write("".join(chunks))
+    else:
+        sys.stdout.write("".join(chunks))
+
+    if stats is not None:
+        if args.stats == "-":
+            sys.stderr.write(stats.ToPrometheus())
+        else:
+            with open(args.stats, "w") as out:
+                out.write(stats.ToPrometheus())
+
+    if args.timing:
+        print(f"import {(ready - imported) * 1e3:.1f} ms, extract {(extracted - ready) * 1e3:.1f} ms "
+              f"({len(files)} files), total in script {(time.perf_counter() - _STARTED) * 1e3:.1f} ms; "
+              f"numpy loaded: {'numpy' in sys.modules}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM LIMS Export
+Writes LIMS import files for submissions that book scans against many
+sample IDs: one scan against a range of hundreds of samples, several scans
+per submission, or a mapping file listing the scan of every sample.
+
+Samples are given as range specs ("1000-1099", "AB0100-AB0199:2",
+"1000-1049,1060"), keeping prefixes and zero padding. The rows follow a
+column template: the built-in "lims" layout of MakeTable, "lims_file" with
+the File and Status columns of txrm_batch.py, "wide" with one row per
+sample, or a site template loaded from JSON.
+
+Each scan is extracted once, and its rows are rendered once with a
+placeholder for the sample ID, so writing a row is a string join. Rows go
+out in batches to CSV or to an .xlsx workbook streamed into its zip
+container. Memory stays flat however many rows are written, and a
+workbook starts a new sheet at Excel's row limit.
+
+Usage:
+    python txrm_export.py --map scan_a.txrm=1000-1099 --map scan_b.txrm=1100-1149 -o lims.csv
+    python txrm_export.py --bookings submission.csv --template site.json -o lims.xlsx
+    rows, samples, failed = txrm_export.ExportLIMS([(path, "1000-1099")], "lims.csv")
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+import TXRMParams as tp
+import txrm_batch
+
+# "<prefix><first>-[<prefix>]<last>[:<step>]", e.g. 1000-1099, AB0100-AB0199:2, S-010-020
+SAMPLE_RANGE = re.compile(r"^(?P<prefix>.*?)(?P<first>\d+)\s*-\s*(?:(?P=prefix))?(?P<last>\d+)(?::(?P<step>\d+))?$")
+
+# Stands in for the sample ID in the pre-rendered rows of a scan
+SAMPLE = "\x00"
+
+# A column entry that expands to one column per LIMS component (wide layouts)
+COMPONENTS = "*"
+
+LIMS_COLUMNS = [("", "0"), ("Sample ID", "{sample}"), ("Phase", "Global"), ("Analysis", "Scanning Parameters"),
+                ("Component Name", "{component}"), ("Value", "{value}")]
+
+XLSX_MAX_ROWS = 1048576  # rows per worksheet, including the header row
+
+
+def ParseSamples(spec):
+    """Yield the sample IDs of a spec such as "1000-1099,1200,AB0100-AB0199:2" in order
+
+    A range keeps its prefix and the zero padding of its first number. An item that counts down, such as
+    the common ID "2024-001", is a literal ID, and an item in quotes ('2024-2030') is always literal. A list
+    or range of IDs is passed through as strings."""
+    if not isinstance(spec, str):
+        for sample in spec:
+            yield str(sample)
+        return
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if len(item) > 1 and item[0] == item[-1] and item[0] in "'\"":
+            yield item[1:-1]
+            continue
+        match = SAMPLE_RANGE.match(item)
+        if match is None:
+            yield item
+            continue
+        first, last = int(match.group("first")), int(match.group("last"))
+        step = int(match.group("step") or 1)
+        if last < first:
+            yield item
+            continue
+        if step < 1:
+            raise ValueError(f"bad sample range {item!r}")
+        prefix, width = match.group("prefix"), len(match.group("first"))
+        for number in range(first, last + 1, step):
+            yield prefix + str(number).zfill(width)
+
+
+def ReadBookings(strFile: str):
+    """Yield (scan path, sample spec) for each row of a bookings CSV, streamed
+
+    The sample and scan columns are found by their header names ("sample" or "sample id", and "scan",
+    "file" or "path"); without a header they are the first two columns. A sample cell may hold a range
+    spec. Relative scan paths are taken from the folder of the bookings file."""
+    folder = os.path.dirname(os.path.abspath(strFile))
+    with open(strFile, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        sample_col, scan_col = 0, 1
+        first = True
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if first:
+                first = False
+                names = [cell.strip().lower() for cell in row]
+                samples = [i for i, name in enumerate(names) if name in ("sample", "sample id", "sample_id")]
+                scans = [i for i, name in enumerate(names) if name in ("scan", "file", "path")]
+                if samples and scans:
+                    sample_col, scan_col = samples[0], scans[0]
+                    continue
+            if len(row) <= max(sample_col, scan_col):
+                raise ValueError(f"{strFile}, line {reader.line_num}: expected sample and scan columns")
+            yield os.path.join(folder, row[scan_col].strip()), row[sample_col].strip()
+
+
+class ExportTemplate:
+    """Column layout of an export: one row per sample and LIMS component ("long") or per sample ("wide")
+
+    columns holds (header, value) pairs; a wide layout may also hold COMPONENTS ("*") for one column per
+    component. Values are str.format strings: {sample} is the sample ID; {file}, {scan} (file name without
+    extension), {status}, {altime}, {proctime} and the field names ({Voltage}, {PixelSize}, ...) describe
+    the scan; long layouts add {component}, {value}, {field} and {unit}. fields picks and orders the
+    exported components by field name and rename maps component names to site names. With failures, a scan
+    that could not be extracted still gets one row per sample with empty values (use it with {status}).
+    """
+
+    def __init__(self, columns, layout: str = "long", header: bool = True, fields=None, rename=None,
+                 failures: bool = False, name: str = ""):
+        if layout not in ("long", "wide"):
+            raise ValueError(f"template layout must be 'long' or 'wide', not {layout!r}")
+        self.columns = [COMPONENTS if column == COMPONENTS else (str(column[0]), str(column[1]))
+                        for column in columns]
+        if layout == "long" and COMPONENTS in self.columns:
+            raise ValueError(f"'{COMPONENTS}' columns need the wide layout")
+        self.layout = layout
+        self.header = header
+        self.fields = fields
+        self.rename = rename or {}
+        self.failures = failures
+        self.name = name
+
+    def __repr__(self):
+        return f"ExportTemplate({self.name or self.layout!r}, {len(self.columns)} columns)"
+
+    def Components(self, Fields):
+        #(field, component name) of the exported fields in output order
+        byname = {field.name: field for field in Fields if field.component is not None}
+        names = list(byname) if self.fields is None else self.fields
+        missing = [name for name in names if name not in byname]
+        if missing:
+            raise ValueError(f"template fields not in the schema: {', '.join(missing)}")
+        return [(byname[name], self.rename.get(byname[name].component, byname[name].component)) for name in names]
+
+    def Columns(self, Fields):
+        #(header, value) pairs with COMPONENTS expanded
+        columns = []
+        for column in self.columns:
+            if column == COMPONENTS:
+                columns.extend((component, "{" + field.name + "}") for field, component in self.Components(Fields))
+            else:
+                columns.append(column)
+        return columns
+
+    def Render(self, path: str, scan, status: str, Altime: int = 15, Proctime: int = 15, Fields=None):
+        #The rows of one scan (lists of cell strings) with SAMPLE where the sample ID goes. scan is a
+        #ScanParams, or None for a scan that failed (no rows unless failures is set)
+        if scan is None and not self.failures:
+            return []
+        if scan is not None:
+            Fields = scan.Fields
+        elif Fields is None:
+            Fields = tp.DefaultFields()
+        context = {"file": path, "scan": os.path.splitext(os.path.basename(path))[0], "status": status,
+                   "altime": Altime, "proctime": Proctime, "sample": SAMPLE}
+        params = dict(scan.values if scan is not None else {}, Altime=Altime, Proctime=Proctime)
+        for field in Fields:
+            if field.component is not None:
+                context[field.name] = ("" if scan is None else
+                                       tp.FormatValue(field, params.get(field.name, field.default), params))
+        columns = self.Columns(Fields)
+        if self.layout == "wide":
+            return [self._Cells(columns, context)]
+        if scan is None:
+            return [self._Cells(columns, dict(context, component="", value="", field="", unit=""))]
+        return [self._Cells(columns, dict(context, component=component, value=context[field.name], field=field.name,
+                                          unit=field.unit or ""))
+                for field, component in self.Components(Fields)]
+
+    def _Cells(self, columns, context):
+        cells = []
+        for title, value in columns:
+            try:
+                cells.append(value.format_map(context))
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError(f"template column {title!r}: cannot format {value!r} ({type(e).__name__}: {e})")
+        return cells
+
+
+def LoadTemplate(strFile: str):
+    #Reads a site template from a JSON object with the ExportTemplate keys, e.g.
+    #{"layout": "wide", "columns": [["Sample", "{sample}"], ["Scan", "{scan}"], "*"],
+    # "fields": ["Voltage", "SrcPower", "PixelSize"], "rename": {"Pixel Size": "Voxel (um)"}}
+    with open(strFile) as f:
+        spec = json.load(f)
+    spec.setdefault("name", os.path.splitext(os.path.basename(strFile))[0])
+    spec["columns"] = [column if column == COMPONENTS or isinstance(column, list) else (column["header"], column["value"])
+                       for column in spec["columns"]]
+    return ExportTemplate(**spec)
+
+
+TEMPLATES = {
+    "lims": ExportTemplate(LIMS_COLUMNS, name="lims"),
+    "lims_file": ExportTemplate(LIMS_COLUMNS + [("File", "{file}"), ("Status", "{status}")], failures=True,
+                                name="lims_file"),
+    "wide": ExportTemplate([("Sample ID", "{sample}"), ("File", "{file}"), COMPONENTS, ("Status", "{status}")],
+                           layout="wide", failures=True, name="wide"),
+}
+
+
+def GetTemplate(template):
+    #An ExportTemplate from itself, a TEMPLATES name or the path of a JSON site template
+    if isinstance(template, ExportTemplate):
+        return template
+    if template in TEMPLATES:
+        return TEMPLATES[template]
+    if os.path.isfile(template):
+        return LoadTemplate(template)
+    raise ValueError(f"unknown template {template!r} (built in: {', '.join(TEMPLATES)}, or a JSON file)")
+
+
+class CSVWriter:
+    """Streams rows to an open text file in batches of Batch rows. Excel adds a UTF-8 byte order mark so
+    Excel reads non-ASCII sample IDs and names correctly"""
+
+    def __init__(self, out, Excel: bool = False, Batch: int = 8192):
+        self.out = out
+        self.Batch = Batch
+        self.buffer = []
+        self.rows = 0
+        if Excel:
+            out.write("\ufeff")
+
+    def Header(self, titles):
+        self.out.write(",".join(txrm_batch._csv_field(title) for title in titles) + "\n")
+
+    def Prepare(self, cells):
+        #A rendered row as the pieces of its CSV line around the sample ID
+        return (",".join(txrm_batch._csv_field(cell) for cell in cells) + "\n").split(SAMPLE)
+
+    def Write(self, rows, sample: str):
+        #Writes the prepared rows of a scan for one sample
+        sample = txrm_batch._csv_field(sample)
+        self.buffer.extend(sample.join(parts) for parts in rows)
+        self.rows += len(rows)
+        if len(self.buffer) >= self.Batch:
+            self.Flush()
+
+    def Flush(self):
+        self.out.write("".join(self.buffer))
+        self.buffer.clear()
+
+    def Close(self):
+        self.Flush()
+
+
+class XLSXWriter:
+    """Streams rows into the worksheets of an .xlsx workbook without a spreadsheet library
+
+    Every cell is an inline string, so values keep the formatting of the CSV ("12.50", "0012"). The
+    worksheet XML is deflated into the zip as it is written; a new sheet, with the header repeated,
+    starts when a sheet reaches XLSX_MAX_ROWS."""
+
+    def __init__(self, path: str, Batch: int = 8192, MaxRows: int = XLSX_MAX_ROWS, Compression: int = 1):
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=Compression)
+        self.Batch = Batch
+        self.MaxRows = MaxRows
+        self.buffer = []
+        self.rows = 0
+        self.sheets = 0
+        self.sheet = None
+        self.sheet_rows = 0
+        self.header = None
+
+    @staticmethod
+    def _Cell(value: str):
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        return f'<c t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+
+    def _StartSheet(self):
+        self._EndSheet()
+        self.sheets += 1
+        self.sheet = self.zip.open(f"xl/worksheets/sheet{self.sheets}.xml", "w", force_zip64=True)
+        self.sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                         b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+        self.sheet_rows = 0
+        if self.header is not None:
+            self.sheet_rows = 1
+            self.buffer.append('<row r="1">' + self.header + "</row>")
+
+    def _EndSheet(self):
+        if self.sheet is not None:
+            self.Flush()
+            self.sheet.write(b"</sheetData></worksheet>")
+            self.sheet.close()
+            self.sheet = None
+
+    def Header(self, titles):
+        if self.sheet is not None:
+            raise ValueError("the header must come before the first row")
+        self.header = "".join(self._Cell(title) for title in titles)
+
+    def Prepare(self, cells):
+        return "".join(self._Cell(cell) for cell in cells).split(SAMPLE)
+
+    def Write(self, rows, sample: str):
+        sample = escape(sample)
+        for parts in rows:
+            if self.sheet is None or self.sheet_rows >= self.MaxRows:
+                self._StartSheet()
+            self.sheet_rows += 1
+            self.buffer.append(f'<row r="{self.sheet_rows}">' + sample.join(parts) + "</row>")
+        self.rows += len(rows)
+        if len(self.buffer) >= self.Batch:
+            self.Flush()
+
+    def Flush(self):
+        if self.buffer:
+            self.sheet.write("".join(self.buffer).encode("utf-8"))
+            self.buffer.clear()
+
+    def Abort(self):
+        #Closes the file without finishing the workbook, which is left incomplete for the caller to remove
+        fp, self.zip.fp, self.sheet = self.zip.fp, None, None
+        if fp is not None:
+            fp.close()
+
+    def Close(self):
+        if self.sheet is None:
+            self._StartSheet()  # a workbook needs at least one sheet, even with no rows
+        self._EndSheet()
+        sheets = range(1, self.sheets + 1)
+        header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        self.zip.writestr("[Content_Types].xml", header +
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + "".join(f'<Override PartName="/xl/worksheets/sheet{k}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for k in sheets) + "</Types>")
+        self.zip.writestr("_rels/.rels", header +
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+            'officeDocument" Target="xl/workbook.xml"/></Relationships>')
+        self.zip.writestr("xl/workbook.xml", header +
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(f'<sheet name="LIMS{"" if k == 1 else f" {k}"}" sheetId="{k}" r:id="rId{k}"/>' for k in sheets)
+            + "</sheets></workbook>")
+        self.zip.writestr("xl/_rels/workbook.xml.rels", header +
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{k}" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                      f'relationships/worksheet" Target="worksheets/sheet{k}.xml"/>' for k in sheets)
+            + f'<Relationship Id="rId{self.sheets + 1}" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+              'relationships/styles" Target="styles.xml"/></Relationships>')
+        self.zip.writestr("xl/styles.xml", header +
+            '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+            '<borders count="1"><border/></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+            '</styleSheet>')
+        self.zip.close()
+
+
+def ExportLIMS(bookings, out, Template="lims", Altime: int = 15, Proctime: int = 15, ReadOnly: bool = True,
+               Cache=None, Fields=None, Storage=None, Excel: bool = False, progress=None):
+    #Writes the LIMS rows of bookings, an iterable of (scan path, samples) pairs or a {scan path: samples}
+    #dict, where samples is a ParseSamples spec or a list of IDs; ReadBookings streams them from a CSV. out
+    #is a path (.xlsx for a workbook, anything else CSV; written to a temporary file and renamed when
+    #complete) or an open text file for CSV. Each scan is extracted once however often it is booked (see
+    #ExtractParams for ReadOnly, Cache, Fields and Storage). progress(rows, samples, path) is called after
+    #each booking. Returns (rows, samples, failed) with failed a list of (scan path, status)
+    template = GetTemplate(Template)
+    if isinstance(bookings, dict):
+        bookings = bookings.items()
+    if Fields is None:
+        Fields = tp.DefaultFields()
+
+    temp = None
+    if hasattr(out, "write"):
+        writer = CSVWriter(out, Excel)
+    else:
+        temp = os.fspath(out) + ".tmp"
+        if os.fspath(out).lower().endswith(".xlsx"):
+            writer = XLSXWriter(temp)
+        else:
+            handle = open(temp, "w", newline="", encoding="utf-8")
+            writer = CSVWriter(handle, Excel)
+    prepared = {}  # scan path -> prepared rows, so each scan is extracted and rendered once
+    failed = []
+    samples = 0
+    try:
+        if template.header:
+            writer.Header([title for title, value in template.Columns(Fields)])
+        for path, spec in bookings:
+            rows = prepared.get(path)
+            if rows is None:
+                try:
+                    scan, feedback = tp.ExtractParams(path, ReadOnly, Cache, Fields, Storage=Storage)
+                    status = txrm_batch.STATUS_OK if scan is not None else txrm_batch._status_from_feedback(feedback)
+                except Exception as e:
+                    scan, status = None, f"ERROR: {type(e).__name__}: {e}"
+                if scan is None:
+                    failed.append((path, status))
+                rows = prepared[path] = [writer.Prepare(cells)
+                                         for cells in template.Render(path, scan, status, Altime, Proctime, Fields)]
+            for sample in ParseSamples(spec):
+                writer.Write(rows, sample)
+                samples += 1
+            if progress is not None:
+                progress(writer.rows, samples, path)
+        writer.Close()
+        if temp is not None:
+            if isinstance(writer, CSVWriter):
+                writer.out.close()
+            os.replace(temp, out)
+    except BaseException:
+        if temp is not None:
+            # Leave no partial file behind; the zip is abandoned, not finalised
+            writer.out.close() if isinstance(writer, CSVWriter) else writer.Abort()
+            os.remove(temp)
+        raise
+    return writer.rows, samples, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write LIMS rows for scans booked against many sample IDs")
+    parser.add_argument("--map", action="append", default=[], metavar="SCAN=SAMPLES",
+                        help="book a scan against samples, e.g. scan.txrm=1000-1099,1200 (repeatable)")
+    parser.add_argument("--bookings", action="append", default=[], metavar="CSV",
+                        help="CSV of sample,scan rows (sample cells may be ranges)")
+    parser.add_argument("-t", "--template", default="lims",
+                        help=f"column template: {', '.join(TEMPLATES)} or a JSON site template (default: lims)")
+    parser.add_argument("-o", "--output", default=None, help="output .csv or .xlsx (default: CSV on stdout)")
+    parser.add_argument("--excel", action="store_true", help="start the CSV with a UTF-8 byte order mark for Excel")
+    parser.add_argument("--altime", type=int, default=15, help="alignment time")
+    parser.add_argument("--proctime", type=int, default=15, help="processing time")
+    parser.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    parser.add_argument("--cache", nargs="?", const=True, default=None, metavar="PATH",
+                        help="reuse parameters of unchanged files from a cache database")
+    args = parser.parse_args(argv)
+
+    def bookings():
+        for item in args.map:
+            path, sep, spec = item.rpartition("=")
+            if not sep or not path or not spec:
+                parser.error(f"--map needs SCAN=SAMPLES, not {item!r}")
+            yield path, spec
+        for strFile in args.bookings:
+            yield from ReadBookings(strFile)
+
+    if not args.map and not args.bookings:
+        parser.error("no bookings (use --map or --bookings)")
+    try:
+        rows, samples, failed = ExportLIMS(bookings(), args.output or sys.stdout, args.template, args.altime,
+                                           args.proctime, not args.olefile, args.cache, Excel=args.excel)
+    except ValueError as e:
+        parser.error(str(e))
+    for path, status in failed:
+        print(f"{path}: {status}", file=sys.stderr)
+    print(f"{rows} rows for {samples} samples, {len(failed)} scans failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
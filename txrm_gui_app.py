@@ -10,80 +10,132 @@ Date: 2026-02-11
 
 import sys
 import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QPushButton, QLineEdit, QSpinBox, QTextEdit, QFileDialog,
-    QGridLayout, QGroupBox, QMessageBox
+    QLabel, QPushButton, QSpinBox, QTextEdit, QFileDialog,
+    QGridLayout, QGroupBox, QMessageBox, QTableWidget, QTableWidgetItem,
+    QHeaderView, QProgressBar, QAbstractItemView
 )
-from PySide6.QtCore import Qt, QThread, Signal
-import TXRMParams as tp
+from PySide6.QtCore import Qt, QObject, Signal
+import txrm_batch
 
+# Queue table columns and row states
+COL_FILE, COL_SAMPLE, COL_STATUS, COL_OUTPUT = range(4)
+QUEUED = "Queued"
+RUNNING = "Running"
+DONE = "Done"
+CANCELLED = "Cancelled"
 
-class ProcessWorker(QThread):
-    """Worker thread for processing TXRM files without blocking the GUI"""
-    finished = Signal()
-    error = Signal(str)
-    output = Signal(str)
-    
-    def __init__(self, input_file, output_file, start_sample, alignment_time, processing_time):
-        super().__init__()
-        self.input_file = input_file
-        self.output_file = output_file
-        self.start_sample = start_sample
-        self.alignment_time = alignment_time
-        self.processing_time = processing_time
-    
-    def run(self):
-        """Execute the TXRM file processing"""
-        try:
-            # Validate input file
-            if not self.input_file or not os.path.isfile(self.input_file):
-                self.error.emit("Error: Input file does not exist!")
-                return
-            
-            if not self.input_file.endswith('.txrm'):
-                self.error.emit("Error: File must be a .txrm file!")
-                return
-            
-            # Validate output file path
-            if not self.output_file:
-                self.error.emit("Error: Output file path not specified!")
-                return
-            
-            self.output.emit(f"Opening file: {self.input_file}")
-            
-            # Generate the table using TXRMParams
-            # For now, we'll use a single sample number (start_sample)
-            # If you need a range, modify this to use range(self.start_sample, self.start_sample + count)
-            table = tp.MakeTable(self.input_file, [self.start_sample], 
-                                self.alignment_time, self.processing_time)
-            
-            if table is None:
-                self.error.emit("Error: Failed to extract parameters from TXRM file!")
-                return
-            
-            # Write the table to file
+
+def OutputFilename(input_file):
+    """Default output CSV for an input file (<stem>_Params.csv next to it)"""
+    return str(Path(input_file).with_suffix("")) + "_Params.csv"
+
+
+class BatchQueue(QObject):
+    """Runs txrm_batch.WriteTable jobs in a process pool, at most `workers` at a time
+
+    Jobs are submitted only as workers free up, so cancelling drops everything
+    that has not started yet. Results arrive from the pool's callback thread
+    and are re-emitted through a queued signal, so all slots run on the GUI
+    thread and the event loop never waits on a file.
+    """
+    started = Signal(int)
+    finished = Signal(int, str, str)    # row, status, feedback
+    idle = Signal()
+    _result = Signal(int, object)
+
+    def __init__(self, workers=1, parent=None):
+        super().__init__(parent)
+        self.workers = max(1, workers)
+        self.pool = None
+        self.waiting = deque()   # (row, job) not yet submitted
+        self.running = {}        # row -> future
+        self._result.connect(self._on_result, Qt.QueuedConnection)
+
+    def _ensure_pool(self):
+        if self.pool is None:
+            # spawn rather than fork: forking a process that runs Qt threads is unsafe
+            self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+
+    def set_workers(self, workers):
+        """Change the pool size; takes effect once the running jobs are done"""
+        workers = max(1, workers)
+        if workers != self.workers and self.pool is not None and not self.running:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        self.workers = workers
+
+    def add(self, row, job):
+        self.waiting.append((row, job))
+        self._fill()
+
+    def _fill(self):
+        while self.waiting and len(self.running) < self.workers:
+            row, job = self.waiting.popleft()
+            self._ensure_pool()
+            future = self.pool.submit(txrm_batch.WriteTable, job)
+            self.running[row] = future
+            self.started.emit(row)
+            future.add_done_callback(lambda f, row=row: self._result.emit(row, f))
+
+    def _on_result(self, row, future):
+        if self.running.get(row) is not future:
+            return
+        del self.running[row]
+        if future.cancelled():
+            self.finished.emit(row, CANCELLED, "")
+        else:
             try:
-                with open(self.output_file, 'w') as f:
-                    f.write(table)
-                self.output.emit(f"Successfully wrote table to {self.output_file}")
-                self.finished.emit()
-            except IOError as e:
-                self.error.emit(f"Error writing to file: {e}")
-        
-        except Exception as e:
-            self.error.emit(f"Unexpected error: {str(e)}")
+                _, _, status, feedback = future.result()
+            except Exception as e:
+                status, feedback = f"ERROR: {type(e).__name__}: {e}", ""
+            self.finished.emit(row, status, feedback)
+        self._fill()
+        if not self.running and not self.waiting:
+            self.idle.emit()
+
+    def cancel(self):
+        """Drop the jobs that have not started; returns their rows. Running files are left to finish"""
+        rows = [row for row, _ in self.waiting]
+        self.waiting.clear()
+        for future in self.running.values():
+            future.cancel()
+        if not self.running:
+            self.idle.emit()
+        return rows
+
+    def busy(self):
+        return bool(self.running or self.waiting)
+
+    def shutdown(self):
+        self.waiting.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
 
 
 class TXRMParamsGUI(QMainWindow):
     """Main GUI window for TXRM Parameters application"""
+    _folder_scanned = Signal(str, object)   # folder, future of its list of .txrm paths
     
     def __init__(self):
         super().__init__()
-        self.input_file = ""
-        self.output_file = ""
-        self.worker = None
+        self.files = []          # input paths, one per queue table row
+        self.outputs = []        # output CSV paths, one per row
+        # Folder searches walk the tree on this thread; the result comes back through a queued signal
+        self.scanner = ThreadPoolExecutor(max_workers=1)
+        self._folder_scanned.connect(self.on_folder_scanned, Qt.QueuedConnection)
+        self.queue = BatchQueue(max(1, (os.cpu_count() or 2) - 1), self)
+        self.queue.started.connect(self.on_file_started)
+        self.queue.finished.connect(self.on_file_finished)
+        self.queue.idle.connect(self.on_processing_finished)
+        self.failed = 0
         self.init_ui()
     
     def init_ui(self):
@@ -96,30 +148,39 @@ class TXRMParamsGUI(QMainWindow):
         self.setCentralWidget(central_widget)
         main_layout = QVBoxLayout(central_widget)
         
-        # ===== File Selection Group =====
-        file_group = QGroupBox("File Selection")
-        file_layout = QGridLayout()
+        # ===== File Queue Group =====
+        file_group = QGroupBox("File Queue")
+        file_layout = QVBoxLayout()
         
-        # Input TXRM File
-        input_label = QLabel("Input TXRM File:")
-        self.input_text = QLineEdit()
-        self.input_text.setReadOnly(True)
-        self.input_button = QPushButton("Browse...")
+        queue_buttons = QHBoxLayout()
+        self.input_button = QPushButton("Add Files...")
         self.input_button.clicked.connect(self.select_input_file)
-        
-        file_layout.addWidget(input_label, 0, 0)
-        file_layout.addWidget(self.input_text, 0, 1)
-        file_layout.addWidget(self.input_button, 0, 2)
-        
-        # Output CSV File
-        output_label = QLabel("Output CSV File:")
-        self.output_text = QLineEdit()
-        self.output_button = QPushButton("Change...")
+        self.folder_button = QPushButton("Add Folder...")
+        self.folder_button.clicked.connect(self.select_input_folder)
+        self.output_button = QPushButton("Change Output...")
         self.output_button.clicked.connect(self.select_output_file)
-        
-        file_layout.addWidget(output_label, 1, 0)
-        file_layout.addWidget(self.output_text, 1, 1)
-        file_layout.addWidget(self.output_button, 1, 2)
+        self.remove_button = QPushButton("Clear List")
+        self.remove_button.clicked.connect(self.clear_files)
+        for button in (self.input_button, self.folder_button, self.output_button, self.remove_button):
+            queue_buttons.addWidget(button)
+        file_layout.addLayout(queue_buttons)
+        
+        # One row per input file; Sample and Status are updated as the batch runs
+        self.file_table = QTableWidget(0, 4)
+        self.file_table.setHorizontalHeaderLabels(["File", "Sample", "Status", "Output CSV"])
+        self.file_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.file_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        header = self.file_table.horizontalHeader()
+        header.setSectionResizeMode(COL_FILE, QHeaderView.Stretch)
+        header.setSectionResizeMode(COL_SAMPLE, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COL_STATUS, QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(COL_OUTPUT, QHeaderView.Stretch)
+        file_layout.addWidget(self.file_table)
+        
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v / %m files")
+        self.progress_bar.setValue(0)
+        file_layout.addWidget(self.progress_bar)
         
         file_group.setLayout(file_layout)
         main_layout.addWidget(file_group)
@@ -128,16 +189,28 @@ class TXRMParamsGUI(QMainWindow):
         params_group = QGroupBox("Processing Parameters")
         params_layout = QGridLayout()
         
-        # Starting Sample Number
+        # Starting Sample Number (each queued file takes the next number)
         sample_label = QLabel("Starting Sample Number:")
         self.sample_spinbox = QSpinBox()
         self.sample_spinbox.setMinimum(0)
         self.sample_spinbox.setMaximum(100000)
         self.sample_spinbox.setValue(1000)
+        self.sample_spinbox.valueChanged.connect(self.update_samples)
         
         params_layout.addWidget(sample_label, 0, 0)
         params_layout.addWidget(self.sample_spinbox, 0, 1)
         
+        # Sample IDs booked against each file (a block of consecutive numbers per file)
+        per_file_label = QLabel("Samples per File:")
+        self.per_file_spinbox = QSpinBox()
+        self.per_file_spinbox.setMinimum(1)
+        self.per_file_spinbox.setMaximum(100000)
+        self.per_file_spinbox.setValue(1)
+        self.per_file_spinbox.valueChanged.connect(self.update_samples)
+        
+        params_layout.addWidget(per_file_label, 1, 0)
+        params_layout.addWidget(self.per_file_spinbox, 1, 1)
+        
         # Alignment Time
         alignment_label = QLabel("Alignment Time (seconds):")
         self.alignment_spinbox = QSpinBox()
@@ -145,8 +218,8 @@ class TXRMParamsGUI(QMainWindow):
         self.alignment_spinbox.setMaximum(100000)
         self.alignment_spinbox.setValue(15)
         
-        params_layout.addWidget(alignment_label, 1, 0)
-        params_layout.addWidget(self.alignment_spinbox, 1, 1)
+        params_layout.addWidget(alignment_label, 2, 0)
+        params_layout.addWidget(self.alignment_spinbox, 2, 1)
         
         # Processing Time
         processing_label = QLabel("Processing Time (seconds):")
@@ -155,8 +228,18 @@ class TXRMParamsGUI(QMainWindow):
         self.processing_spinbox.setMaximum(100000)
         self.processing_spinbox.setValue(15)
         
-        params_layout.addWidget(processing_label, 2, 0)
-        params_layout.addWidget(self.processing_spinbox, 2, 1)
+        params_layout.addWidget(processing_label, 3, 0)
+        params_layout.addWidget(self.processing_spinbox, 3, 1)
+        
+        # Concurrent worker processes
+        workers_label = QLabel("Worker Processes:")
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setMinimum(1)
+        self.workers_spinbox.setMaximum(max(1, os.cpu_count() or 1) * 2)
+        self.workers_spinbox.setValue(self.queue.workers)
+        
+        params_layout.addWidget(workers_label, 4, 0)
+        params_layout.addWidget(self.workers_spinbox, 4, 1)
         
         params_group.setLayout(params_layout)
         main_layout.addWidget(params_group)
@@ -167,7 +250,7 @@ class TXRMParamsGUI(QMainWindow):
         
         self.output_text_edit = QTextEdit()
         self.output_text_edit.setReadOnly(True)
-        self.output_text_edit.setMinimumHeight(300)
+        self.output_text_edit.setMinimumHeight(150)
         
         output_layout.addWidget(self.output_text_edit)
         output_group.setLayout(output_layout)
@@ -176,15 +259,27 @@ class TXRMParamsGUI(QMainWindow):
         # ===== Action Buttons =====
         button_layout = QHBoxLayout()
         
-        self.process_button = QPushButton("Create Output File")
+        self.process_button = QPushButton("Create Output Files")
         self.process_button.clicked.connect(self.process_file)
         self.process_button.setMinimumHeight(40)
         
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        self.cancel_button.setMinimumHeight(40)
+        self.cancel_button.setEnabled(False)
+        
+        self.retry_button = QPushButton("Retry Failed")
+        self.retry_button.clicked.connect(self.retry_failed)
+        self.retry_button.setMinimumHeight(40)
+        self.retry_button.setEnabled(False)
+        
         self.clear_button = QPushButton("Clear Messages")
         self.clear_button.clicked.connect(self.clear_messages)
         self.clear_button.setMinimumHeight(40)
         
         button_layout.addWidget(self.process_button)
+        button_layout.addWidget(self.cancel_button)
+        button_layout.addWidget(self.retry_button)
         button_layout.addWidget(self.clear_button)
         main_layout.addLayout(button_layout)
         
@@ -192,92 +287,206 @@ class TXRMParamsGUI(QMainWindow):
         central_widget.setLayout(main_layout)
     
     def select_input_file(self):
-        """Open file dialog to select input TXRM file"""
-        file_path, _ = QFileDialog.getOpenFileName(
+        """Open file dialog to add one or more TXRM files to the queue"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
-            "Select TXRM File",
+            "Select TXRM Files",
             "",
             "TXRM Files (*.txrm);;All Files (*)"
         )
         
-        if file_path:
-            self.input_file = file_path
-            self.input_text.setText(file_path)
-            
-            # Auto-generate output filename
-            self.generate_output_filename()
-            self.log_message(f"Selected input file: {file_path}")
+        if file_paths:
+            self.add_files(file_paths)
     
-    def generate_output_filename(self):
+    def select_input_folder(self):
+        """Open folder dialog and add every TXRM file below it to the queue"""
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder of TXRM Files")
+        if folder:
+            # os.walk over a large share can take minutes, so it runs off the GUI thread
+            self.log_message(f"Searching {folder} for .txrm files...")
+            future = self.scanner.submit(lambda: list(txrm_batch.FindTXRMFiles([folder])))
+            future.add_done_callback(lambda f, folder=folder: self._folder_scanned.emit(folder, f))
+    
+    def on_folder_scanned(self, folder, future):
+        """Queue the files found by a folder search (runs on the GUI thread)"""
+        try:
+            files = future.result()
+        except Exception as e:
+            self.log_message(f"ERROR: could not search {folder}: {type(e).__name__}: {e}")
+            return
+        if not files:
+            self.log_message(f"No .txrm files found under {folder}")
+            return
+        self.add_files(files)
+    
+    def add_files(self, file_paths):
+        """Append files to the queue table (files already queued are skipped)"""
+        known = set(self.files)
+        added = 0
+        for file_path in file_paths:
+            file_path = str(file_path)
+            if file_path in known:
+                continue
+            known.add(file_path)
+            row = len(self.files)
+            self.files.append(file_path)
+            self.outputs.append(self.generate_output_filename(file_path))
+            self.file_table.insertRow(row)
+            self.file_table.setItem(row, COL_FILE, QTableWidgetItem(file_path))
+            self.file_table.setItem(row, COL_SAMPLE, QTableWidgetItem(""))
+            self.file_table.setItem(row, COL_STATUS, QTableWidgetItem(""))
+            self.file_table.setItem(row, COL_OUTPUT, QTableWidgetItem(self.outputs[row]))
+            added += 1
+        self.update_samples()
+        if added:
+            self.log_message(f"Added {added} file(s); {len(self.files)} in the queue")
+    
+    def generate_output_filename(self, input_file):
         """Generate output filename from input filename"""
-        if self.input_file:
-            # Using Path.with_suffix() as in the notebook
-            output_filename = str(Path(self.input_file).with_suffix("")) + "_Params.csv"
-            self.output_file = output_filename
-            self.output_text.setText(output_filename)
-            self.log_message(f"Output filename generated: {output_filename}")
+        # Using Path.with_suffix() as in the notebook
+        return OutputFilename(input_file)
     
     def select_output_file(self):
-        """Open file dialog to select/change output CSV file"""
+        """Open file dialog to change the output CSV of the selected file"""
+        row = self.file_table.currentRow()
+        if row < 0:
+            QMessageBox.warning(self, "Validation Error", "Select a file in the queue first!")
+            return
         file_path, _ = QFileDialog.getSaveFileName(
             self,
             "Save CSV File As",
-            self.output_file,
+            self.outputs[row],
             "CSV Files (*.csv);;All Files (*)"
         )
         
         if file_path:
-            self.output_file = file_path
-            self.output_text.setText(file_path)
+            self.outputs[row] = file_path
+            self.file_table.item(row, COL_OUTPUT).setText(file_path)
             self.log_message(f"Output file changed to: {file_path}")
     
-    def process_file(self):
-        """Process the TXRM file and create the output CSV"""
-        # Validate inputs
-        if not self.input_file:
-            self.log_message("ERROR: Please select an input TXRM file!")
-            QMessageBox.warning(self, "Validation Error", "Please select an input TXRM file!")
+    def clear_files(self):
+        """Empty the queue table (only while nothing is running)"""
+        if self.queue.busy():
+            QMessageBox.warning(self, "Busy", "Cancel or wait for the running batch first!")
             return
-        
-        if not self.output_file:
-            self.log_message("ERROR: Please specify an output file!")
-            QMessageBox.warning(self, "Validation Error", "Please specify an output file!")
+        self.files.clear()
+        self.outputs.clear()
+        self.file_table.setRowCount(0)
+        self.progress_bar.setMaximum(0)
+        self.progress_bar.reset()
+        self.retry_button.setEnabled(False)
+    
+    def samples(self, row):
+        """Sample IDs of a queued file: its block of "Samples per File" numbers from the starting sample"""
+        count = self.per_file_spinbox.value()
+        start = self.sample_spinbox.value() + row * count
+        return range(start, start + count)
+    
+    def update_samples(self):
+        """Number the queued files consecutively from the starting sample number"""
+        for row in range(len(self.files)):
+            samples = self.samples(row)
+            text = str(samples[0]) if len(samples) == 1 else f"{samples[0]}-{samples[-1]}"
+            self.file_table.item(row, COL_SAMPLE).setText(text)
+    
+    def set_status(self, row, status):
+        item = self.file_table.item(row, COL_STATUS)
+        item.setText(status)
+        item.setToolTip(status)
+    
+    def submit_rows(self, rows):
+        """Queue the given table rows with the current parameters"""
+        rows = list(rows)
+        if not rows:
             return
-        
-        # Disable buttons during processing
+        self.queue.set_workers(self.workers_spinbox.value())
+        altime = self.alignment_spinbox.value()
+        proctime = self.processing_spinbox.value()
+        self.progress_bar.setMaximum(self.progress_bar.maximum() + len(rows))
         self.process_button.setEnabled(False)
+        self.retry_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.remove_button.setEnabled(False)
+        self.sample_spinbox.setEnabled(False)
+        self.per_file_spinbox.setEnabled(False)
+        for row in rows:
+            self.set_status(row, QUEUED)
+        for row in rows:
+            job = (self.files[row], self.outputs[row], self.samples(row), altime, proctime, True)
+            self.queue.add(row, job)
+    
+    def process_file(self):
+        """Process every queued TXRM file and create its output CSV"""
+        # Validate inputs
+        if not self.files:
+            self.log_message("ERROR: Please add at least one input TXRM file!")
+            QMessageBox.warning(self, "Validation Error", "Please add at least one input TXRM file!")
+            return
         
-        # Create and start worker thread
-        self.worker = ProcessWorker(
-            self.input_file,
-            self.output_file,
-            self.sample_spinbox.value(),
-            self.alignment_spinbox.value(),
-            self.processing_spinbox.value()
-        )
-        
-        self.worker.output.connect(self.log_message)
-        self.worker.error.connect(self.log_error)
-        self.worker.finished.connect(self.on_processing_finished)
+        self.failed = 0
+        self.progress_bar.setMaximum(0)
+        self.progress_bar.setValue(0)
         
         self.log_message("=" * 60)
-        self.log_message("Starting file processing...")
-        self.log_message(f"Input: {self.input_file}")
-        self.log_message(f"Output: {self.output_file}")
+        self.log_message(f"Starting batch of {len(self.files)} file(s)...")
         self.log_message(f"Start Sample: {self.sample_spinbox.value()}")
+        self.log_message(f"Samples per File: {self.per_file_spinbox.value()}")
         self.log_message(f"Alignment Time: {self.alignment_spinbox.value()}s")
         self.log_message(f"Processing Time: {self.processing_spinbox.value()}s")
+        self.log_message(f"Worker Processes: {self.workers_spinbox.value()}")
         self.log_message("=" * 60)
         
-        self.worker.start()
+        self.submit_rows(range(len(self.files)))
+    
+    def retry_failed(self):
+        """Re-queue the files that failed or were cancelled"""
+        rows = [row for row in range(len(self.files))
+                if self.file_table.item(row, COL_STATUS).text() not in (DONE, "")]
+        if not rows:
+            return
+        self.failed = 0
+        self.progress_bar.setMaximum(0)
+        self.progress_bar.setValue(0)
+        self.log_message(f"Retrying {len(rows)} file(s)...")
+        self.submit_rows(rows)
+    
+    def cancel_processing(self):
+        """Drop the files that have not started yet; running files finish normally"""
+        rows = self.queue.cancel()
+        for row in rows:
+            self.set_status(row, CANCELLED)
+        self.progress_bar.setMaximum(max(0, self.progress_bar.maximum() - len(rows)))
+        self.failed += len(rows)
+        self.log_message(f"Cancelled {len(rows)} queued file(s)")
+    
+    def on_file_started(self, row):
+        self.set_status(row, RUNNING)
+    
+    def on_file_finished(self, row, status, feedback):
+        """Called as each file finishes, in completion order"""
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+        if status == txrm_batch.STATUS_OK:
+            self.set_status(row, DONE)
+            self.log_message(f"Wrote {self.outputs[row]}")
+        else:
+            self.failed += 1
+            self.set_status(row, status)
+            self.log_message(f"ERROR: {self.files[row]}: {status}")
     
     def on_processing_finished(self):
-        """Called when processing is finished"""
+        """Called when the queue has drained (finished or cancelled)"""
         self.process_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.remove_button.setEnabled(True)
+        self.sample_spinbox.setEnabled(True)
+        self.per_file_spinbox.setEnabled(True)
+        self.retry_button.setEnabled(self.failed > 0)
         self.log_message("=" * 60)
-        self.log_message("Processing completed successfully!")
+        if self.failed:
+            self.log_message(f"Processing finished; {self.failed} file(s) failed or were cancelled")
+        else:
+            self.log_message("Processing completed successfully!")
         self.log_message("=" * 60)
-        QMessageBox.information(self, "Success", "File processing completed successfully!")
     
     def log_message(self, message):
         """Add a message to the output text area"""
@@ -292,12 +501,18 @@ class TXRMParamsGUI(QMainWindow):
         # Auto-scroll to bottom
         scrollbar = self.output_text_edit.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
-        self.process_button.setEnabled(True)
         QMessageBox.critical(self, "Processing Error", error_message)
     
     def clear_messages(self):
         """Clear all messages from the output text area"""
         self.output_text_edit.clear()
+    
+    def closeEvent(self, event):
+        """Stop the worker processes with the window"""
+        self.queue.cancel()
+        self.queue.shutdown()
+        self.scanner.shutdown(wait=False, cancel_futures=True)
+        super().closeEvent(event)
 
 
 def main():
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Archive Index
+A persistent columnar index of the extracted parameters of a whole archive,
+so questions such as "80 kV scans with the LE3 filter and a pixel size under
+1 um since July" are answered without opening any .txrm file.
+
+The index is a directory holding one .npy file per column (path, size,
+mtime_ns, ok and one column per schema field; date fields also get <name>End
+and <name>Hours) plus meta.json. Columns are memory-mapped on load, so a
+query only reads the columns it filters on and 100k-row queries take
+milliseconds. Updates are incremental: unchanged files (same size and mtime)
+keep their rows, new and changed files are extracted in a process pool, rows
+for deleted files are dropped, and the new index replaces the old one in a
+single rename.
+
+Usage:
+    python txrm_index.py update archive.idx /data/archive [-j 8]
+    python txrm_index.py query archive.idx "Voltage==80" "SourceFilter==LE3" "PixelSize<1" "Date>=2026-07-01"
+    python txrm_index.py query archive.idx "Objective~20X" --columns path,Date,PixelSize --count
+    python txrm_index.py info archive.idx
+"""
+
+import argparse
+import json
+import operator
+import os
+import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import TXRMParams as tp
+import txrm_batch
+
+INDEX_VERSION = 2
+
+_OPS = {"==": operator.eq, "=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le,
+        ">": operator.gt, ">=": operator.ge}
+_CONDITION = re.compile(r"^\s*(\w+)\s*(==|!=|<=|>=|=|<|>|~)\s*(.*?)\s*$")
+
+
+def IndexColumns(Fields=None):
+    #(column name, field, kind) for the schema: kind is the index dtype of a stored value, or "end"/"hours"
+    #for the extra columns of date fields. Caller-supplied fields (Altime, Proctime) are not stored
+    columns = []
+    for field in tp.DefaultFields() if Fields is None else Fields:
+        if field.path is None:
+            continue
+        if field.dtype == "date":
+            columns += [(field.name, field, "datetime64[ms]"), (field.name + "End", field, "end"),
+                        (field.name + "Hours", field, "hours")]
+        elif field.dtype == "text":
+            columns.append((field.name, field, "S"))
+        else:
+            columns.append((field.name, field, field.dtype))
+    return columns
+
+
+def _date(text):
+    return np.datetime64(tp._ParseDate(text), "ms")
+
+
+def _column_values(kind, values, name):
+    #One column for a batch of extracted files; values is a list of ReadParams dicts (None if it failed)
+    if kind == "S":
+        return np.array([(v.get(name) or "").encode("utf-8") if v else b"" for v in values], dtype="S")
+    if kind in ("datetime64[ms]", "end", "hours"):
+        base = name[:-3] if kind == "end" else name[:-5] if kind == "hours" else name
+        first = np.array([_date(v[base][0]) if v and v.get(base) else np.datetime64("NaT") for v in values],
+                         dtype="datetime64[ms]")
+        if kind == "datetime64[ms]":
+            return first
+        last = np.array([_date(v[base][1]) if v and v.get(base) else np.datetime64("NaT") for v in values],
+                        dtype="datetime64[ms]")
+        if kind == "end":
+            return last
+        # NaT - NaT is the minimum int64 as a float, not NaN; failed rows must not match "DateHours<1"
+        return np.where(np.isnat(first) | np.isnat(last), np.nan, (last - first).astype(np.float64) / 3.6e6)
+    dtype = np.dtype(kind)
+    missing = np.nan if dtype.kind == "f" else 0
+    return np.array([v[name] if v and v.get(name) is not None else missing for v in values], dtype=dtype)
+
+
+def _extract(job):
+    # Runs in the worker processes
+    path, size, mtime_ns, readonly = job
+    try:
+        scan, feedback = tp.ExtractParams(path, readonly)
+    except Exception:
+        scan = None
+    return path, size, mtime_ns, None if scan is None else scan.values
+
+
+class ArchiveIndex:
+    """Columnar parameter index of an archive, stored as a directory of .npy columns"""
+
+    def __init__(self, path, Fields=None):
+        self.path = os.fspath(path)
+        self.Fields = tp.DefaultFields() if Fields is None else Fields
+        self.meta = {"version": INDEX_VERSION, "rows": 0, "columns": {}, "fields": []}
+        self._columns = {}
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def columns(self):
+        return list(self.meta["columns"])
+
+    def column(self, name):
+        #Column as a read-only memory-mapped array (loaded on first use)
+        array = self._columns.get(name)
+        if array is None:
+            if name not in self.meta["columns"]:
+                raise KeyError(f"no column {name!r} in the index (have: {', '.join(self.columns)})")
+            array = np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+            self._columns[name] = array
+        return array
+
+    # ----- updates -----
+
+    def WriteColumns(self, columns):
+        #Replaces the index with the given {name: array} columns (all the same length): writes a new
+        #directory and swaps it in with renames, so readers never see a half-written index
+        lengths = {len(array) for array in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+        rows = lengths.pop() if lengths else 0
+        fresh = self.path + ".tmp"
+        shutil.rmtree(fresh, ignore_errors=True)
+        os.makedirs(fresh)
+        meta = {"version": INDEX_VERSION, "rows": rows, "columns": {}, "fields": [f.name for f in self.Fields]}
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            np.save(os.path.join(fresh, name + ".npy"), array)
+            meta["columns"][name] = array.dtype.str
+        with open(os.path.join(fresh, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+        # Drop the memory maps of the current columns before the renames: Windows cannot rename a
+        # directory while files in it are mapped
+        self._columns.clear()
+        stale = self.path + ".old"
+        shutil.rmtree(stale, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, stale)
+        os.rename(fresh, self.path)
+        shutil.rmtree(stale, ignore_errors=True)
+        self.meta = meta
+
+    def Update(self, roots, Workers: int = None, ReadOnly: bool = True, Chunksize: int = 8, progress=None):
+        #Brings the index up to date with the .txrm files under roots. Rows for unchanged files are kept,
+        #new and changed files are extracted, and rows under roots whose file is gone are dropped (rows
+        #outside roots are kept if their file still exists). A schema or INDEX_VERSION change re-extracts everything.
+        #Returns counts of added, updated, removed, unchanged and failed files
+        if isinstance(roots, (str, os.PathLike)):
+            roots = [roots]
+        roots = [os.path.abspath(root) for root in roots]
+        same_schema = (self.meta.get("version") == INDEX_VERSION and self.meta["fields"] == [f.name for f in self.Fields]
+                       and len(self))
+        known = {}
+        if same_schema:
+            paths = self.column("path")
+            sizes = self.column("size")
+            mtimes = self.column("mtime_ns")
+            known = {p.decode("utf-8"): (i, int(sizes[i]), int(mtimes[i])) for i, p in enumerate(paths)}
+            del paths, sizes, mtimes  # memory maps; WriteColumns renames their directory
+
+        keep, jobs, seen = [], [], set()
+        counts = dict(added=0, updated=0, removed=0, unchanged=0, failed=0)
+        for path in txrm_batch.FindTXRMFiles(roots):
+            path = os.path.abspath(path)
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            row = known.get(path)
+            if row is not None and row[1:] == (st.st_size, st.st_mtime_ns):
+                keep.append(row[0])
+                counts["unchanged"] += 1
+            else:
+                jobs.append((path, st.st_size, st.st_mtime_ns, ReadOnly))
+                counts["updated" if row is not None else "added"] += 1
+        under = tuple(root.rstrip(os.sep) + os.sep for root in roots)
+        for path, (i, _, _) in known.items():
+            if path in seen:
+                continue
+            if path.startswith(under) or path in roots or not os.path.exists(path):
+                counts["removed"] += 1
+            else:
+                keep.append(i)
+
+        results = []
+        if jobs:
+            workers = Workers or os.cpu_count() or 1
+            if workers == 1:
+                results = [_extract(job) for job in jobs]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for done, result in enumerate(pool.map(_extract, jobs, chunksize=Chunksize), 1):
+                        results.append(result)
+                        if progress is not None:
+                            progress(done, len(jobs))
+        values = [result[3] for result in results]
+        counts["failed"] = sum(v is None for v in values)
+
+        new = {"path": np.array([r[0].encode("utf-8") for r in results], dtype="S"),
+               "size": np.array([r[1] for r in results], dtype=np.int64),
+               "mtime_ns": np.array([r[2] for r in results], dtype=np.int64),
+               "ok": np.array([v is not None for v in values], dtype=bool)}
+        for name, field, kind in IndexColumns(self.Fields):
+            new[name] = _column_values(kind, values, name)
+
+        keep = np.array(sorted(keep), dtype=np.intp)
+        merged = {}
+        for name, array in new.items():
+            if len(keep):
+                old = np.asarray(self.column(name))[keep]
+                array = np.concatenate([old, array]) if len(array) else old
+            merged[name] = array
+        order = np.argsort(merged["path"], kind="stable")
+        self.WriteColumns({name: array[order] for name, array in merged.items()})
+        return counts
+
+    # ----- queries -----
+
+    def Condition(self, condition):
+        #Boolean mask for one condition: a "name op value" string (ops ==, !=, <, <=, >, >=, and ~ for
+        #substring match on text columns) or a (name, op, value) tuple
+        if isinstance(condition, str):
+            match = _CONDITION.match(condition)
+            if match is None:
+                raise ValueError(f"cannot parse condition {condition!r} (expected e.g. 'PixelSize<1')")
+            name, op, value = match.groups()
+        else:
+            name, op, value = condition
+        array = self.column(name)
+        if array.dtype.kind == "S":
+            value = value.encode("utf-8") if isinstance(value, str) else value
+            if op == "~":
+                return np.char.find(np.asarray(array), value) >= 0
+        elif array.dtype.kind == "M":
+            value = np.datetime64(value, "ms")
+        elif array.dtype.kind == "b":
+            value = value if isinstance(value, bool) else str(value).lower() in ("1", "true", "yes")
+        else:
+            value = float(value)
+        if op == "~":
+            raise ValueError(f"'~' only applies to text columns, not {name}")
+        return _OPS[op](array, value)
+
+    def Query(self, *conditions, include_failed: bool = False, **equals):
+        #Row numbers matching every condition (strings or tuples, see Condition) and name=value keyword
+        #equalities. Files whose extraction failed are left out unless include_failed
+        mask = np.ones(len(self), dtype=bool) if include_failed or not len(self) else np.array(self.column("ok"))
+        for condition in conditions:
+            mask &= self.Condition(condition)
+        for name, value in equals.items():
+            mask &= self.Condition((name, "==", value))
+        return np.flatnonzero(mask)
+
+    def Rows(self, rows, columns=None):
+        #Plain dictionaries for the given row numbers
+        columns = columns or self.columns
+        data = {name: np.asarray(self.column(name))[rows] for name in columns}
+        result = []
+        for k in range(len(rows)):
+            row = {}
+            for name in columns:
+                value = data[name][k]
+                row[name] = value.decode("utf-8") if isinstance(value, bytes) else \
+                    str(value) if isinstance(value, np.datetime64) else value.item()
+            result.append(row)
+        return result
+
+
+def _csv_cell(value):
+    text = "" if value is None else str(value)
+    return '"' + text.replace('"', '""') + '"' if any(c in text for c in ',"\n') else text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar index of TXRM parameters for a whole archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="add new and changed files, drop deleted ones")
+    update.add_argument("index", help="index directory")
+    update.add_argument("roots", nargs="+", help="folders (or files) to index")
+    update.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    update.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    query = commands.add_parser("query", help="print the rows matching every condition")
+    query.add_argument("index")
+    query.add_argument("conditions", nargs="*", help="e.g. Voltage==80 SourceFilter==LE3 'PixelSize<1' 'Date>=2026-07-01'")
+    query.add_argument("--columns", default=None, help="comma separated columns to print (default: all)")
+    query.add_argument("--count", action="store_true", help="print only the number of matches")
+    query.add_argument("--include-failed", action="store_true", help="include files whose extraction failed")
+    info = commands.add_parser("info", help="show the row count and columns")
+    info.add_argument("index")
+    args = parser.parse_args(argv)
+
+    index = ArchiveIndex(args.index)
+    if args.command == "update":
+        counts = index.Update(args.roots, args.workers, not args.olefile)
+        print(", ".join(f"{name} {count}" for name, count in counts.items()) + f"; {len(index)} rows",
+              file=sys.stderr)
+        return 0
+    if args.command == "info":
+        print(f"{len(index)} rows")
+        for name, dtype in index.meta["columns"].items():
+            print(f"{name}\t{np.dtype(dtype)}")
+        return 0
+    try:
+        rows = index.Query(*args.conditions, include_failed=args.include_failed)
+    except (KeyError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if args.count:
+        print(len(rows))
+        return 0
+    columns = args.columns.split(",") if args.columns else index.columns
+    out = sys.stdout
+    out.write(",".join(columns) + "\n")
+    for row in index.Rows(rows, columns):
+        out.write(",".join(_csv_cell(row[name]) for name in columns) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
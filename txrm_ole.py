@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only, header-only access to OLE compound files
+
+olefile.OleFileIO reads the whole FAT and directory when a file is opened,
+which for a multi-GB .txrm means megabytes of sector tables before a single
+parameter is extracted. LazyOleFile instead reads the header and then only
+the FAT, MiniFAT and directory sectors needed to reach the streams that are
+actually requested, so pulling the scan parameters out of a 20 GB scan reads
+a few kilobytes. The file is opened read-only.
+
+LazyOleFile implements the subset of the OleFileIO interface used by the
+TXRMParams helpers (exists, get_type, get_size, openstream, close) and counts
+every byte it reads in bytes_read.
+"""
+
+import io
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1"
+MINIMAL_SIZE = 1536  # header plus the smallest possible FAT and directory sectors
+
+# Special sector IDs and directory entry types (same values as olefile)
+MAXREGSECT = 0xFFFFFFFA
+DIFSECT = 0xFFFFFFFC
+FATSECT = 0xFFFFFFFD
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+NOSTREAM = 0xFFFFFFFF
+
+STGTY_EMPTY = 0
+STGTY_STORAGE = 1
+STGTY_STREAM = 2
+STGTY_ROOT = 5
+
+
+class NotOleFileError(ValueError):
+    """Raised when a file does not start with a valid compound file header"""
+
+
+class OleFormatError(ValueError):
+    """Raised when a sector chain or directory entry is inconsistent"""
+
+
+def IsOleFile(filename):
+    """True if filename starts with a compound file header (the same test as olefile.isOleFile)"""
+    with open(filename, "rb") as f:
+        header = f.read(MINIMAL_SIZE)
+    return len(header) >= MINIMAL_SIZE and header[:len(MAGIC)] == MAGIC
+
+
+def _uint32_array(data):
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class DirEntry:
+    """One 128 byte directory entry"""
+    __slots__ = ("sid", "name", "type", "left", "right", "child", "start", "size")
+
+    def __init__(self, sid, raw, sector_size):
+        namelen = struct.unpack_from("<H", raw, 64)[0]
+        self.sid = sid
+        self.name = raw[:max(0, namelen - 2)].decode("utf-16-le", "replace")
+        self.type = raw[66]
+        self.left, self.right, self.child = struct.unpack_from("<III", raw, 68)
+        self.start, self.size = struct.unpack_from("<IQ", raw, 116)
+        if sector_size == 512:
+            # Version 3 files only define the low 32 bits of the size
+            self.size &= 0xFFFFFFFF
+
+
+class _Chain:
+    """A sector chain that is followed lazily, one FAT lookup (or one contiguous run) at a time"""
+
+    def __init__(self, start, next_sector, contiguous=None):
+        #contiguous(sid, limit), if given, returns how many sectors from sid on (at most limit) follow each
+        #other in the file, so runs are added without one lookup per sector
+        self.sids = []
+        self._next = start
+        self._next_sector = next_sector
+        self._contiguous = contiguous
+
+    def __getitem__(self, index):
+        sids = self.sids
+        if index < len(sids):
+            return sids[index]
+        if index > 1 << 26:
+            raise OleFormatError("sector chain loops")
+        sid = self._next
+        while len(sids) <= index:
+            if sid > MAXREGSECT:
+                self._next = sid
+                if sid == ENDOFCHAIN:
+                    raise OleFormatError("sector chain is shorter than expected")
+                raise OleFormatError(f"invalid sector id {sid:#x} in chain")
+            count = 1 if self._contiguous is None else self._contiguous(sid, index + 1 - len(sids))
+            sids.extend(range(sid, sid + count))
+            sid = self._next_sector(sid + count - 1)
+        self._next = sid
+        return sids[index]
+
+
+class LazyOleFile:
+    """Read-only OLE container that only reads the sectors it needs"""
+
+    def __init__(self, filename, fp=None, close_fp=None):
+        #filename may be a path; alternatively pass an open binary file object as fp (e.g. a
+        #txrm_storage.BlockReader), which is closed with the LazyOleFile only if close_fp is true
+        self.filename = filename
+        self.bytes_read = 0
+        self.reads = 0
+        self._owns_fp = fp is None if close_fp is None else close_fp
+        self.fp = open(filename, "rb") if fp is None else fp
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+        self._fat_sectors = {}
+        self._difat_chain = []
+        self._minifat_sectors = {}
+        self._entries = {}
+        self._paths = {}
+        self._dir_chain = _Chain(self.first_dir_sector, self._fat_next)
+        self._minifat_chain = _Chain(self.first_minifat_sector, self._fat_next)
+        self._ministream_chain = None
+        self._last_chain = (None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._owns_fp and self.fp is not None:
+            self.fp.close()
+        self.fp = None
+
+    # ----- raw I/O -----
+
+    def _read_at(self, offset, size):
+        self.fp.seek(offset)
+        data = self.fp.read(size)
+        self.bytes_read += len(data)
+        self.reads += 1
+        if len(data) != size:
+            raise OleFormatError(f"unexpected end of file reading {size} bytes at {offset}")
+        return data
+
+    def sector_offset(self, sid):
+        return (sid + 1) * self.sector_size
+
+    def _read_header(self):
+        header = self._read_at(0, 512)
+        if header[:8] != MAGIC:
+            raise NotOleFileError(f"{self.filename} is not an OLE compound file")
+        (self.minor_version, self.major_version, byte_order, sector_shift,
+         mini_sector_shift) = struct.unpack_from("<HHHHH", header, 24)
+        if byte_order != 0xFFFE or sector_shift not in (9, 12):
+            raise NotOleFileError(f"{self.filename} has an unsupported compound file header")
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_sector_shift
+        (self.num_fat_sectors, self.first_dir_sector, _, self.mini_cutoff,
+         self.first_minifat_sector, self.num_minifat_sectors, self.first_difat_sector,
+         self.num_difat_sectors) = struct.unpack_from("<IIIIIIII", header, 44)
+        self._header_difat = _uint32_array(header[76:512])
+        self._per_sector = self.sector_size // 4
+        self.file_size = getattr(self.fp, "size", None)
+        if self.file_size is None:
+            try:
+                self.file_size = os.fstat(self.fp.fileno()).st_size
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                pass
+
+    # ----- FAT -----
+
+    def _fat_sector_location(self, index):
+        if index < 109:
+            return self._header_difat[index]
+        index -= 109
+        per = self._per_sector - 1
+        while len(self._difat_chain) <= index // per:
+            if self._difat_chain:
+                nxt = self._difat_chain[-1][per]
+            else:
+                nxt = self.first_difat_sector
+            if nxt > MAXREGSECT:
+                raise OleFormatError("DIFAT chain is shorter than the FAT")
+            self._difat_chain.append(_uint32_array(self._read_at(self.sector_offset(nxt), self.sector_size)))
+        return self._difat_chain[index // per][index % per]
+
+    def _fat_table(self, index, sid):
+        table = self._fat_sectors.get(index)
+        if table is None:
+            if index >= self.num_fat_sectors:
+                raise OleFormatError(f"sector {sid} is beyond the FAT")
+            location = self._fat_sector_location(index)
+            table = _uint32_array(self._read_at(self.sector_offset(location), self.sector_size))
+            self._fat_sectors[index] = table
+        return table
+
+    def _fat_next(self, sid):
+        index, position = divmod(sid, self._per_sector)
+        return self._fat_table(index, sid)[position]
+
+    def _fat_contiguous(self, sid, limit):
+        #Number of sectors from sid on (at most limit, within one FAT sector) that follow each other, found
+        #by comparing slices of the FAT sector with the expected run and halving on a mismatch
+        index, position = divmod(sid, self._per_sector)
+        table = self._fat_table(index, sid)
+        count = min(limit, self._per_sector - position)
+        if count < 2 or table[position] != sid + 1:
+            return 1
+        while count > 1 and table[position:position + count - 1] != array("I", range(sid + 1, sid + count)):
+            count //= 2
+        return max(count, 1)
+
+    def _minifat_next(self, sid):
+        index = sid // self._per_sector
+        table = self._minifat_sectors.get(index)
+        if table is None:
+            location = self._minifat_chain[index]
+            table = _uint32_array(self._read_at(self.sector_offset(location), self.sector_size))
+            self._minifat_sectors[index] = table
+        return table[sid % self._per_sector]
+
+    # ----- directory -----
+
+    def _entry(self, sid):
+        entry = self._entries.get(sid)
+        if entry is None:
+            per = self.sector_size // 128
+            sector = self._dir_chain[sid // per]
+            raw = self._read_at(self.sector_offset(sector) + (sid % per) * 128, 128)
+            entry = DirEntry(sid, raw, self.sector_size)
+            self._entries[sid] = entry
+        return entry
+
+    @property
+    def root(self):
+        return self._entry(0)
+
+    @staticmethod
+    def _key(name):
+        return (len(name), name.upper())
+
+    def _find_child(self, storage, name):
+        # Siblings form a binary search tree ordered by (length, upper-case name)
+        key = self._key(name)
+        sid = storage.child
+        visited = 0
+        while sid != NOSTREAM:
+            entry = self._entry(sid)
+            entry_key = self._key(entry.name)
+            if entry_key == key:
+                return entry
+            sid = entry.left if key < entry_key else entry.right
+            visited += 1
+            if visited > 1 << 16:
+                raise OleFormatError("directory tree loops")
+        return None
+
+    def find(self, path):
+        """Return the DirEntry for a "Storage/Stream" path, or None if it does not exist"""
+        if not isinstance(path, str):
+            path = "/".join(path)
+        if path in self._paths:
+            return self._paths[path]
+        parent, _, name = path.rpartition("/")
+        storage = self.find(parent) if parent else self.root
+        entry = None if storage is None else self._find_child(storage, name)
+        self._paths[path] = entry
+        return entry
+
+    def listdir(self, path=""):
+        """Names of the entries directly below a storage (reads that storage's whole sibling tree)"""
+        storage = self.find(path) if path else self.root
+        if storage is None:
+            return []
+        names, stack = [], [storage.child]
+        while stack:
+            sid = stack.pop()
+            if sid == NOSTREAM:
+                continue
+            entry = self._entry(sid)
+            names.append(entry.name)
+            stack.extend((entry.left, entry.right))
+        return sorted(names, key=self._key)
+
+    # ----- olefile compatible interface -----
+
+    def exists(self, path):
+        return self.find(path) is not None
+
+    def get_type(self, path):
+        entry = self.find(path)
+        return False if entry is None else entry.type
+
+    def get_size(self, path):
+        entry = self.find(path)
+        if entry is None or entry.type != STGTY_STREAM:
+            raise IOError(f"stream not found: {path}")
+        return entry.size
+
+    def openstream(self, path):
+        entry = self.find(path)
+        if entry is None or entry.type != STGTY_STREAM:
+            raise IOError(f"stream not found: {path}")
+        return OleStream(self, entry)
+
+    # ----- stream layout -----
+
+    def _ministream(self):
+        if self._ministream_chain is None:
+            self._ministream_chain = _Chain(self.root.start, self._fat_next)
+        return self._ministream_chain
+
+    def is_mini(self, entry):
+        return entry.size < self.mini_cutoff and entry.type == STGTY_STREAM
+
+    def _chain(self, entry):
+        # The chain of the last stream read is kept, so several partial reads of one stream (rows of an
+        # image) follow its FAT entries once; only one is kept so reading a whole stack stays small
+        sid, chain = self._last_chain
+        if sid != entry.sid:
+            chain = (_Chain(entry.start, self._minifat_next) if self.is_mini(entry)
+                     else _Chain(entry.start, self._fat_next, self._fat_contiguous))
+            self._last_chain = (entry.sid, chain)
+        return chain
+
+    def stream_runs(self, entry, offset=0, size=None):
+        #List of (file offset, length) byte runs holding entry[offset:offset+size],
+        #with physically adjacent sectors merged into one run
+        end = entry.size if size is None else min(entry.size, offset + size)
+        if offset >= end:
+            return []
+        runs = []
+        chain = self._chain(entry)
+        if self.is_mini(entry):
+            unit = self.mini_sector_size
+            ministream = self._ministream()
+
+            def locate(i):
+                pos = chain[i] * unit
+                return self.sector_offset(ministream[pos // self.sector_size]) + pos % self.sector_size
+        else:
+            unit = self.sector_size
+
+            def locate(i):
+                return self.sector_offset(chain[i])
+        # Only the FAT/MiniFAT sectors describing the requested range are loaded
+        for i in range(offset // unit, (end - 1) // unit + 1):
+            start = max(offset, i * unit)
+            stop = min(end, (i + 1) * unit)
+            location = locate(i) + start - i * unit
+            if runs and runs[-1][0] + runs[-1][1] == location:
+                runs[-1][1] += stop - start
+            else:
+                runs.append([location, stop - start])
+        return [tuple(run) for run in runs]
+
+    def read_stream(self, entry, offset=0, size=None, out=None):
+        #Read entry[offset:offset+size] with one read per contiguous run. If out
+        #is a writable buffer the data is gathered into it and out is returned.
+        runs = self.stream_runs(entry, offset, size)
+        total = sum(length for _, length in runs)
+        buffer = bytearray(total) if out is None else out
+        view = memoryview(buffer).cast("B")
+        if len(view) < total:
+            raise ValueError("output buffer is too small")
+        pos = 0
+        for location, length in runs:
+            self.fp.seek(location)
+            n = self.fp.readinto(view[pos:pos + length])
+            self.bytes_read += n or 0
+            self.reads += 1
+            if n != length:
+                raise OleFormatError(f"unexpected end of file reading stream {entry.name}")
+            pos += length
+        return bytes(buffer) if out is None else out
+
+
+    # ----- verification -----
+
+    def fat_sector_locations(self):
+        #File sector ids of all FAT sectors (from the header and the DIFAT chain)
+        return [self._fat_sector_location(index) for index in range(self.num_fat_sectors)]
+
+    def walk(self):
+        #Yields ("Storage/Stream" path, DirEntry) for every entry below the root, depth first, raising
+        #OleFormatError if an entry is reached twice (a loop or a shared subtree)
+        seen = {0}
+        stack = [(self.root.child, "")]
+        while stack:
+            sid, parent = stack.pop()
+            if sid == NOSTREAM:
+                continue
+            if sid in seen:
+                raise OleFormatError(f"directory entry {sid} is reached twice")
+            seen.add(sid)
+            entry = self._entry(sid)
+            path = parent + "/" + entry.name if parent else entry.name
+            yield path, entry
+            stack.extend(((entry.right, parent), (entry.left, parent)))
+            if entry.type == STGTY_STORAGE:
+                stack.append((entry.child, path))
+
+    def chain_sectors(self, start):
+        #Sector ids of a whole FAT chain followed to ENDOFCHAIN (e.g. the directory or the MiniFAT)
+        chain = _Chain(start, self._fat_next, self._fat_contiguous)
+        limit = (self.file_size // self.sector_size) if self.file_size is not None else 1 << 26
+        while chain._next != ENDOFCHAIN:
+            if len(chain.sids) > limit:
+                raise OleFormatError("sector chain loops")
+            chain[len(chain.sids)]
+        return chain.sids
+
+    def stream_sectors(self, entry):
+        #Every sector id of the chain of entry (mini sector ids for a mini stream), without reading the
+        #data. Raises OleFormatError if the chain is shorter than the stream, runs on past its end or
+        #points outside the file (or the ministream)
+        mini = self.is_mini(entry)
+        unit = self.mini_sector_size if mini else self.sector_size
+        chain = _Chain(entry.start, self._minifat_next) if mini else _Chain(entry.start, self._fat_next, self._fat_contiguous)
+        count = -(-entry.size // unit)
+        if count == 0:
+            return []
+        chain[count - 1]
+        if chain._next != ENDOFCHAIN:
+            raise OleFormatError(f"sector chain of {entry.name} is longer than the stream")
+        sids = chain.sids
+        tail = entry.size - (count - 1) * unit
+        if mini:
+            limit = self.root.size
+            ends = [(max(sids[:-1], default=0) + 1) * unit, sids[-1] * unit + tail]
+        else:
+            if self.file_size is None:
+                return sids
+            limit = self.file_size
+            ends = [self.sector_offset(max(sids[:-1], default=0)) + unit, self.sector_offset(sids[-1]) + tail]
+        if max(ends) > limit:
+            raise OleFormatError(f"{entry.name} has sectors beyond the end of the {'ministream' if mini else 'file'}")
+        return sids
+
+    def read_streams(self, paths, max_gap: int = 4096):
+        #Read several whole streams in one pass: all paths are resolved first, then their sector runs
+        #are read in file order, merging runs less than max_gap bytes apart into a single read.
+        #Returns {path: bytes}, with None for paths that are missing or are not streams
+        pieces = []
+        buffers = {}
+        for path in paths:
+            entry = self.find(path)
+            if entry is None or entry.type != STGTY_STREAM:
+                buffers[path] = None
+                continue
+            buffers[path] = bytearray(entry.size)
+            pos = 0
+            for location, length in self.stream_runs(entry):
+                pieces.append((location, length, path, pos))
+                pos += length
+        pieces.sort()
+        i = 0
+        while i < len(pieces):
+            start = pieces[i][0]
+            end = start + pieces[i][1]
+            j = i + 1
+            while j < len(pieces) and pieces[j][0] - end <= max_gap:
+                end = max(end, pieces[j][0] + pieces[j][1])
+                j += 1
+            data = memoryview(self._read_at(start, end - start))
+            for location, length, path, pos in pieces[i:j]:
+                buffers[path][pos:pos + length] = data[location - start:location - start + length]
+            i = j
+        return {path: None if buf is None else bytes(buf) for path, buf in buffers.items()}
+
+
+class OleStream(io.RawIOBase):
+    """Seekable read-only view of one stream; only the sectors touched are read"""
+
+    def __init__(self, ole, entry):
+        super().__init__()
+        self.ole = ole
+        self.entry = entry
+        self.size = entry.size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        size = max(0, min(size, self.size - self.pos))
+        data = self.ole.read_stream(self.entry, self.pos, size) if size else b""
+        self.pos += len(data)
+        return data
+
+    def readall(self):
+        return self.read(-1)
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        size = max(0, min(len(view), self.size - self.pos))
+        if size:
+            self.ole.read_stream(self.entry, self.pos, size, out=view[:size])
+        self.pos += size
+        return size
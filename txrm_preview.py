@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Scan Previews
+Small QC previews for the LIMS: a few evenly spaced projections downsampled
+to thumbnails above a sinogram strip through the centre row, written as one
+8-bit greyscale PNG per scan.
+
+Only the rows that end up in the preview are read, through row slices of
+TXRMParams.GetFloatImage: every step-th row of the thumbnail projections and
+the centre row of up to SinogramAngles projections. With the header-only
+reader that is a few hundred kB per scan whatever the size of the stack.
+
+A Previewer passed as Preview to ExtractParams, SampleParams or MakeTable
+writes the preview from the file that is already open for the metadata
+when that is the header-only reader; with olefile, which reads whole image
+streams, it opens the file again with txrm_ole.
+txrm_batch.py --previews does this in every worker and caches the PNGs in
+<csv name>_previews/ next to the CSV. A preview is current while its mtime
+equals the scan's, so unchanged scans are not read again.
+
+Usage:
+    python txrm_preview.py /data/archive -o previews/ -j 8
+    python txrm_batch.py /data/archive -o merged.csv --previews
+"""
+
+import argparse
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import TXRMParams as tp
+import txrm_batch
+import txrm_ole
+from txrm_projections import ImageLayout, ImagePath
+
+GAP = 2  # pixels between the tiles of a preview
+
+
+def PreviewDir(csvfile: str):
+    #Default preview folder for a CSV: <csv name>_previews next to it
+    return os.path.splitext(os.path.abspath(csvfile))[0] + "_previews"
+
+
+def _Shrink(rows, step):
+    #Averages blocks of step columns (the rows are already every step-th row)
+    width = rows.shape[-1] // step * step
+    return rows[..., :width].reshape(rows.shape[:-1] + (width // step, step)).mean(axis=-1, dtype=np.float32)
+
+
+def _ToUint8(values):
+    #Contrast stretch between the 1st and 99th percentile
+    low, high = np.percentile(values, [1, 99])
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return np.clip((values - low) * scale, 0, 255).astype(np.uint8)
+
+
+def MakePreview(ole, Projections: int = 4, Size: int = 128, SinogramAngles: int = 180):
+    #Preview image (uint8, 2-D) of an open TXRM file: Projections evenly spaced projections shrunk to at
+    #most Size pixels, side by side, above the centre-row sinogram of up to SinogramAngles projections
+    #stretched to the same width
+    count, height, width, dtype = ImageLayout(ole)
+    if not count or not height or not width:
+        raise ValueError("no projections")
+    # Never coarser than the shorter side, so a very flat or narrow image still gives a thumbnail
+    step = max(1, min(height, width, -(-max(height, width) // Size)))
+    shape = (height, width)
+    indices = np.unique(np.linspace(0, count - 1, min(count, Projections)).round().astype(int))
+    thumbs = np.stack([_Shrink(tp.GetFloatImage(ole, ImagePath(int(k)), shape, dtype, slice(0, height // step * step, step)), step)
+                       for k in indices])
+    angles = np.unique(np.linspace(0, count - 1, min(count, SinogramAngles)).round().astype(int))
+    centre = slice(height // 2, height // 2 + 1)
+    sinogram = _Shrink(np.concatenate([tp.GetFloatImage(ole, ImagePath(int(k)), shape, dtype, centre) for k in angles]), step)
+
+    thumbs = _ToUint8(thumbs)
+    n, th, tw = thumbs.shape
+    total = n * tw + (n - 1) * GAP
+    strip = _ToUint8(sinogram).T  # detector position down, angle across
+    strip = strip[:, np.linspace(0, strip.shape[1] - 1, total).round().astype(int)]
+    image = np.zeros((th + GAP + strip.shape[0], total), dtype=np.uint8)
+    for k in range(n):
+        image[:th, k * (tw + GAP):k * (tw + GAP) + tw] = thumbs[k]
+    image[th + GAP:] = strip
+    return image
+
+
+def WritePNG(path: str, image):
+    #Writes a 2-D uint8 array as an 8-bit greyscale PNG (zlib and struct only, no imaging library)
+    height, width = image.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)  # filter type 0 at the start of each row
+    raw[:, 1:] = image
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    data = (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b""))
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+class Previewer:
+    """Writes and caches the preview PNG of every scan it is called with (see ExtractParams(..., Preview=))"""
+
+    def __init__(self, directory: str, Projections: int = 4, Size: int = 128, SinogramAngles: int = 180):
+        self.directory = directory
+        self.Projections = Projections
+        self.Size = Size
+        self.SinogramAngles = SinogramAngles
+        self.written = 0
+        self.failed = []  # (path, reason)
+
+    def PreviewPath(self, strFile: str):
+        #<scan name>_<hash of its folder>.png, so scans with the same name in different folders do not clash
+        path = os.path.abspath(strFile)
+        folder = zlib.crc32(os.path.dirname(path).encode("utf-8", "surrogateescape"))
+        return os.path.join(self.directory, f"{os.path.splitext(os.path.basename(path))[0]}_{folder:08x}.png")
+
+    def IsCurrent(self, strFile: str):
+        try:
+            return os.stat(self.PreviewPath(strFile)).st_mtime_ns == os.stat(strFile).st_mtime_ns
+        except OSError:
+            return False
+
+    def __call__(self, ole, strFile: str):
+        #Writes the preview of strFile from its open ole unless it is current. Returns the PNG path, or None
+        #if the preview could not be made for any reason (recorded in failed; a preview never fails the
+        #metadata extraction it is made alongside). An ole
+        #that is not the header-only reader is not used: olefile reads whole image streams, which costs ten
+        #times the partial reads, so the file is opened again with txrm_ole
+        target = self.PreviewPath(strFile)
+        if self.IsCurrent(strFile):
+            return target
+        if not isinstance(ole, txrm_ole.LazyOleFile):
+            return self.Ensure(strFile)
+        try:
+            image = MakePreview(ole, self.Projections, self.Size, self.SinogramAngles)
+            os.makedirs(self.directory, exist_ok=True)
+            WritePNG(target, image)
+            source = os.stat(strFile)
+            os.utime(target, ns=(source.st_atime_ns, source.st_mtime_ns))
+        except Exception as e:
+            self.failed.append((strFile, f"{type(e).__name__}: {e}"))
+            return None
+        self.written += 1
+        return target
+
+    def Ensure(self, strFile: str):
+        #Writes the preview if it is not current, opening the file itself with the header-only reader (e.g.
+        #after a parameter cache hit)
+        if self.IsCurrent(strFile):
+            return self.PreviewPath(strFile)
+        try:
+            ole = tp.OpenOle(strFile, True)
+        except Exception as e:
+            self.failed.append((strFile, f"{type(e).__name__}: {e}"))
+            return None
+        with ole:
+            return self(ole, strFile)
+
+
+def PreviewFile(job):
+    """Process pool task: (path, directory) -> (path, preview path or None, error or None)"""
+    path, directory = job
+    previewer = Previewer(directory)
+    target = previewer.Ensure(path)
+    return path, target, previewer.failed[0][1] if previewer.failed else None
+
+
+def WritePreviews(files, directory: str, Workers: int = None, Chunksize: int = 4):
+    #Writes the previews of files into directory in a process pool; returns (written or current, failed)
+    jobs = [(path, directory) for path in files]
+    done = failed = 0
+    if not jobs:
+        return done, failed
+    with ProcessPoolExecutor(max_workers=min(Workers or os.cpu_count() or 1, len(jobs))) as pool:
+        for path, target, error in pool.map(PreviewFile, jobs, chunksize=Chunksize):
+            if target is None:
+                failed += 1
+                print(f"{path}: {error}", file=sys.stderr)
+            else:
+                done += 1
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write QC preview PNGs (thumbnails and a sinogram strip) for .txrm files")
+    parser.add_argument("roots", nargs="+", help=".txrm files or folders to search")
+    parser.add_argument("-o", "--output-dir", required=True, help="folder for the PNGs")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    done, failed = WritePreviews(txrm_batch.FindTXRMFiles(args.roots), args.output_dir, args.workers)
+    print(f"Previews for {done} files, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
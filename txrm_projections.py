@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Projection Reader
+Reads the projection images stored in the ImageData*/Image* streams of a
+TXRM file without copying them through intermediate bytes objects.
+
+When the sectors of an image stream are contiguous in the file (the usual
+case for files written by the Versa software) the image is returned as a
+read-only view into one np.memmap of the .txrm, so nothing is read until
+the pixels are touched and the page cache is shared rather than duplicated.
+Otherwise the sector runs are gathered with readinto straight into one
+preallocated array.
+
+IterProjections streams the projections in chunks together with their
+angles and timestamps, reading ahead on a background thread within a fixed
+memory budget so I/O overlaps with the caller's processing.
+"""
+
+import queue
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+import TXRMParams as tp
+import txrm_ole
+
+# ImageInfo/DataType codes used by Xradia
+DATA_TYPES = {5: np.dtype(np.uint16), 10: np.dtype(np.float32)}
+
+
+def ImagePath(index: int):
+    #Stream path of projection index (0 based); Xradia stores 100 images per ImageData storage
+    return f"ImageData{index // 100 + 1}/Image{index + 1}"
+
+
+def PixelType(code, height: int, width: int, first_size: int = None):
+    #np.dtype of the pixels for an ImageInfo/DataType code. For a missing or unknown code the type is inferred
+    #from first_size, the bytes in the first image (32 bit if it holds 4 bytes per pixel, else 16 bit), or
+    #is None if first_size is not given
+    if code is not None and int(code) in DATA_TYPES:
+        return DATA_TYPES[int(code)]
+    if first_size is None:
+        return None
+    return np.dtype(np.float32 if first_size >= 4 * int(height) * int(width) else np.uint16)
+
+
+def ImageLayout(ole):
+    #(count, height, width, dtype) of the projections of an open TXRM file, from ImageInfo (see PixelType;
+    #a missing first image counts as 16 bit). Raises OleFormatError if NoOfImages, ImageWidth or ImageHeight
+    #is missing
+    streams = tp.ReadStreams(ole, ["ImageInfo/NoOfImages", "ImageInfo/ImageWidth", "ImageInfo/ImageHeight",
+                                   "ImageInfo/DataType"])
+    count = tp.DecodeStream(streams["ImageInfo/NoOfImages"], "int32")
+    width = tp.DecodeStream(streams["ImageInfo/ImageWidth"], "int32")
+    height = tp.DecodeStream(streams["ImageInfo/ImageHeight"], "int32")
+    if count is None or width is None or height is None:
+        raise txrm_ole.OleFormatError("no ImageInfo/NoOfImages, ImageWidth or ImageHeight")
+    code = tp.DecodeStream(streams["ImageInfo/DataType"], "int32")
+    first = None
+    if code is None or int(code) not in DATA_TYPES:
+        first = ole.find(ImagePath(0))
+    dtype = PixelType(code, height, width, 0 if first is None else first.size)
+    return int(count), int(height), int(width), dtype
+
+
+class ProjectionReader:
+    """Random access to the projections of one TXRM file"""
+
+    def __init__(self, strFile: str, ole=None, use_mmap: bool = True):
+        #ole may be an already open txrm_ole.LazyOleFile (e.g. on a custom backend); memory mapping is
+        #only used when the reader opened the file itself
+        self.filename = strFile
+        self._owns_ole = ole is None
+        self.ole = txrm_ole.LazyOleFile(strFile) if ole is None else ole
+        self.use_mmap = use_mmap and self._owns_ole
+        self._map = None
+        try:
+            self._read_layout()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_layout(self):
+        try:
+            self.count, height, width, self.dtype = ImageLayout(self.ole)
+        except txrm_ole.OleFormatError as e:
+            raise txrm_ole.OleFormatError(f"{self.filename}: {e}")
+        self.shape = (height, width)
+        self.image_bytes = self.shape[0] * self.shape[1] * self.dtype.itemsize
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map = None
+        if self._owns_ole and self.ole is not None:
+            self.ole.close()
+        self.ole = None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.read(index)
+
+    def _entry(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(f"projection {index} out of range (0-{self.count - 1})")
+        entry = self.ole.find(ImagePath(index))
+        if entry is None or entry.type != txrm_ole.STGTY_STREAM:
+            raise txrm_ole.OleFormatError(f"missing projection stream {ImagePath(index)}")
+        if entry.size < self.image_bytes:
+            raise txrm_ole.OleFormatError(f"{ImagePath(index)} holds {entry.size} bytes, expected {self.image_bytes}")
+        return entry
+
+    def _mapped(self):
+        if self._map is None:
+            self._map = np.memmap(self.filename, dtype=np.uint8, mode="r")
+        return self._map
+
+    def runs(self, index):
+        #(file offset, length) runs of projection index
+        return self.ole.stream_runs(self._entry(index), 0, self.image_bytes)
+
+    def is_contiguous(self, index):
+        entry = self._entry(index)
+        return not self.ole.is_mini(entry) and len(self.ole.stream_runs(entry, 0, self.image_bytes)) == 1
+
+    def read(self, index: int, out=None):
+        #Projection index as a (height, width) array. Returns a read-only memmap view when the stream is
+        #contiguous and out is not given; otherwise the data is gathered into out (or a new array)
+        entry = self._entry(index)
+        if out is None and self.use_mmap and not self.ole.is_mini(entry):
+            runs = self.ole.stream_runs(entry, 0, self.image_bytes)
+            if len(runs) == 1:
+                offset = runs[0][0]
+                return self._mapped()[offset:offset + self.image_bytes].view(self.dtype).reshape(self.shape)
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        elif out.shape != self.shape or out.dtype != self.dtype or not out.flags.c_contiguous:
+            raise ValueError(f"out must be a C-contiguous {self.dtype} array of shape {self.shape}")
+        self.ole.read_stream(entry, 0, self.image_bytes, out=out)
+        return out
+
+    def read_stack(self, indices=None, out=None):
+        #Projections as one (n, height, width) array, gathered directly into a single preallocated buffer
+        indices = range(self.count) if indices is None else list(indices)
+        if out is None:
+            out = np.empty((len(indices),) + self.shape, dtype=self.dtype)
+        for k, index in enumerate(indices):
+            self.read(index, out=out[k])
+        return out
+
+    def views(self, indices=None):
+        #Zero-copy views of the requested projections (gathered copies only for fragmented streams)
+        indices = range(self.count) if indices is None else indices
+        return [self.read(index) for index in indices]
+
+
+def ReadProjections(strFile: str, indices=None):
+    #Reads projections of a TXRM file into one (n, height, width) array
+    with ProjectionReader(strFile) as reader:
+        return reader.read_stack(indices)
+
+
+class ProjectionChunk(NamedTuple):
+    start: int              # index of the first projection in the chunk
+    images: np.ndarray      # (n, height, width)
+    angles: np.ndarray      # (n,) float32 degrees, empty if the file has no ImageInfo/Angles
+    timestamps: np.ndarray  # (n,) datetime64[ms], empty if the file has no ImageInfo/Date
+
+
+_DONE = object()
+
+
+def _chunk_metadata(values, start, stop):
+    return values[start:stop] if len(values) >= stop else values[:0]
+
+
+def IterProjections(strFile: str, chunk: int = 1, prefetch_bytes: int = 256 * 1024 * 1024, start: int = 0,
+                    stop: int = None):
+    #Yields ProjectionChunk tuples of up to chunk projections from start to stop. A background thread reads
+    #ahead into freshly allocated chunks. The queue holds two chunks fewer than fit in prefetch_bytes,
+    #because the chunk being filled and the one the consumer holds are alive too: at most
+    #max(3, prefetch_bytes // chunk bytes) chunks of image data exist at once. Closing the generator stops
+    #the reader thread
+    reader = ProjectionReader(strFile)
+    try:
+        streams = tp.ReadStreams(reader.ole, ["ImageInfo/Angles", "ImageInfo/Date"])
+        angles = np.frombuffer(streams["ImageInfo/Angles"] or b"", dtype=np.float32)
+        dates = tp.DecodeDates(streams["ImageInfo/Date"] or b"")
+        stop = reader.count if stop is None else min(stop, reader.count)
+        chunk = max(1, int(chunk))
+        chunk_bytes = chunk * reader.image_bytes
+        # Queued chunks, plus the one being filled and the one the consumer holds
+        depth = max(1, prefetch_bytes // max(1, chunk_bytes) - 2)
+    except Exception:
+        reader.close()
+        raise
+
+    pending = queue.Queue(maxsize=depth)
+    cancelled = threading.Event()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for first in range(start, stop, chunk):
+                last = min(first + chunk, stop)
+                images = reader.read_stack(range(first, last))
+                item = ProjectionChunk(first, images, _chunk_metadata(angles, first, last),
+                                       _chunk_metadata(dates, first, last))
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    worker = threading.Thread(target=produce, name="txrm-prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = pending.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        worker.join()
+        reader.close()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Segmented Acquisitions
+Extraction mode for stitched and multi-segment scans. A vertical stitch is
+written as one .txrm per segment (scan_01.txrm, scan_02.txrm, ... or
+scan_seg1.txrm, ...), often with companion .txm reconstructions (scan.txm,
+scan_recon.txm, scan_stitched.txm) next to them. Given any one of these
+files, FindSegments lists the whole acquisition in its directory and
+ExtractAcquisition extracts every member concurrently. Files are only
+grouped when all of them record the same NumSegments above 1, so separate
+scans that happen to be named rock_1.txrm and rock_2.txrm stay separate.
+
+The result adds up the totals over the segments: projections, acquisition
+time, file bytes and image bytes (computed from ImageWidth, ImageHeight and
+DataType). It also lists every parameter that differs between segments and
+reports segments missing against NumSegments. Only metadata streams are
+read; no image data is loaded. Extraction runs on threads because each
+segment is a handful of small reads. On a network share most of that time
+is spent waiting for the storage.
+
+Usage:
+    python txrm_segments.py /data/scan_01.txrm --start 1000 [-o scan_Params.csv]
+    python txrm_segments.py /data/scan_stitched.txm --json
+    acquisition, feedback = txrm_segments.ExtractAcquisition(path, ReadOnly=True)
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import TXRMParams as tp
+
+# "<base><separator><index>": scan_01, scan-2, scan 3, scan_seg1, scan_segment_01, scanseg2
+SEGMENT_NAME = re.compile(r"^(?P<base>.+?)(?:[_\- ]?seg(?:ment)?[_\- ]?|[_\- ])(?P<index>\d{1,3})$", re.IGNORECASE)
+
+# Image geometry fields read from every segment (no LIMS component) for the image byte totals
+IMAGE_FIELDS = [
+    tp.ParamField("ImageWidth", "ImageInfo/ImageWidth", "int32", "px", required=False, default=0),
+    tp.ParamField("ImageHeight", "ImageInfo/ImageHeight", "int32", "px", required=False, default=0),
+    tp.ParamField("DataType", "ImageInfo/DataType", "int32", required=False, default=0),
+]
+
+# The field that decides whether files named as segments belong together
+NUM_SEGMENTS = next(field for field in tp.PARAM_FIELDS if field.name == "NumSegments")
+
+# Metadata of a .txm reconstruction; a reconstruction need not have any of them
+RECONSTRUCTION_FIELDS = IMAGE_FIELDS + [
+    tp.ParamField("NoOfImages", "ImageInfo/NoOfImages", "int32", required=False, default=0),
+    tp.ParamField("PixelSize", "ImageInfo/PixelSize", "float32", "um", required=False, default=0.0),
+]
+
+
+def _SplitName(stem):
+    #(base, index) of a file name without extension; index is None for a name without a segment suffix
+    match = SEGMENT_NAME.match(stem)
+    if match is None:
+        return stem, None
+    return match.group("base"), int(match.group("index"))
+
+
+def _NumSegments(path, ReadOnly, Storage):
+    #AcquisitionSettings NumSegments of a .txrm (1 if it has none), or None if it cannot be read
+    try:
+        with tp.OpenOle(path, ReadOnly, Storage) as ole:
+            values, _ = tp.ReadParams(ole, [NUM_SEGMENTS])
+    except (OSError, ValueError):
+        return None
+    return int(values["NumSegments"] or 1)
+
+
+def _SameAcquisition(paths, ReadOnly=True, Storage=None):
+    #Whether files named like segments of one base really are one acquisition: every file must report the
+    #same NumSegments, greater than 1 and at least the number of files (rock_1.txrm and rock_2.txrm may be
+    #two separate scans). Files that cannot be read do not vote; they stay in the group and are reported as
+    #failed segments
+    counts = {_NumSegments(path, ReadOnly, Storage) for path in paths} - {None}
+    if len(counts) != 1:
+        return False
+    count = counts.pop()
+    return count > 1 and count >= len(paths)
+
+
+def FindSegments(strFile: str, ReadOnly: bool = True, Storage=None):
+    #Lists the acquisition strFile (a segment .txrm or a companion .txm) belongs to. Returns the segment
+    #.txrm paths in segment order and the companion .txm paths, both from the directory of strFile.
+    #Files named as segments of one base are only grouped if their NumSegments agree (see
+    #_SameAcquisition); otherwise a .txrm stands alone. A .txm belongs to the acquisition if its name is
+    #the segment base name, optionally followed by a separator and a non-numeric suffix (scan.txm,
+    #scan_recon.txm, but not scan_02.txm)
+    directory, name = os.path.split(os.path.abspath(strFile))
+    stem, extension = os.path.splitext(name)
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return [], []
+    scans = {}
+    for other in names:
+        other_stem, other_ext = os.path.splitext(other)
+        if other_ext.lower() == ".txrm":
+            scans[other] = _SplitName(other_stem)
+
+    if extension.lower() == ".txrm":
+        base = scans.get(name, _SplitName(stem))[0]
+    else:
+        # The longest segment base that the .txm name starts with
+        bases = [b for b, _ in scans.values() if _IsCompanion(stem, b)]
+        if not bases:
+            return [], [os.path.join(directory, name)]
+        base = max(bases, key=len)
+
+    segments = sorted((index or 0, other) for other, (b, index) in scans.items() if b == base)
+    if len(segments) > 1 and not _SameAcquisition([os.path.join(directory, other) for _, other in segments],
+                                                  ReadOnly, Storage):
+        if extension.lower() != ".txrm":
+            return [], [os.path.join(directory, name)]
+        segments, base = [(0, name)], stem
+    companions = [other for other in names
+                  if os.path.splitext(other)[1].lower() == ".txm" and _IsCompanion(os.path.splitext(other)[0], base)]
+    return [os.path.join(directory, other) for _, other in segments], [os.path.join(directory, other) for other in companions]
+
+
+def _IsCompanion(stem, base):
+    if stem == base:
+        return True
+    if not stem.startswith(base) or stem[len(base)] not in "_- .":
+        return False
+    return not stem[len(base) + 1:].isdigit()
+
+
+def ExtractReconstruction(strFile: str, ReadOnly: bool = True, Storage=None):
+    #Metadata of a companion .txm reconstruction: file size, slice count and geometry. Returns a dict with
+    #"file", "bytes", the RECONSTRUCTION_FIELDS values and "status" ("OK" or what went wrong)
+    info = {"file": strFile, "bytes": os.path.getsize(strFile) if os.path.isfile(strFile) else 0}
+    try:
+        with tp.OpenOle(strFile, ReadOnly, Storage) as ole:
+            values, _ = tp.ReadParams(ole, RECONSTRUCTION_FIELDS)
+    except (OSError, ValueError) as e:
+        info["status"] = f"ERROR: {type(e).__name__}: {e}"
+        return info
+    info.update(values)
+    info["image_bytes"] = ImageBytes(values)
+    info["status"] = "OK"
+    return info
+
+
+def ImageBytes(values):
+    #Bytes of projection (or slice) data described by the NoOfImages, ImageWidth, ImageHeight and DataType
+    #values, without reading any of it; 0 if the geometry is unknown. txrm_projections (and with it NumPy) is
+    #imported here so that importing this module for txrm_cli.py stays light
+    from txrm_projections import PixelType
+    width, height = int(values.get("ImageWidth") or 0), int(values.get("ImageHeight") or 0)
+    dtype = PixelType(values.get("DataType"), height, width)
+    return 0 if dtype is None else int(values.get("NoOfImages") or 0) * width * height * dtype.itemsize
+
+
+def _Hours(first, last):
+    return (tp._ParseDate(last) - tp._ParseDate(first)).total_seconds() / 3600
+
+
+class AcquisitionParams:
+    """The parameters of every segment of one acquisition, with totals and cross-segment differences"""
+    __slots__ = ("path", "segments", "failed", "companions", "Fields")
+
+    def __init__(self, path: str, segments, failed=(), companions=(), Fields=None):
+        self.path = path
+        self.segments = list(segments)      # ScanParams of the segments that extracted, in segment order
+        self.failed = list(failed)          # (path, feedback) of those that did not
+        self.companions = list(companions)  # ExtractReconstruction dicts
+        self.Fields = tp.DefaultFields() if Fields is None else Fields
+
+    def __repr__(self):
+        return f"AcquisitionParams({self.path!r}, {len(self.segments)} segments, {len(self.companions)} reconstructions)"
+
+    def Expected(self):
+        #The largest NumSegments any segment reports (1 for a plain scan)
+        return max([int(scan.values.get("NumSegments") or 1) for scan in self.segments] or [1])
+
+    def Totals(self):
+        #Totals over the segments: counts, projections, acquisition time (the sum of the segment scan
+        #times) and elapsed time (first projection to last, including moves between segments), bytes
+        totals = {"segments": len(self.segments), "expected_segments": self.Expected(), "failed_segments": len(self.failed),
+                  "projections": sum(int(scan.values.get("NoOfImages") or 0) for scan in self.segments),
+                  "file_bytes": sum(os.path.getsize(scan.path) for scan in self.segments if os.path.isfile(scan.path)),
+                  "image_bytes": sum(ImageBytes(scan.values) for scan in self.segments),
+                  "reconstructions": len(self.companions),
+                  "reconstruction_bytes": sum(info["bytes"] for info in self.companions)}
+        dates = [scan.values["Date"] for scan in self.segments if scan.values.get("Date")]
+        if dates:
+            first, last = self._Span(dates)
+            totals["first_projection"] = first
+            totals["last_projection"] = last
+            totals["scan_hours"] = sum(_Hours(start, end) for start, end in dates)
+            totals["elapsed_hours"] = _Hours(first, last)
+        return totals
+
+    @staticmethod
+    def _Span(dates):
+        first = min((start for start, _ in dates), key=tp._ParseDate)
+        last = max((end for _, end in dates), key=tp._ParseDate)
+        return first, last
+
+    def Differences(self):
+        #{field name: [value of each segment]} for every field whose value is not the same in all segments.
+        #Date fields always differ between segments and are left out
+        differences = {}
+        if len(self.segments) < 2:
+            return differences
+        for field in list(self.Fields) + IMAGE_FIELDS:
+            if field.path is None or field.dtype == "date" or field.name in differences:
+                continue
+            values = [scan.values.get(field.name) for scan in self.segments]
+            if any(value != values[0] for value in values[1:]):
+                differences[field.name] = values
+        return differences
+
+    def Values(self):
+        #Acquisition-level values for the LIMS rows: those of the first segment, with the projections
+        #summed and Date spanning the first to the last projection. NumSegments stays as recorded, so a
+        #missing segment shows against it (see Feedback)
+        if not self.segments:
+            return None
+        values = dict(self.segments[0].values)
+        values["NoOfImages"] = sum(int(scan.values.get("NoOfImages") or 0) for scan in self.segments)
+        dates = [scan.values["Date"] for scan in self.segments if scan.values.get("Date")]
+        if dates:
+            values["Date"] = self._Span(dates)
+        return values
+
+    def ToScanParams(self):
+        #One ScanParams standing for the whole acquisition (see Values), e.g. for tp.FormatScan
+        values = self.Values()
+        if values is None:
+            return None
+        return tp.ScanParams(self.path, values, self.Feedback(), self.Fields)
+
+    def ToLIMS(self, SampleNos, Altime: int = 15, Proctime: int = 15, header: bool = False):
+        return self.ToScanParams().ToLIMS(SampleNos, Altime, Proctime, header=header)
+
+    def Feedback(self):
+        #Summary for the console or GUI: totals, missing or failed segments and differing parameters
+        totals = self.Totals()
+        lines = [f"Segments: {totals['segments']} of {totals['expected_segments']}"]
+        if totals["segments"] < totals["expected_segments"]:
+            lines.append(f"WARNING: {totals['expected_segments'] - totals['segments']} segment(s) missing")
+        for path, feedback in self.failed:
+            reason = [line for line in feedback.splitlines() if line.strip()]
+            lines.append(f"FAILED {os.path.basename(path)}: {reason[-1] if reason else 'unknown error'}")
+        lines.append(f"Projections: {totals['projections']}")
+        if "scan_hours" in totals:
+            lines.append(f"Scan time: {totals['scan_hours']:.2f} h ({totals['elapsed_hours']:.2f} h elapsed)")
+        lines.append(f"Bytes: {totals['file_bytes']} in files, {totals['image_bytes']} of projections")
+        for info in self.companions:
+            lines.append(f"Reconstruction {os.path.basename(info['file'])}: {info['bytes']} bytes, {info['status']}")
+        for name, values in self.Differences().items():
+            lines.append(f"DIFFERS {name}: " + ", ".join(tp.ShowValue(value) for value in values))
+        return "\n" + "\n".join(lines)
+
+    def ToDict(self):
+        #Plain values suitable for JSON
+        return {"file": self.path, "totals": self.Totals(),
+                "differences": {name: [value.tolist() if hasattr(value, "tolist") else value for value in values]
+                                for name, values in self.Differences().items()},
+                "segments": [scan.ToDict() for scan in self.segments],
+                "failed": [{"file": path, "feedback": feedback} for path, feedback in self.failed],
+                "reconstructions": self.companions}
+
+
+def _ExtractSegment(job):
+    #(ScanParams or None, feedback) of one segment; a corrupt segment is reported, not raised, so the
+    #others still make up the acquisition and it is listed in failed
+    path, ReadOnly, Fields, Storage = job
+    try:
+        return tp.ExtractParams(path, ReadOnly, None, Fields, None, Storage)
+    except Exception as e:
+        return None, f"\nERROR: {type(e).__name__}: {e}"
+
+
+def ExtractAcquisition(strFile: str, ReadOnly: bool = True, Cache=None, Fields=None, Workers: int = None,
+                       Storage=None, Reconstructions: bool = True):
+    #Extracts every segment of the acquisition strFile belongs to (see FindSegments) and, with
+    #Reconstructions, the metadata of its companion .txm files, on up to Workers threads. Returns an
+    #AcquisitionParams (None if no segment could be extracted) and the feedback.
+    #Cache is looked up and filled in the calling thread (its SQLite connection is per thread); ReadOnly,
+    #Fields and Storage are as for TXRMParams.ExtractParams
+    if Fields is None:
+        Fields = tp.DefaultFields()
+    names = {field.name for field in Fields}
+    fields = list(Fields) + [field for field in IMAGE_FIELDS if field.name not in names]
+    paths, companions = FindSegments(strFile, ReadOnly, Storage)
+    if not paths:
+        return None, "No .txrm segments found! Terminating..."
+
+    scans = {}
+    if Cache is not None:
+        for path in paths:
+            scan = tp.CachedParams(Cache, path, fields)
+            if scan is not None:
+                scans[path] = (scan, scan.feedback)
+    todo = [path for path in paths if path not in scans]
+    jobs = len(todo) + (len(companions) if Reconstructions else 0)
+    reconstructions = []
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(Workers or 8, jobs)) as pool:
+            extracted = pool.map(_ExtractSegment, [(path, ReadOnly, fields, Storage) for path in todo])
+            if Reconstructions:
+                reconstructions = list(pool.map(lambda path: ExtractReconstruction(path, ReadOnly, Storage), companions))
+            scans.update(zip(todo, extracted))
+        if Cache is not None:
+            import txrm_cache
+            Cache = txrm_cache.OpenCache(Cache)
+            for path in todo:
+                scan, feedback = scans[path]
+                if scan is not None:
+                    Cache.put(path, scan.values, feedback)
+
+    segments = [scans[path][0] for path in paths if scans[path][0] is not None]
+    failed = [(path, scans[path][1]) for path in paths if scans[path][0] is None]
+    if not segments:
+        feedback = "".join(f"\n{os.path.basename(path)}:{feedback}" for path, feedback in failed)
+        return None, feedback + "\nNo segment could be extracted. Terminating..."
+    acquisition = AcquisitionParams(paths[0], segments, failed, reconstructions, Fields)
+    return acquisition, acquisition.Feedback()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract the parameters of a stitched or multi-segment acquisition")
+    parser.add_argument("file", help="any segment .txrm (or companion .txm) of the acquisition")
+    parser.add_argument("--start", type=int, default=0, help="sample ID")
+    parser.add_argument("--altime", type=int, default=15, help="alignment time")
+    parser.add_argument("--proctime", type=int, default=15, help="processing time")
+    parser.add_argument("-o", "--output", default=None, help="output CSV (default: stdout)")
+    parser.add_argument("--json", action="store_true", help="write totals, differences and per-segment values as JSON")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="extraction threads (default: one per file, at most 8)")
+    parser.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    parser.add_argument("--cache", nargs="?", const=True, default=None, metavar="PATH",
+                        help="reuse parameters of unchanged segments from a cache database")
+    args = parser.parse_args(argv)
+
+    acquisition, feedback = ExtractAcquisition(args.file, not args.olefile, args.cache, Workers=args.workers)
+    print(feedback.strip(), file=sys.stderr)
+    if acquisition is None:
+        return 1
+    if args.json:
+        text = json.dumps(acquisition.ToDict(), indent=2) + "\n"
+    else:
+        text = acquisition.ToLIMS([args.start], args.altime, args.proctime, header=True)
+    if args.output:
+        with open(args.output, "w", newline="") as out:
+            out.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Extraction Service
+A small asyncio HTTP/JSON service around the TXRMParams extraction core for
+LIMS integration. Parsing runs in a bounded process pool that is started
+once, so requests pay neither interpreter nor GUI start-up. Concurrent
+requests for the same unchanged file share a single extraction.
+
+Endpoints:
+    POST /extract  {"path": "...", "samples": [1000, 1001], "altime": 15, "proctime": 15}
+                   -> {"status": "OK", "rows": "<LIMS CSV rows>", "feedback": "..."}
+    GET  /health   -> {"status": "OK", "inflight": n, "served": n, "deduplicated": n, "restarts": n}
+
+Usage:
+    python txrm_service.py serve [--host 127.0.0.1] [--port 8765] [--workers N]
+    python txrm_service.py request FILE --sample 1000 [--sample 1001] [--port 8765]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import TXRMParams as tp
+
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 100
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 422: "Unprocessable Entity", 431: "Request Header Fields Too Large",
+            500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _extract(path, readonly, cache):
+    # Runs in the worker processes
+    return tp.ExtractParams(path, readonly, cache)
+
+
+class ExtractionService:
+    """Request handling, de-duplication and the worker pool"""
+
+    def __init__(self, workers: int = None, max_pending: int = 1024, ReadOnly: bool = True, Cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.ReadOnly = ReadOnly
+        self.Cache = Cache
+        self.pool = None
+        self.inflight = {}
+        self.served = 0
+        self.deduplicated = 0
+        self.restarts = 0
+        self.server = None
+        self.connections = set()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Start the workers before the listening socket exists so forked workers do not inherit it
+        await asyncio.get_running_loop().run_in_executor(self.pool, os.getpid)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    def _restart_pool(self, broken):
+        #Replaces a pool broken by a worker that died (e.g. killed or out of memory) so that later requests
+        #do not all fail. The new workers are spawned, not forked, so they do not inherit the listening socket
+        if self.pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self.restarts += 1
+
+    async def _result(self, future, pool):
+        try:
+            return await asyncio.shield(future)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise RequestError(503, "a worker process died; the pool was restarted, retry the request")
+
+    async def extract(self, path):
+        #Returns (ScanParams or None, feedback); requests for a file that is already being parsed wait for
+        #that extraction instead of starting another one
+        path = os.path.abspath(path)
+        loop = asyncio.get_running_loop()
+        try:
+            # Off the event loop: a stat on a slow share would stall every other connection
+            st = await loop.run_in_executor(None, os.stat, path)
+        except OSError:
+            return None, "File does not exist! Terminating..."
+        key = (path, st.st_size, st.st_mtime_ns)
+        entry = self.inflight.get(key)
+        if entry is not None:
+            self.deduplicated += 1
+            return await self._result(*entry)
+        if len(self.inflight) >= self.max_pending:
+            raise RequestError(503, "too many pending extractions")
+        pool = self.pool
+        try:
+            future = loop.run_in_executor(pool, _extract, path, self.ReadOnly, self.Cache)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            pool = self.pool
+            future = loop.run_in_executor(pool, _extract, path, self.ReadOnly, self.Cache)
+        self.inflight[key] = (future, pool)
+        try:
+            return await self._result(future, pool)
+        finally:
+            if self.inflight.get(key, (None,))[0] is future:
+                del self.inflight[key]
+
+    async def handle_extract(self, request):
+        path = request.get("path")
+        if not isinstance(path, str) or not path:
+            raise RequestError(400, "'path' is required")
+        samples = request.get("samples", [request["sample"]] if "sample" in request else None)
+        if not isinstance(samples, list) or not samples:
+            raise RequestError(400, "'samples' must be a non-empty list")
+        altime = request.get("altime", 15)
+        proctime = request.get("proctime", 15)
+        for name, value in (("altime", altime), ("proctime", proctime)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise RequestError(400, f"'{name}' must be a number")
+        scan, feedback = await self.extract(path)
+        if scan is None:
+            return 422, {"status": "FAILED", "path": path, "feedback": feedback}
+        rows = scan.ToLIMS(samples, altime, proctime, header=bool(request.get("header", False)))
+        return 200, {"status": "OK", "path": path, "rows": rows, "feedback": feedback}
+
+    async def dispatch(self, method, target, body):
+        if target == "/health":
+            return 200, {"status": "OK", "inflight": len(self.inflight), "served": self.served,
+                         "deduplicated": self.deduplicated, "workers": self.workers, "restarts": self.restarts}
+        if target != "/extract":
+            raise RequestError(404, f"unknown endpoint {target}")
+        if method != "POST":
+            raise RequestError(405, "use POST")
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise RequestError(400, "body is not valid JSON")
+        if not isinstance(request, dict):
+            raise RequestError(400, "body must be a JSON object")
+        return await self.handle_extract(request)
+
+    @staticmethod
+    async def _read_head(reader):
+        #(method, target, version, headers) of the next request, None at the end of the connection. A line
+        #longer than the reader's limit (readline raises ValueError) or more than MAX_HEADERS headers raise
+        #RequestError, after which the connection is closed
+        try:
+            line = await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise RequestError(400, "request line too long")
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise RequestError(400, "bad request line")
+        headers = {}
+        for _ in range(MAX_HEADERS + 1):
+            try:
+                header = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                raise RequestError(431, "header line too long")
+            if header in (b"\r\n", b"\n", b""):
+                return method, target, version, headers
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raise RequestError(431, f"more than {MAX_HEADERS} headers")
+
+    async def handle_connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await self._read_head(reader)
+                except RequestError as e:
+                    await self._respond(writer, e.status, {"status": "FAILED", "error": str(e)}, False)
+                    break
+                if head is None:
+                    break
+                method, target, version, headers = head
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"status": "FAILED", "error": "bad Content-Length"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"status": "FAILED", "error": "body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, payload = await self.dispatch(method, target.split("?")[0], body)
+                except RequestError as e:
+                    status, payload = e.status, {"status": "FAILED", "error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"status": "FAILED", "error": f"{type(e).__name__}: {e}"}
+                self.served += 1
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+
+async def Request(path, samples, host: str = "127.0.0.1", port: int = 8765, altime: int = 15,
+                  proctime: int = 15, header: bool = False):
+    """Stub client: POST one extraction request and return (status, response dict)"""
+    body = json.dumps({"path": path, "samples": list(samples), "altime": altime, "proctime": proctime,
+                       "header": header}).encode()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((f"POST /extract HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await reader.readexactly(length))
+    finally:
+        writer.close()
+
+
+async def _serve(args):
+    service = ExtractionService(args.workers, args.max_pending, not args.olefile, args.cache)
+    await service.start(args.host, args.port)
+    print(f"Serving TXRM extraction on http://{args.host}:{service.port} with {service.workers} workers",
+          file=sys.stderr)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    try:
+        await stop.wait()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="asyncio HTTP/JSON service for TXRM parameter extraction")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the service")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    serve.add_argument("--max-pending", type=int, default=1024, help="distinct files queued before 503")
+    serve.add_argument("--cache", nargs="?", const=True, default=None, metavar="PATH",
+                       help="reuse parameters of unchanged files from a cache database")
+    serve.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    request = commands.add_parser("request", help="send one request (stub client)")
+    request.add_argument("path")
+    request.add_argument("--sample", action="append", required=True)
+    request.add_argument("--host", default="127.0.0.1")
+    request.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(_serve(args))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    status, response = asyncio.run(Request(os.path.abspath(args.path), args.sample, args.host, args.port))
+    if status == 200:
+        sys.stdout.write(response["rows"])
+        return 0
+    print(response.get("error") or response.get("feedback"), file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Extraction Statistics
+Optional instrumentation of the parameter extraction hot path. Pass an
+ExtractionStats as Stats to ExtractParams, SampleParams or MakeTable and
+every file extracted is recorded with its per-stage timings, the number of
+streams and stream bytes read, and (with the header-only reader) the bytes
+and read calls that actually hit the file. Without Stats the extraction only
+pays for a few `is None` tests.
+
+Stages:
+    cache   parameter cache lookup and store
+    open    format check and opening the OLE file
+    lookup  resolving the stream paths in the directory
+    read    reading the stream data
+    decode  decoding the scalar and text fields
+    dates   splitting the ImageInfo/Date records
+    format  formatting the LIMS rows (including the Scan Time strptime)
+
+Usage:
+    stats = txrm_stats.ExtractionStats()
+    tp.SampleParams(path, "1000", ReadOnly=True, Stats=stats)
+    print(stats.ToPrometheus())
+    python txrm_cli.py /data/*.txrm --stats -      # Prometheus text on stderr
+"""
+
+import time
+
+STAGES = ("cache", "open", "lookup", "read", "decode", "dates", "format")
+
+# Prometheus metric name -> (FileStats attribute, help text)
+_COUNTERS = {
+    "streams_total": ("streams", "Streams read"),
+    "stream_bytes_total": ("stream_bytes", "Bytes of stream data read"),
+    "file_bytes_read_total": ("file_bytes_read", "Bytes read from the files, including FAT and directory sectors (header-only reader)"),
+    "file_reads_total": ("reads", "Read calls on the files (header-only reader)"),
+    "cache_hits_total": ("cache_hit", "Files served from the parameter cache"),
+}
+
+
+class FileStats:
+    """Timings and counts for one extracted file"""
+    __slots__ = ("path", "stages", "seconds", "streams", "stream_bytes", "file_bytes_read", "reads", "cache_hit", "ok")
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.seconds = 0.0
+        self.streams = 0
+        self.stream_bytes = 0
+        self.file_bytes_read = 0
+        self.reads = 0
+        self.cache_hit = False
+        self.ok = False
+
+    def ToDict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ExtractionStats:
+    """Per-file statistics for every extraction it is passed to, with totals and a Prometheus dump"""
+
+    def __init__(self):
+        self.files = []
+        self.current = None
+        self._started = None
+
+    def begin(self, path):
+        self.current = FileStats(str(path))
+        self.files.append(self.current)
+        self._started = time.perf_counter()
+        return self.current
+
+    def end(self, ok):
+        self.current.seconds = time.perf_counter() - self._started
+        self.current.ok = ok
+
+    def add(self, stage, seconds):
+        #Adds time to a stage of the current (most recently started) file
+        self.current.stages[stage] += seconds
+
+    def count(self, streams, stream_bytes):
+        self.current.streams += streams
+        self.current.stream_bytes += stream_bytes
+
+    def merge(self, other):
+        #Adds the files recorded by another ExtractionStats (e.g. returned from a worker process)
+        self.files.extend(other.files)
+
+    def Summary(self):
+        #Totals over all files: count, failures, seconds per stage and the counters
+        summary = {"files": len(self.files), "failed": sum(not f.ok for f in self.files),
+                   "seconds": sum(f.seconds for f in self.files),
+                   "stages": {stage: sum(f.stages[stage] for f in self.files) for stage in STAGES}}
+        for attribute, _ in _COUNTERS.values():
+            summary[attribute] = sum(int(getattr(f, attribute)) for f in self.files)
+        return summary
+
+    def ToDict(self):
+        return {"summary": self.Summary(), "files": [f.ToDict() for f in self.files]}
+
+    def ToPrometheus(self, prefix: str = "txrm"):
+        #Prometheus text exposition format of the totals
+        summary = self.Summary()
+        lines = [f"# HELP {prefix}_files_total Files extracted, by result",
+                 f"# TYPE {prefix}_files_total counter",
+                 f'{prefix}_files_total{{result="ok"}} {summary["files"] - summary["failed"]}',
+                 f'{prefix}_files_total{{result="failed"}} {summary["failed"]}',
+                 f"# HELP {prefix}_extract_seconds_total Wall time spent extracting",
+                 f"# TYPE {prefix}_extract_seconds_total counter",
+                 f"{prefix}_extract_seconds_total {summary['seconds']:.9f}",
+                 f"# HELP {prefix}_stage_seconds_total Time spent in each extraction stage",
+                 f"# TYPE {prefix}_stage_seconds_total counter"]
+        lines.extend(f'{prefix}_stage_seconds_total{{stage="{stage}"}} {seconds:.9f}'
+                     for stage, seconds in summary["stages"].items())
+        for name, (attribute, help_text) in _COUNTERS.items():
+            lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} counter",
+                      f"{prefix}_{name} {summary[attribute]}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Storage Backends
+A pluggable file layer under the header-only reader for TXRM files on SMB/NFS
+shares or object storage, where every request costs a round-trip.
+
+A backend only has to provide size and read_at(offset, size). BlockReader
+puts a file-like object on top of one: reads are served from fixed-size
+blocks held in an LRU cache. The blocks a read is missing are fetched with
+one backend request per contiguous run, and each request also reads ahead.
+The directory entries, FAT sectors and mini-stream records that the OLE
+reader asks for 128 or 512 bytes at a time therefore come from a handful of
+requests instead of dozens. Large reads (projection images) bypass the
+cache.
+
+LatencyBackend wraps another backend and sleeps on every request, as a
+local stand-in for a slow share when testing or benchmarking.
+
+Usage:
+    storage = txrm_storage.Storage(block_size=256 * 1024, readahead=1)
+    scan, feedback = TXRMParams.ExtractParams(path, ReadOnly=True, Storage=storage)
+    slow = txrm_storage.Storage(latency=0.02)  # 20 ms per request stand-in
+"""
+
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalBackend:
+    """A local (or OS-mounted network) file, read with positioned reads"""
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self.fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self.size = os.fstat(self.fd).st_size
+        self.requests = 0
+        self.bytes = 0
+
+    def read_at(self, offset, size):
+        self.requests += 1
+        if hasattr(os, "pread"):
+            data = os.pread(self.fd, size, offset)
+        else:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            data = os.read(self.fd, size)
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class FileObjectBackend:
+    """Any seekable binary file object, e.g. one opened by an SMB or object-storage client library"""
+
+    def __init__(self, fileobj, size=None):
+        self.fileobj = fileobj
+        if size is None:
+            size = fileobj.seek(0, io.SEEK_END)
+        self.size = size
+        self.requests = 0
+        self.bytes = 0
+
+    def read_at(self, offset, size):
+        self.requests += 1
+        self.fileobj.seek(offset)
+        data = self.fileobj.read(size)
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+class LatencyBackend:
+    """Stand-in for slow storage: adds latency seconds (plus size / bandwidth) to every request"""
+
+    def __init__(self, inner, latency: float = 0.02, bandwidth: float = None):
+        self.inner = inner
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.size = inner.size
+
+    @property
+    def requests(self):
+        return self.inner.requests
+
+    @property
+    def bytes(self):
+        return self.inner.bytes
+
+    def read_at(self, offset, size):
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0)
+        if delay > 0:
+            time.sleep(delay)
+        return self.inner.read_at(offset, size)
+
+    def close(self):
+        self.inner.close()
+
+
+class BlockReader(io.RawIOBase):
+    """Seekable read-only file over a backend with an LRU block cache, run coalescing and read-ahead
+
+    A read that misses fetches the missing blocks as one request per contiguous
+    run, extended by readahead blocks past the last one. Reads of at least
+    bypass bytes go straight to the backend in one request.
+    """
+
+    def __init__(self, backend, block_size: int = 64 * 1024, cache_blocks: int = 256, readahead: int = 1,
+                 bypass: int = None):
+        super().__init__()
+        self.backend = backend
+        self.size = backend.size
+        self.block_size = block_size
+        self.cache_blocks = max(1, cache_blocks)
+        self.readahead = max(0, readahead)
+        self.bypass = bypass if bypass is not None else block_size * max(4, self.cache_blocks // 4)
+        self.blocks = OrderedDict()
+        self.pos = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        elif whence == io.SEEK_END:
+            self.pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence {whence}")
+        return self.pos
+
+    def close(self):
+        if not self.closed:
+            self.blocks.clear()
+            self.backend.close()
+        super().close()
+
+    def _fetch(self, first, last):
+        # Reads blocks first..last (inclusive) that are not cached, one request per contiguous run
+        missing = [index for index in range(first, last + 1) if index not in self.blocks]
+        if not missing:
+            self.hits += 1
+            return
+        self.misses += 1
+        end_block = (self.size - 1) // self.block_size
+        runs = []
+        for index in missing:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        runs[-1][1] = min(end_block, runs[-1][1] + self.readahead)
+        for start, stop in runs:
+            offset = start * self.block_size
+            data = self.backend.read_at(offset, min(self.size, (stop + 1) * self.block_size) - offset)
+            for k, index in enumerate(range(start, stop + 1)):
+                block = data[k * self.block_size:(k + 1) * self.block_size]
+                if block and index not in self.blocks:
+                    self.blocks[index] = block
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        size = max(0, min(len(view), self.size - self.pos))
+        if size == 0:
+            return 0
+        with self._lock:
+            if size >= self.bypass:
+                data = self.backend.read_at(self.pos, size)
+                view[:len(data)] = data
+                self.pos += len(data)
+                return len(data)
+            first = self.pos // self.block_size
+            last = (self.pos + size - 1) // self.block_size
+            self._fetch(first, last)
+            done = 0
+            for index in range(first, last + 1):
+                block = self.blocks[index]
+                self.blocks.move_to_end(index)
+                start = self.pos + done - index * self.block_size
+                piece = block[start:start + size - done]
+                view[done:done + len(piece)] = piece
+                done += len(piece)
+            # Evict only after copying, so a read spanning more blocks than the cache holds still succeeds
+            while len(self.blocks) > self.cache_blocks:
+                self.blocks.popitem(last=False)
+            self.pos += done
+            return done
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        buffer = bytearray(max(0, min(size, self.size - self.pos)))
+        n = self.readinto(buffer)
+        return bytes(buffer[:n])
+
+
+class Storage:
+    """Opens TXRM files through a backend and a BlockReader (see ExtractParams(..., Storage=))
+
+    backend is a callable taking a path and returning a backend (LocalBackend by default); latency wraps
+    it in a LatencyBackend.
+    """
+
+    def __init__(self, backend=LocalBackend, block_size: int = 64 * 1024, cache_blocks: int = 256,
+                 readahead: int = 1, latency: float = 0, bandwidth: float = None):
+        self.backend = backend
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.readahead = readahead
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+    def open(self, path):
+        backend = self.backend(path)
+        if self.latency or self.bandwidth:
+            backend = LatencyBackend(backend, self.latency, self.bandwidth)
+        return BlockReader(backend, self.block_size, self.cache_blocks, self.readahead)
+
+    def exists(self, path):
+        #Whether path can be opened: a backend factory with an exists() function decides, otherwise the
+        #local file system
+        check = getattr(self.backend, "exists", None)
+        return check(path) if check is not None else os.path.isfile(path)
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Integrity Verification
+Checks that a .txrm is complete before its parameters are trusted, without
+reading any pixel data. VerifyFile checks the following:
+    header      the compound file header and the FAT sector locations
+    directory   every directory entry is reachable exactly once
+    chains      every stream's sector chain has exactly the stream's length,
+                lies inside the file (or ministream) and shares no sector
+                with another stream or the FAT
+    projections every ImageData stream up to NoOfImages exists and holds
+                ImageWidth x ImageHeight pixels of the DataType
+Only the header, FAT, MiniFAT and directory sectors are read.
+
+Every file also gets a cheap fingerprint: a BLAKE2b hash of its size and of
+its first and last 64 kB. With Hash, the whole file is hashed as well, read
+sequentially in large chunks. Files are verified on a thread pool, because
+hashing and file reads release the GIL.
+
+A Manifest (SQLite, like the txrm_watch index) records each file's size,
+mtime, fingerprint, hash and result. Re-verification only touches files
+whose size or mtime changed, or whose fingerprint changed with --fingerprint.
+
+Usage:
+    python txrm_verify.py verify /data/archive --manifest archive.sqlite [--hash sha256] [-j 8]
+    python txrm_verify.py report --manifest archive.sqlite [--failed]
+    result, feedback = TXRMParams.VerifyParams(path)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import txrm_batch
+import txrm_ole
+from txrm_projections import ImageLayout, ImagePath
+
+CHUNK = 8 * 1024 * 1024     # read size for whole-file hashes
+FINGERPRINT_BYTES = 64 * 1024
+
+STATUS_OK = "OK"
+STATUS_FAILED = "FAILED"
+
+
+def Fingerprint(strFile: str):
+    #BLAKE2b (16 bytes, hex) of the file size and its first and last FINGERPRINT_BYTES: two reads, enough to
+    #notice files that were rewritten, truncated or appended to even when their mtime was kept
+    digest = hashlib.blake2b(digest_size=16)
+    with open(strFile, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(size.to_bytes(8, "little"))
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def HashFile(strFile: str, algorithm: str = "sha256", chunk: int = CHUNK):
+    #Hex digest of the whole file, read sequentially in chunk-sized pieces into one reused buffer
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(chunk)
+    view = memoryview(buffer)
+    with open(strFile, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _CheckProjections(ole, problems):
+    #ImageData streams against the ImageInfo geometry; returns the number of projections checked
+    try:
+        count, height, width, dtype = ImageLayout(ole)
+    except txrm_ole.OleFormatError as e:
+        problems.append(f"projections: {e}")
+        return 0
+    pixels = width * height
+    itemsize = dtype.itemsize
+    missing = []
+    wrong = []
+    for index in range(count):
+        entry = ole.find(ImagePath(index))
+        if entry is None or entry.type != txrm_ole.STGTY_STREAM:
+            missing.append(index + 1)
+            continue
+        if entry.size != pixels * itemsize:
+            wrong.append((index + 1, entry.size))
+    if missing:
+        problems.append(f"projections: {len(missing)} of {count} images missing ({_Shown(missing)})")
+    if wrong:
+        problems.append(f"projections: {len(wrong)} of {count} images do not hold {pixels * itemsize} bytes "
+                        f"({_Shown([f'{index}: {size}' for index, size in wrong])})")
+    return count
+
+
+def _Shown(items, limit: int = 5):
+    return ", ".join(str(item) for item in items[:limit]) + (", ..." if len(items) > limit else "")
+
+
+def VerifyStructure(ole):
+    #Structural checks of an open txrm_ole.LazyOleFile (see the module docstring). Returns a list of
+    #problems, empty if the file is intact, and the number of projections checked
+    problems = []
+    try:
+        fat = ole.fat_sector_locations()
+    except txrm_ole.OleFormatError as e:
+        return [f"header: {e}"], 0
+    sectors = None if ole.file_size is None else (ole.file_size - ole.sector_size) // ole.sector_size
+    if sectors is not None and any(sid >= sectors for sid in fat):
+        problems.append("header: FAT sectors beyond the end of the file (truncated?)")
+        return problems, 0
+
+    owner = dict.fromkeys(fat, "FAT")
+    mini_owner = {}
+    try:
+        for name, start in (("directory", ole.first_dir_sector), ("MiniFAT", ole.first_minifat_sector)):
+            for sid in ole.chain_sectors(start):
+                if owner.setdefault(sid, name) != name:
+                    problems.append(f"chains: {name} shares sector {sid} with {owner[sid]}")
+                    break
+        entries = list(ole.walk())
+    except txrm_ole.OleFormatError as e:
+        return problems + [f"directory: {e}"], 0
+    try:
+        # The ministream itself is a regular chain owned by the root entry
+        for sid in ole.stream_sectors(ole.root) if ole.root.size else []:
+            if owner.setdefault(sid, "ministream") != "ministream":
+                problems.append(f"chains: ministream shares sector {sid} with {owner[sid]}")
+                break
+    except txrm_ole.OleFormatError as e:
+        problems.append(f"chains: ministream: {e}")
+    for path, entry in entries:
+        if entry.type != txrm_ole.STGTY_STREAM:
+            continue
+        try:
+            sids = ole.stream_sectors(entry)
+        except txrm_ole.OleFormatError as e:
+            problems.append(f"chains: {path}: {e}")
+            continue
+        table = mini_owner if ole.is_mini(entry) else owner
+        for sid in sids:
+            other = table.setdefault(sid, path)
+            if other != path:
+                problems.append(f"chains: {path} shares sector {sid} with {other}")
+                break
+    count = _CheckProjections(ole, problems)
+    return problems, count
+
+
+def VerifyFile(strFile: str, Hash: str = None):
+    #Verifies one file: structure (see VerifyStructure), fingerprint and, if Hash names a hashlib algorithm,
+    #the whole-file digest. Returns a dict with path, size, mtime_ns, fingerprint, hash, algorithm, status,
+    #problems, projections, bytes_read (by the structure checks) and seconds
+    start = time.perf_counter()
+    result = {"path": strFile, "size": None, "mtime_ns": None, "fingerprint": None, "algorithm": Hash,
+              "hash": None, "status": STATUS_FAILED, "problems": [], "projections": 0, "bytes_read": 0}
+    try:
+        st = os.stat(strFile)
+        result["size"], result["mtime_ns"] = st.st_size, st.st_mtime_ns
+        result["fingerprint"] = Fingerprint(strFile)
+        try:
+            ole = txrm_ole.LazyOleFile(strFile)
+        except ValueError as e:
+            result["problems"].append(f"header: {e}")
+        else:
+            with ole:
+                result["problems"], result["projections"] = VerifyStructure(ole)
+                result["bytes_read"] = ole.bytes_read
+        if Hash:
+            result["hash"] = HashFile(strFile, Hash)
+    except (OSError, ValueError) as e:
+        result["problems"].append(f"{type(e).__name__}: {e}")
+    if not result["problems"]:
+        result["status"] = STATUS_OK
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def Feedback(result):
+    #SampleParams-style summary of a VerifyFile result
+    lines = [f"Status: {result['status']}", f"Projections checked: {result['projections']}",
+             f"Fingerprint: {result['fingerprint']}"]
+    if result["hash"]:
+        lines.append(f"{result['algorithm']}: {result['hash']}")
+    lines.extend(result["problems"])
+    lines.append(f"Bytes read: {result['bytes_read']}")
+    return "\n" + "\n".join(lines)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verified (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    fingerprint TEXT,
+    algorithm TEXT,
+    hash TEXT,
+    status TEXT NOT NULL,
+    problems TEXT NOT NULL,
+    verified_at REAL NOT NULL
+);
+"""
+
+
+class Manifest:
+    """SQLite record of the verification result of every file, keyed on path"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def get(self, path):
+        row = self.db.execute("SELECT size, mtime_ns, fingerprint, algorithm, hash, status, problems FROM verified "
+                              "WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        keys = ("size", "mtime_ns", "fingerprint", "algorithm", "hash", "status", "problems")
+        record = dict(zip(keys, row), path=path)
+        record["problems"] = json.loads(record["problems"])
+        return record
+
+    def record(self, result):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO verified VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (result["path"], result["size"], result["mtime_ns"], result["fingerprint"],
+                             result["algorithm"], result["hash"], result["status"], json.dumps(result["problems"]),
+                             time.time()))
+
+    def forget(self, paths):
+        with self.db:
+            self.db.executemany("DELETE FROM verified WHERE path = ?", [(path,) for path in paths])
+
+    def paths(self):
+        return [path for (path,) in self.db.execute("SELECT path FROM verified ORDER BY path")]
+
+    def records(self, failed_only: bool = False):
+        query = "SELECT path FROM verified" + (" WHERE status != 'OK'" if failed_only else "") + " ORDER BY path"
+        return [self.get(path) for (path,) in self.db.execute(query).fetchall()]
+
+    def IsCurrent(self, path, Hash: str = None, CheckFingerprint: bool = False):
+        #True if path is recorded with its current size and mtime (and fingerprint, with CheckFingerprint)
+        #and, if Hash is wanted, was hashed with that algorithm
+        record = self.get(path)
+        if record is None or (Hash and record["algorithm"] != Hash):
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != (record["size"], record["mtime_ns"]):
+            return False
+        return not CheckFingerprint or Fingerprint(path) == record["fingerprint"]
+
+
+def VerifyFiles(files, manifest=None, Hash: str = None, Workers: int = None, CheckFingerprint: bool = False,
+                progress=None):
+    #Verifies files on a thread pool, skipping those the Manifest records as current, and records the
+    #results. Returns (verified, skipped, failed). progress(result) is called for each file verified
+    files = [os.path.abspath(path) for path in files]
+    todo = [path for path in files if manifest is None or not manifest.IsCurrent(path, Hash, CheckFingerprint)]
+    verified = failed = 0
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(Workers or os.cpu_count() or 1, len(todo))) as pool:
+            for result in pool.map(lambda path: VerifyFile(path, Hash), todo):
+                verified += 1
+                failed += result["status"] != STATUS_OK
+                if manifest is not None:
+                    manifest.record(result)
+                if progress is not None:
+                    progress(result)
+    return verified, len(files) - len(todo), failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify the structure of .txrm files and record them in a manifest")
+    sub = parser.add_subparsers(dest="command", required=True)
+    verify = sub.add_parser("verify", help="verify new and changed files")
+    verify.add_argument("roots", nargs="+", help=".txrm files or folders to search")
+    verify.add_argument("--manifest", default=None, help="SQLite manifest (without one every file is verified)")
+    verify.add_argument("--hash", default=None, choices=sorted(hashlib.algorithms_guaranteed),
+                        help="also hash each whole file")
+    verify.add_argument("--fingerprint", action="store_true",
+                        help="re-verify files whose fingerprint changed even if size and mtime did not")
+    verify.add_argument("--prune", action="store_true", help="drop manifest entries of files that no longer exist")
+    verify.add_argument("-j", "--workers", type=int, default=None, help="threads (default: all cores)")
+    verify.add_argument("-v", "--verbose", action="store_true", help="print every file, not only failures")
+    report = sub.add_parser("report", help="print the manifest")
+    report.add_argument("--manifest", required=True)
+    report.add_argument("--failed", action="store_true", help="only files that failed")
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        manifest = Manifest(args.manifest)
+        try:
+            for record in manifest.records(args.failed):
+                print("\t".join([record["status"], record["path"], record["hash"] or record["fingerprint"] or ""]
+                                + record["problems"]))
+        except BrokenPipeError:
+            pass
+        finally:
+            manifest.close()
+        return 0
+
+    manifest = Manifest(args.manifest) if args.manifest else None
+
+    def show(result):
+        if args.verbose or result["status"] != STATUS_OK:
+            print(f"{result['status']}\t{result['path']}\t" + "; ".join(result["problems"]), file=sys.stderr)
+
+    try:
+        files = list(txrm_batch.FindTXRMFiles(args.roots))
+        if manifest is not None and args.prune:
+            found = {os.path.abspath(path) for path in files}
+            manifest.forget([path for path in manifest.paths() if path not in found and not os.path.exists(path)])
+        verified, skipped, failed = VerifyFiles(files, manifest, args.hash, args.workers, args.fingerprint, show)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    print(f"Verified {verified} files ({skipped} unchanged), {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
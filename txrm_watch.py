@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+TXRM Acquisition Watcher
+Watches acquisition folders for new .txrm files, extracts their parameters
+in a worker pool as soon as they are complete and appends the rows to a
+rolling (one file per day) LIMS CSV in the txrm_batch format.
+
+The tree is listed once at start-up. After that each poll only stats the
+known directories and lists the ones whose mtime changed, so the cost of a
+poll grows with the number of directories, not files. A new file counts as
+complete once its size and mtime have not changed for --settle seconds and
+its OLE header can be read. Processed files are recorded with their size
+and mtime in an SQLite index next to the output, so restarts do not extract
+anything twice, while a file rewritten at the same path is extracted again.
+Relisting a directory stats only new files and indexed files whose inode
+changed (a rename over them), using the inode the listing already returns.
+A rewrite in place touches neither the directory mtime nor the inode, so
+every --rescan seconds (default one hour) all directories are listed and
+every known file is stat'ed and compared with the index. A settled file
+whose header cannot be read is set aside until its size or mtime changes.
+Folders that cannot be listed are reported and skipped.
+
+Usage:
+    python txrm_watch.py ROOT [ROOT ...] --output-dir /lims/incoming --start 1000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+
+import txrm_batch
+import txrm_ole
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sample INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    processed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class WatchIndex:
+    """SQLite record of the files already extracted and the next sample ID"""
+
+    def __init__(self, path, start_sample: int = 0):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'next_sample'").fetchone()
+        self.next_sample = int(row[0]) if row else start_sample
+        self.known = {path: (size, mtime_ns) for path, size, mtime_ns
+                      in self.db.execute("SELECT path, size, mtime_ns FROM processed")}
+
+    def __contains__(self, path):
+        return path in self.known
+
+    def is_current(self, path, size, mtime_ns):
+        #True if path was processed with this size and mtime (a rewritten file is not current)
+        return self.known.get(path) == (size, mtime_ns)
+
+    def claim_sample(self):
+        sample = self.next_sample
+        self.next_sample += 1
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('next_sample', ?)", (str(self.next_sample),))
+        return sample
+
+    def record(self, path, size, mtime_ns, sample, status):
+        self.known[path] = (size, mtime_ns)
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?)",
+                            (path, size, mtime_ns, sample, status, time.time()))
+
+    def close(self):
+        self.db.close()
+
+
+def IsReadable(path):
+    #True if the file has a valid compound file header and directory root
+    try:
+        with txrm_ole.LazyOleFile(path) as ole:
+            return ole.root.type == txrm_ole.STGTY_ROOT
+    except (OSError, ValueError):
+        return False
+
+
+class Watcher:
+    """Incremental scanner, completion detector and extraction pool"""
+
+    def __init__(self, roots, output_dir, index_path=None, StartSample: int = 0, Altime: int = 15,
+                 Proctime: int = 15, Workers: int = None, settle: float = 5.0, prefix: str = "txrm_params",
+                 ReadOnly: bool = True, Cache=None, rescan: float = 3600.0):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.index = WatchIndex(index_path or os.path.join(output_dir, prefix + "_index.sqlite"), StartSample)
+        self.Altime = Altime
+        self.Proctime = Proctime
+        self.ReadOnly = ReadOnly
+        self.Cache = Cache
+        self.settle = settle
+        self.rescan = rescan
+        self.last_rescan = time.monotonic()
+        self.prefix = prefix
+        self.pool = ProcessPoolExecutor(max_workers=Workers or os.cpu_count() or 1)
+        self.dirs = {}        # directory -> mtime_ns when last listed
+        self.inodes = {}      # path -> inode of the .txrm files when last listed
+        self.errors = {}      # directory -> last error reported for it
+        self.pending = {}     # path -> (size, mtime_ns, time the size was last seen to change)
+        self.running = {}     # future -> (path, size, mtime_ns, sample)
+        self.inflight = set() # paths of the running extractions
+        self.unreadable = {}  # path -> (size, mtime_ns) of settled files whose header could not be read
+        self.written = 0
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        self.index.close()
+
+    # ----- discovery -----
+
+    def _report(self, directory, error):
+        #Prints a listing error once, not on every poll
+        message = f"{type(error).__name__}: {error}"
+        if self.errors.get(directory) != message:
+            self.errors[directory] = message
+            print(f"{directory}: cannot list: {message}", file=sys.stderr)
+
+    def _list(self, directory, verify: bool = False):
+        #Lists one directory (and new subdirectories). Indexed files are only stat'ed when their inode
+        #changed since the last listing or with verify
+        try:
+            # The mtime is taken before listing: a file created during the listing changes it again, so the
+            # directory is listed once more on the next poll instead of the file being missed
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            self.dirs.pop(directory, None)
+            return
+        except OSError as e:
+            self._report(directory, e)
+            return
+        self.dirs[directory] = mtime
+        try:
+            with os.scandir(directory) as listing:
+                entries = list(listing)
+        except FileNotFoundError:
+            self.dirs.pop(directory, None)
+            return
+        except OSError as e:
+            # e.g. a folder the watcher may not read; it is tried again when its mtime changes or on a rescan
+            self._report(directory, e)
+            return
+        self.errors.pop(directory, None)
+        for entry in entries:
+            path = entry.path
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if path not in self.dirs:
+                        self._list(path, verify)
+                    continue
+                if not entry.name.lower().endswith(".txrm") or path in self.pending or path in self.inflight \
+                        or path in self.unreadable:
+                    continue
+                inode = entry.inode()
+                if path in self.index:
+                    if not verify and self.inodes.get(path) == inode:
+                        continue
+                    st = entry.stat()
+                    self.inodes[path] = inode
+                    if self.index.is_current(path, st.st_size, st.st_mtime_ns):
+                        continue
+                self.inodes[path] = inode
+                self.pending[path] = (-1, -1, time.monotonic())
+            except FileNotFoundError:
+                # Deleted while the directory was being listed
+                self.inodes.pop(path, None)
+                continue
+
+    def scan(self, full: bool = False):
+        #Lists new directories and those whose mtime changed since they were last listed. With full, and
+        #every rescan seconds, all of them, and every known file is compared with the index, so files
+        #rewritten in place are found too
+        for root in self.roots:
+            if root not in self.dirs:
+                self._list(root)
+        if self.rescan and time.monotonic() - self.last_rescan >= self.rescan:
+            full = True
+        if full:
+            self.last_rescan = time.monotonic()
+        for directory, mtime in list(self.dirs.items()):
+            try:
+                if full or os.stat(directory).st_mtime_ns != mtime:
+                    self._list(directory, full)
+            except FileNotFoundError:
+                self.dirs.pop(directory, None)
+            except OSError as e:
+                self._report(directory, e)
+
+    def ready(self, force: bool = False):
+        #Pending files whose size and mtime have been stable for settle seconds and whose header is readable
+        #(with force, stable files are returned even if the header cannot be read). A stable file with an
+        #unreadable header is set aside in unreadable and only checked again once its size or mtime changes
+        now = time.monotonic()
+        for path, seen in list(self.unreadable.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self.unreadable[path]
+                continue
+            if force or (st.st_size, st.st_mtime_ns) != seen:
+                del self.unreadable[path]
+                self.pending[path] = (-1, -1, now)
+        complete = []
+        for path, (size, mtime, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                if force or IsReadable(path):
+                    complete.append((path, st.st_size, st.st_mtime_ns))
+                else:
+                    self.unreadable[path] = (st.st_size, st.st_mtime_ns)
+                    print(f"{path}: FAILED: OLE header not readable; waiting for the file to change", file=sys.stderr)
+        return complete
+
+    # ----- extraction and output -----
+
+    def output_path(self, day=None):
+        return os.path.join(self.output_dir, f"{self.prefix}_{(day or date.today()).isoformat()}.csv")
+
+    def _append(self, text):
+        path = self.output_path()
+        new = not os.path.exists(path)
+        with open(path, "a", newline="") as out:
+            if new:
+                out.write(txrm_batch.HEADER)
+            out.write(text)
+
+    def submit(self, path, size, mtime_ns):
+        sample = self.index.claim_sample()
+        job = (path, sample, self.Altime, self.Proctime, self.ReadOnly, self.Cache)
+        self.running[self.pool.submit(txrm_batch.ExtractFile, job)] = (path, size, mtime_ns, sample)
+        self.inflight.add(path)
+
+    def collect(self, timeout: float = 0):
+        #Writes the rows of finished extractions; returns the number of files finished
+        if not self.running:
+            return 0
+        done, _ = wait(list(self.running), timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, size, mtime_ns, sample = self.running.pop(future)
+            self.inflight.discard(path)
+            try:
+                path, sample, rows, status = future.result()
+            except Exception as e:
+                rows, status = None, f"ERROR: {type(e).__name__}: {e}"
+            self._append(txrm_batch.FormatRows(path, sample, rows, status))
+            self.index.record(path, size, mtime_ns, sample, status)
+            self.written += 1
+            if status != txrm_batch.STATUS_OK:
+                print(f"{path}: {status}", file=sys.stderr)
+        return len(done)
+
+    def poll(self, force: bool = False):
+        #One watch cycle: discover, submit completed files, write finished rows
+        self.scan()
+        for path, size, mtime_ns in self.ready(force):
+            self.submit(path, size, mtime_ns)
+        return self.collect()
+
+    def run(self, interval: float = 2.0, once: bool = False):
+        #Polls until interrupted. With once, processes the files present now (after they settle) and
+        #returns; stable files with an unreadable header are then extracted anyway so they are reported
+        try:
+            while True:
+                started = time.monotonic()
+                self.poll(force=once)
+                if once and not self.pending and not self.running and not self.unreadable:
+                    return self.written
+                remaining = interval - (time.monotonic() - started)
+                if self.running:
+                    self.collect(timeout=max(0.0, remaining))
+                elif remaining > 0:
+                    time.sleep(remaining)
+        except KeyboardInterrupt:
+            while self.running:
+                self.collect(timeout=None)
+            return self.written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch acquisition folders and extract parameters from new .txrm files")
+    parser.add_argument("roots", nargs="+", help="folders to watch")
+    parser.add_argument("-o", "--output-dir", required=True, help="folder for the rolling CSVs and the index")
+    parser.add_argument("--prefix", default="txrm_params", help="CSV and index file name prefix")
+    parser.add_argument("--start", type=int, default=0, help="first sample ID (the index remembers the next one)")
+    parser.add_argument("--altime", type=int, default=15, help="alignment time")
+    parser.add_argument("--proctime", type=int, default=15, help="processing time")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds a file must be unchanged to count as complete")
+    parser.add_argument("--rescan", type=float, default=3600.0,
+                        help="seconds between full listings that stat every file to catch rewrites in place (0: never)")
+    parser.add_argument("--once", action="store_true", help="process the files that are complete now and exit")
+    parser.add_argument("--olefile", action="store_true", help="parse with olefile instead of the header-only reader")
+    args = parser.parse_args(argv)
+
+    watcher = Watcher(args.roots, args.output_dir, None, args.start, args.altime, args.proctime, args.workers,
+                      args.settle, args.prefix, not args.olefile, rescan=args.rescan)
+    try:
+        written = watcher.run(args.interval, args.once)
+    finally:
+        watcher.close()
+    print(f"Wrote rows for {written} files", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())